@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'JaiKorn.settings')
+# endpoint อ่านอย่างเดียวใช้ async view (ดู JaiKorn.async_views) ปิดได้ด้วย ASYNC_READ_VIEWS=False
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -0,0 +1,84 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework import exceptions
+from rest_framework.views import APIView
+
+from .db import release_connections
+
+# DRF ยังไม่มี async view: AsyncAPIView ทำ dispatch ของ APIView แบบ async
+# ใช้กับ endpoint อ่านอย่างเดียว โดยวางไว้หน้า view sync เดิม (ใช้ queryset / serializer / permission ร่วมกัน)
+# แล้วเขียน handler เป็น async def ที่อ่านผ่าน async ORM เช่น
+#     class AsyncCreditSummaryView(AsyncAPIView, CreditSummaryView):
+#         async def get(self, request, *args, **kwargs): ...
+# ภายใต้ ASGI request ไม่ถือ thread และ connection ระหว่างส่ง response ให้ client, ภายใต้ WSGI Django จะรันผ่าน async_to_sync (ช้ากว่า view sync)
+
+
+def read_view(sync_view, async_view):
+    # ASYNC_READ_VIEWS=True (ค่าเริ่มต้นเมื่อรันผ่าน JaiKorn.asgi) ใช้ view แบบ async
+    return (async_view if settings.ASYNC_READ_VIEWS else sync_view).as_view()
+
+
+class AsyncAPIView(APIView):
+
+    async def dispatch(self, request, *args, **kwargs):
+        # เหมือน APIView.dispatch แต่ await authentication และ handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.ainitial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            # options() / http_method_not_allowed() ของ DRF เป็น sync และไม่แตะ DB
+            if hasattr(response, '__await__'):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        # อ่านเสร็จแล้วคืน connection เลย ไม่ต้องรอ request_finished หลังส่ง response
+        await sync_to_async(release_connections)()
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def ainitial(self, request, *args, **kwargs):
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        neg = self.perform_content_negotiation(request)
+        request.accepted_renderer, request.accepted_media_type = neg
+
+        version, scheme = self.determine_version(request, *args, **kwargs)
+        request.version, request.versioning_scheme = version, scheme
+
+        await self.aperform_authentication(request)
+        self.check_permissions(request)
+        self.check_throttles(request)
+
+    async def aperform_authentication(self, request):
+        # เหมือน Request._authenticate() ของ DRF, authenticator ที่ไม่มี aauthenticate() จะรันใน thread
+        for authenticator in request.authenticators:
+            aauthenticate = getattr(authenticator, 'aauthenticate', None)
+            try:
+                if aauthenticate is not None:
+                    user_auth_tuple = await aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
@@ -0,0 +1,98 @@
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+# field ของ user ที่ view / permission ใช้หลัง authenticate ที่เหลือเป็น deferred field (แตะเมื่อไหร่ค่อยโหลดจาก DB)
+AUTH_USER_FIELDS = ('username', 'email', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _cache():
+    # LocMemCache ใน process: อ่านได้โดยไม่ผ่าน network จึงเรียกตรงจาก async view ได้
+    return caches['jwt-users']
+
+
+def _key(user_id) -> str:
+    return f'jwt-user:{user_id}'
+
+
+def forget_user(user_id) -> None:
+    _cache().delete(_key(user_id))
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    # JWTAuthentication ของ simplejwt + aauthenticate() ให้ async view (JaiKorn.async_views) โหลด user ผ่าน async ORM
+    # user ที่ได้เป็น instance จริงของ AUTH_USER_MODEL ที่มีเฉพาะ AUTH_USER_FIELDS สร้างจาก cache (JWT_USER_CACHE_SECONDS)
+    # request ส่วนใหญ่จึงไม่ query user เลย, users.signals ล้าง cache เมื่อ user ถูกบันทึก (ปิด user / เปลี่ยน password)
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+
+        return await self.aget_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        entry = _cache().get(_key(user_id))
+        if entry is None:
+            try:
+                entry = self.user_model.objects.values_list(*AUTH_USER_FIELDS, 'password').get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            entry = self._remember(user_id, entry)
+        return self._build_user(user_id, entry, validated_token)
+
+    async def aget_user(self, validated_token):
+        user_id = self._user_id(validated_token)
+        entry = _cache().get(_key(user_id))
+        if entry is None:
+            try:
+                entry = await self.user_model.objects.values_list(*AUTH_USER_FIELDS, 'password').aget(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            entry = self._remember(user_id, entry)
+        return self._build_user(user_id, entry, validated_token)
+
+    def _user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+    def _remember(self, user_id, row: tuple) -> tuple:
+        # เก็บ hash ของ password (แบบเดียวกับ claim ใน token) ไม่เก็บ password hash ตัวจริง
+        *values, password = row
+        entry = (*values, get_md5_hash_password(password))
+        _cache().set(_key(user_id), entry)
+        return entry
+
+    def _build_user(self, user_id, entry: tuple, validated_token):
+        *values, password_hash = entry
+        loaded = dict(zip(AUTH_USER_FIELDS, values))
+        loaded[api_settings.USER_ID_FIELD] = self.user_model._meta.get_field(api_settings.USER_ID_FIELD).to_python(user_id)
+        # from_db รับค่าตามลำดับ field ของ model
+        names = [f.attname for f in self.user_model._meta.concrete_fields if f.attname in loaded]
+        user = self.user_model.from_db(DEFAULT_DB_ALIAS, names, [loaded[name] for name in names])
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,12 @@
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def shared_cache(alias: str):
+    # cache ที่ทุก worker / process เห็นค่าเดียวกัน (redis, memcached, database) หรือ None ถ้าเป็น locmem / dummy
+    # cache ที่ต้อง invalidate ข้าม process (me/summary, catalog snapshot) ใช้ locmem ไม่ได้: process อื่นจะเสิร์ฟค่าเก่าจนหมดอายุ
+    cache = caches[alias]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return None
+    return cache
@@ -0,0 +1,184 @@
+import contextvars
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+from JaiKorn.cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# อ่านจาก read replica (DB_REPLICA_HOSTS) เฉพาะใน request GET/HEAD/OPTIONS
+# user ที่เพิ่งเขียน (POST/PUT/PATCH/DELETE) อ่านจาก primary ต่อไปอีก DB_REPLICA_STICKY_SECONDS วินาที (read-your-writes)
+# replica ที่ lag เกิน DB_REPLICA_MAX_LAG_SECONDS หรือวัดไม่ได้จะไม่ถูกใช้ งานนอก request (command, shell) ใช้ primary เสมอ
+# pin ของ user ที่เพิ่งเขียนต้องอยู่ใน cache ที่ทุก process เห็น (DB_REPLICA_PIN_CACHE) ไม่อย่างนั้น ReplicaMiddleware ไม่ยอม start
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+_current_request = contextvars.ContextVar('db_request', default=None)
+
+# alias -> (เวลาที่วัด (monotonic), lag เป็นวินาที / None ถ้าวัดไม่ได้) ต่อ process
+_lag = {}
+
+
+def replica_lag(alias: str) -> float | None:
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except DatabaseError:
+        logger.warning('Cannot measure lag of replica %s', alias, exc_info=True)
+        return None
+    return None if lag is None else float(lag)
+
+
+def record_replica_lag(alias: str, lag: float | None) -> None:
+    _lag[alias] = (time.monotonic(), lag)
+    # metric: ส่งเข้า log aggregator (เช่น filter บรรทัด db.replica_lag) ไปทำ dashboard / alert
+    logger.info('db.replica_lag alias=%s seconds=%s', alias, 'nan' if lag is None else f'{lag:.3f}')
+
+
+def healthy_replicas() -> list[str]:
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        checked_at, lag = _lag.get(alias, (None, None))
+        if checked_at is None or now - checked_at >= settings.DB_REPLICA_LAG_CHECK_SECONDS:
+            lag = replica_lag(alias)
+            record_replica_lag(alias, lag)
+        if lag is not None and lag <= settings.DB_REPLICA_MAX_LAG_SECONDS:
+            healthy.append(alias)
+    return healthy
+
+
+def _pin_key(user_id) -> str:
+    return f'db:primary-pin:{user_id}'
+
+
+def _pin_cache():
+    return shared_cache(settings.DB_REPLICA_PIN_CACHE)
+
+
+def pin_to_primary(user_id) -> None:
+    _pin_cache().set(_pin_key(user_id), True, settings.DB_REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user_id) -> bool:
+    return _pin_cache().get(_pin_key(user_id)) is not None
+
+
+def _known_user_id(request):
+    # ห้ามประเมิน request.user ที่ยังเป็น lazy object (การโหลด user จะวนกลับมาที่ router)
+    # JWT ของ DRF ตั้ง request.user ให้หลัง authenticate แล้ว
+    user = request.__dict__.get('user')
+    if user is None or (isinstance(user, SimpleLazyObject) and user._wrapped is empty):
+        return None
+    return user.pk if user.is_authenticated else None
+
+
+def _route(request) -> str:
+    if request.method not in SAFE_METHODS:
+        return DEFAULT_DB_ALIAS
+
+    user_id = _known_user_id(request)
+    decided = getattr(request, '_db_route', None)
+    if decided is not None and decided[0] == user_id:
+        return decided[1]
+
+    if user_id is not None and is_pinned(user_id):
+        alias = DEFAULT_DB_ALIAS
+    else:
+        alias = random.choice(healthy_replicas() or [DEFAULT_DB_ALIAS])
+    request._db_route = (user_id, alias)
+    return alias
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        request = _current_request.get()
+        # อยู่ใน transaction ของ primary ต้องอ่านจาก connection เดียวกัน
+        if request is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _route(request)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    # ต้องอยู่หลัง AuthenticationMiddleware
+    # request ถูกเก็บไว้จนถึง request_finished เพื่อให้ StreamingHttpResponse (me/export/) อ่านจาก replica ได้ด้วย
+    # รองรับทั้ง WSGI และ ASGI (contextvar ถูก copy ไปกับ sync_to_async ของ async ORM)
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        # pin ใน locmem มีผลแค่ worker ที่รับ request เขียน: GET ถัดไปที่ไปตก worker อื่นจะอ่านยอดเก่าจาก replica
+        if _pin_cache() is None:
+            raise ImproperlyConfigured(
+                f'DB_REPLICA_HOSTS needs DB_REPLICA_PIN_CACHE ({settings.DB_REPLICA_PIN_CACHE!r}) '
+                'to be a cache shared by every process (e.g. set REDIS_URL)'
+            )
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        _current_request.set(request)
+        response = self.get_response(request)
+        self._pin_writer(request)
+        return response
+
+    async def __acall__(self, request):
+        _current_request.set(request)
+        response = await self.get_response(request)
+        self._pin_writer(request)
+        return response
+
+    def _pin_writer(self, request):
+        if request.method not in SAFE_METHODS:
+            user_id = _known_user_id(request)
+            if user_id is not None:
+                pin_to_primary(user_id)
+
+
+def _forget_request(**kwargs):
+    _current_request.set(None)
+
+
+request_finished.connect(_forget_request)
+
+
+def release_connections() -> None:
+    # คืน connection ตาม CONN_MAX_AGE / DB_POOL เหมือนตอน request_finished แต่เรียกได้ก่อนส่ง response
+    # (async view: ไม่ถือ connection ของ pool ไว้ระหว่างส่ง response ให้ client ที่ช้า)
+    # ต้องเรียกใน thread เดียวกับที่ใช้ connection, ไม่แตะ connection ที่อยู่ใน transaction
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close_if_unusable_or_obsolete()
@@ -0,0 +1,60 @@
+import io
+
+from rest_framework.parsers import JSONParser, get_encoding
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON renderer/parser ที่ใช้ orjson (ถ้าติดตั้งไว้) เลือกใช้ได้จาก REST_FRAMEWORK ใน settings (JSON_BACKEND=orjson)
+# output ต้องเหมือน JSONRenderer ของ DRF (compact, unicode, datetime UTC ลงท้าย Z)
+# กรณีที่ orjson ทำไม่ได้ (indent, ค่าที่ orjson ไม่รู้จัก, int เกิน 64 bit) จะกลับไปใช้ของ DRF
+
+_default = JSONEncoder().default
+
+_OPTIONS = 0 if orjson is None else orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_default, option=_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # เหมือน DRF: escape U+2028 / U+2029 ให้เป็น JavaScript ที่ถูกต้อง
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        if orjson is None or get_encoding(parser_context).lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            # ให้ DRF เป็นคนแจ้ง error (ข้อความเดิม) และรองรับกรณีที่ orjson ไม่รับ เช่น int ใหญ่มาก
+            pass
+
+        return super().parse(io.BytesIO(body), media_type, parser_context)
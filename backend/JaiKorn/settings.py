@@ -5,6 +5,7 @@ Django settings for JaiKorn project.
 from pathlib import Path
 import os
 from datetime import timedelta
+from decimal import Decimal
 from dotenv import load_dotenv
 
 # Base dir & .env
@@ -41,6 +42,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "JaiKorn.db.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -79,11 +81,79 @@ DATABASES = {
         "PASSWORD": os.getenv("DB_PASSWORD", ""),
         "HOST": os.getenv("DB_HOST", "127.0.0.1"),
         "PORT": os.getenv("DB_PORT", "5432"),
-        "CONN_MAX_AGE": 300,      # keep-alive
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "300")),  # keep-alive
+        "CONN_HEALTH_CHECKS": os.getenv("DB_HEALTH_CHECKS", "False").lower() == "true",
         "OPTIONS": DB_OPTIONS,    # sslmode/sslrootcert มาจาก .env
     }
 }
 
+# DB_POOL=True: ใช้ connection pool ของ Django (psycopg 3 + psycopg_pool) แทน connection ค้างต่อ thread
+# ทุก thread ใน process ยืมจาก pool เดียวกันและคืนเมื่อจบ request, DB_HEALTH_CHECKS=True ตรวจ connection ก่อนยืม
+if os.getenv("DB_POOL", "False").lower() == "true":
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DB_OPTIONS["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+        "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+    }
+
+# DB_PREPARED_STATEMENTS=True: connection เดิม (และ pool เดิม) เปิด server-side binding ของ psycopg 3
+# query ที่รันซ้ำครบ DB_PREPARE_THRESHOLD ครั้งบน connection หนึ่งถูก prepare ที่ server (checkout / จ่ายบิลที่รันบ่อย)
+# query ที่รันไม่กี่ครั้งไม่ถูก prepare, ใช้กับ PgBouncer แบบ transaction pooling ไม่ได้
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "False").lower() == "true"
+if DB_PREPARED_STATEMENTS:
+    DB_OPTIONS["server_side_binding"] = True
+    DB_OPTIONS["prepare_threshold"] = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+
+# read replica (ถ้ามี): DB_REPLICA_HOSTS="host1,host2:5433" ใช้ชื่อ DB / user / SSL เดียวกับ primary
+# request GET อ่านจาก replica, user ที่เพิ่งเขียนอ่านจาก primary ต่อ DB_REPLICA_STICKY_SECONDS วินาที (ดู JaiKorn.db)
+# DB_REPLICA_PIN_CACHE ต้องเป็น cache ที่แชร์กันทุก process (REDIS_URL) ถ้าเป็น locmem จะ start ไม่ได้ (ImproperlyConfigured)
+DATABASE_REPLICAS = []
+for i, replica in enumerate(h.strip() for h in os.getenv("DB_REPLICA_HOSTS", "").split(",") if h.strip()):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica_{i}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{i}")
+
+if DATABASE_REPLICAS:
+    DATABASE_ROUTERS = ["JaiKorn.db.ReplicaRouter"]
+
+DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", "15"))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5"))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "10"))
+DB_REPLICA_PIN_CACHE = os.getenv("DB_REPLICA_PIN_CACHE", "default")
+
+# ── Cache ────────────────────────────────────────────────────────
+# ไม่ตั้ง REDIS_URL = ใช้ local memory ต่อ process
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# JaiKorn.authentication: ข้อมูล user ที่ใช้ตรวจ access token (is_active / is_staff / hash ของ password) เก็บใน memory ของ process กี่วินาที
+# ปิด user / เปลี่ยน password มีผลทันทีใน process ที่บันทึก และภายในเวลานี้ใน process อื่น, 0 = โหลดจาก DB ทุก request
+JWT_USER_CACHE_SECONDS = int(os.getenv("JWT_USER_CACHE_SECONDS", "30"))
+CACHES["jwt-users"] = {
+    "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    "LOCATION": "jwt-users",
+    "TIMEOUT": JWT_USER_CACHE_SECONDS,
+}
+
 # ── Password validation ──────────────────────────────────────────
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -108,21 +178,85 @@ AUTH_USER_MODEL = "users.CustomUser"
 # ── DRF / CORS / JWT ─────────────────────────────────────────────
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "JaiKorn.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
 }
 
+# JSON_BACKEND=orjson ใช้ renderer/parser ที่เร็วกว่า (ต้องติดตั้ง orjson ถ้าไม่มีจะใช้ของ DRF ตามเดิม)
+if os.getenv("JSON_BACKEND", "").lower() == "orjson":
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = [
+        "JaiKorn.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ]
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"] = [
+        "JaiKorn.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ]
+
+# ASYNC_READ_VIEWS=True: endpoint อ่านอย่างเดียว (me/summary, bills, history, shop details/products) ใช้ async view
+# JaiKorn.asgi ตั้งเป็น True ให้อัตโนมัติ, ภายใต้ ASGI ควรเปิด DB_POOL ด้วย (connection ค้างต่อ thread ใช้กับ ASGI ไม่ได้ดี)
+ASYNC_READ_VIEWS = os.getenv("ASYNC_READ_VIEWS", "False").lower() == "true"
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
+CORS_EXPOSE_HEADERS = ["Link", "X-Next-Cursor"]
 
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
     "ROTATE_REFRESH_TOKENS": False,
     "BLACKLIST_AFTER_ROTATION": False,
+    # token มี hash ของ password: เปลี่ยน password แล้ว token เดิมใช้ไม่ได้
+    "CHECK_REVOKE_TOKEN": True,
+    # access token มี claim ร้านค้า (merchant_id / merchant_status) ของ user
+    "TOKEN_OBTAIN_SERIALIZER": "users.tokens.TokenObtainPairSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "users.tokens.TokenRefreshSerializer",
+}
+
+# ── Wallets ──────────────────────────────────────────────────────
+# วงเงินของ WalletAccount ที่เปิดให้ user ใหม่ (สมัครเอง / bulk_onboard_users)
+WALLET_DEFAULT_CREDIT_LIMIT = Decimal(os.getenv("WALLET_DEFAULT_CREDIT_LIMIT", "2000.00"))
+
+# Idempotency-Key ของ pay / repay / generic-spend เก็บ response ไว้ replay กี่ชั่วโมง
+IDEMPOTENCY_KEY_TTL = timedelta(hours=int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24")))
+# คีย์ที่จองไว้แต่ยังไม่มีผล (worker ตายกลางทาง) เกินกี่วินาทีให้ request ถัดไปจองใหม่ได้ ต้องนานกว่า timeout ของ request
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = timedelta(seconds=int(os.getenv("IDEMPOTENCY_IN_FLIGHT_SECONDS", "120")))
+
+# QR (PaymentRequest) หมดอายุหลังสร้างกี่วินาที ถ้าร้านไม่ได้ตั้งค่าเอง
+PAYMENT_REQUEST_TTL = timedelta(seconds=int(os.getenv("PAYMENT_REQUEST_TTL_SECONDS", "900")))
+
+# จำนวนรายการต่อหน้าของประวัติธุรกรรม (keyset pagination, ?page_size= ได้ไม่เกิน 200)
+WALLET_HISTORY_PAGE_SIZE = int(os.getenv("WALLET_HISTORY_PAGE_SIZE", "50"))
+
+# me/export/ อ่านจาก server-side cursor ทีละกี่แถว
+WALLET_EXPORT_CHUNK_SIZE = int(os.getenv("WALLET_EXPORT_CHUNK_SIZE", "2000"))
+
+# archive_wallet_history: ประวัติที่จ่ายครบแล้วเก่ากว่ากี่เดือนถึงย้ายไป cold storage และ alias ใน STORAGES ที่ใช้เก็บไฟล์
+# (ค่าเริ่มต้นเป็น disk ใน WALLET_ARCHIVE_LOCATION เปลี่ยน backend เป็น object storage เช่น storages.backends.s3.S3Storage ได้)
+WALLET_ARCHIVE_AFTER_MONTHS = int(os.getenv("WALLET_ARCHIVE_AFTER_MONTHS", "12"))
+WALLET_ARCHIVE_STORAGE = "wallet_archive"
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    WALLET_ARCHIVE_STORAGE: {
+        "BACKEND": os.getenv("WALLET_ARCHIVE_BACKEND", "django.core.files.storage.FileSystemStorage"),
+        "OPTIONS": {"location": os.getenv("WALLET_ARCHIVE_LOCATION", str(BASE_DIR / "archive"))},
+    },
 }
+
+# cache alias ของ me/summary (invalidate หลัง commit) และอายุสูงสุดของแต่ละ entry (วินาที)
+# ต้องเป็น cache ที่ทุก process แชร์กัน (REDIS_URL) ถ้าเป็น locmem จะไม่ cache และอ่านจาก DB ทุกครั้ง (log warning ตอน start)
+CREDIT_SUMMARY_CACHE = os.getenv("CREDIT_SUMMARY_CACHE", "default")
+CREDIT_SUMMARY_CACHE_TIMEOUT = int(os.getenv("CREDIT_SUMMARY_CACHE_TIMEOUT", "300"))
+
+# ── Merchants ────────────────────────────────────────────────────
+# cache alias ของ snapshot catalog (all-details / shops-sections / categories) และอายุ snapshot (วินาที)
+# ต้องเป็น cache ที่ทุก process แชร์กัน (REDIS_URL) ถ้าเป็น locmem จะไม่ใช้ snapshot และ build ทุก request
+CATALOG_CACHE = os.getenv("CATALOG_CACHE", "default")
+CATALOG_SNAPSHOT_TIMEOUT = int(os.getenv("CATALOG_SNAPSHOT_TIMEOUT", "86400"))
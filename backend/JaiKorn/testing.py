@@ -0,0 +1,48 @@
+from importlib import import_module
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    # ใช้คู่กับ TestCase: จำนวน query ของทุก URL ใน urlconf ต้องไม่เกิน BUDGETS และต้องเท่ากันที่ทุกค่าใน ROW_COUNTS
+    # แต่ละ app กำหนดแค่ urlconf, BUDGETS, seed(rows) และ call(name, seeded) ที่คืน callable ยิง request
+    # แต่ละรอบ seed ใน savepoint แล้ว rollback ทิ้ง
+
+    ROW_COUNTS = (1, 10, 1000)
+    urlconf = None
+    BUDGETS = {}
+
+    def seed(self, rows: int):
+        # คืนค่าอะไรก็ได้ที่ call() ต้องใช้
+        return None
+
+    def call(self, name: str, seeded):
+        raise NotImplementedError
+
+    def before_request(self) -> None:
+        # ล้างสิ่งที่ทำให้ query น้อยกว่าความจริง (เช่น cache) ก่อนวัด
+        pass
+
+    def test_every_url_has_budget(self):
+        urlpatterns = import_module(self.urlconf).urlpatterns
+        self.assertEqual({pattern.name for pattern in urlpatterns}, set(self.BUDGETS))
+
+    def test_query_budgets(self):
+        for name, budget in self.BUDGETS.items():
+            counts = []
+            for rows in self.ROW_COUNTS:
+                sid = transaction.savepoint()
+                request = self.call(name, self.seed(rows))
+                self.before_request()
+
+                with CaptureQueriesContext(connection) as ctx:
+                    response = request()
+                detail = response.data if hasattr(response, 'data') else getattr(response, 'content', b'')[:200]
+                self.assertLess(response.status_code, 400, f'{name} @ {rows}: {detail}')
+                counts.append(len(ctx.captured_queries))
+                transaction.savepoint_rollback(sid)
+
+            with self.subTest(url=name):
+                self.assertEqual(len(set(counts)), 1, f'{name}: query count grows with rows {counts}')
+                self.assertLessEqual(counts[0], budget, f'{name}: {counts[0]} queries > budget {budget}')
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from .models import (
     Merchant, MerchantStatus, MerchantUser, Category,
-    Product, ProductCategory, ProductFilter
+    Product, ProductCategory, ProductFilter, ReceivableEntry,
+    Settlement, SettlementLine
 )
 # Register your models here.
 
@@ -47,3 +48,6 @@ class ProductAdmin(admin.ModelAdmin):
 
 admin.site.register(MerchantStatus)
 admin.site.register(MerchantUser)
+admin.site.register(ReceivableEntry)
+admin.site.register(Settlement)
+admin.site.register(SettlementLine)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class MerchantsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "merchants"
+
+    def ready(self):
+
+        try:
+            import merchants.signals
+        except ImportError:
+            pass
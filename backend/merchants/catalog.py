@@ -0,0 +1,167 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from JaiKorn.cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# snapshot JSON ของ endpoint catalog (ไม่ขึ้นกับ user) ผูกกับ catalog version
+# version ถูก bump ทุกครั้งที่ร้าน/สินค้า/หมวดหมู่เปลี่ยน (merchants.signals)
+# ระหว่าง rebuild ใน background จะเสิร์ฟ snapshot ล่าสุดที่มีไปก่อน
+# ต้องใช้ CATALOG_CACHE ที่ทุก process แชร์กัน (bump ต้องเห็นทุก process) ถ้าเป็น locmem จะ build ใหม่ทุก request
+
+VERSION_KEY = 'merchants:catalog:version'
+
+_registry = {}
+
+
+def _cache():
+    return shared_cache(settings.CATALOG_CACHE)
+
+
+def enabled() -> bool:
+    return _cache() is not None
+
+
+def _snapshot_key(name: str) -> str:
+    # snapshot ล่าสุดที่มี (version, content) ใช้เสิร์ฟระหว่าง rebuild
+    return f'merchants:catalog:snapshot:{name}'
+
+
+def _version_snapshot_key(name: str, version: int) -> str:
+    # content ของ version นั้นพอดี rebuild ที่ช้า / ซ้อนกันเขียนได้แค่ key ของ version ตัวเอง
+    return f'merchants:catalog:snapshot:{name}:{version}'
+
+
+def _rebuilding_key(version: int) -> str:
+    return f'merchants:catalog:rebuilding:{version}'
+
+
+def register(view_class):
+    _registry[view_class.snapshot_name] = view_class
+    return view_class
+
+
+def current_version() -> int:
+    cache = _cache()
+    return 0 if cache is None else cache.get(VERSION_KEY, 0)
+
+
+def bump_version() -> None:
+    def bump():
+        cache = _cache()
+        if cache is None:
+            return
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 1, timeout=None)
+            version = cache.get(VERSION_KEY, 1)
+        _schedule_rebuild(version)
+
+    transaction.on_commit(bump)
+
+
+def _render(name: str) -> bytes:
+    view = _registry[name]()
+    view.request = None
+    view.format_kwarg = None
+    return _renderer_class()().render(view.build_snapshot())
+
+
+def _build(name: str, version: int) -> bytes:
+    content = _render(name)
+    cache = _cache()
+    cache.set(_version_snapshot_key(name, version), content, settings.CATALOG_SNAPSHOT_TIMEOUT)
+
+    # ไม่ทับ snapshot ล่าสุดด้วย version ที่เก่ากว่า (rebuild ของ version เก่าที่ช้าจบทีหลัง)
+    # ถ้าชนกันจนค่าล่าสุดถอยไป reader ยังเจอ content ของ version ปัจจุบันจาก key ของ version นั้น
+    stored = cache.get(_snapshot_key(name))
+    if stored is None or stored[0] <= version:
+        cache.set(_snapshot_key(name), (version, content), settings.CATALOG_SNAPSHOT_TIMEOUT)
+    return content
+
+
+def rebuild_all(version: int | None = None) -> None:
+    # view ลงทะเบียนตอน import ต้องแน่ใจว่าโหลดแล้ว (เช่นตอนรันจาก management command)
+    import merchants.views  # noqa: F401
+
+    if not enabled():
+        return
+
+    version = current_version() if version is None else version
+    for name in _registry:
+        _build(name, version)
+
+
+def _schedule_rebuild(version: int) -> None:
+    # กันหลาย request/process rebuild version เดียวกันซ้ำ ลบ marker เมื่อจบ (สำเร็จหรือล้ม) ให้ rebuild ใหม่ได้
+    # timeout เผื่อ process ตายกลางทาง
+    if not _cache().add(_rebuilding_key(version), True, timeout=300):
+        return
+
+    def run():
+        try:
+            rebuild_all(version)
+        except Exception:
+            logger.exception('Catalog snapshot rebuild failed for version %s', version)
+        finally:
+            _cache().delete(_rebuilding_key(version))
+            connections.close_all()
+
+    threading.Thread(target=run, name=f'catalog-rebuild-{version}', daemon=True).start()
+
+
+def _renderer_class():
+    return api_settings.DEFAULT_RENDERER_CLASSES[0]
+
+
+def snapshot_content(name: str) -> bytes | None:
+    # None = ไม่มี shared cache ให้ render จากข้อมูลตามปกติ
+    cache = _cache()
+    if cache is None:
+        return None
+
+    cached = cache.get_many([VERSION_KEY, _snapshot_key(name)])
+    version = cached.get(VERSION_KEY, 0)
+    snapshot = cached.get(_snapshot_key(name))
+
+    if snapshot is None:
+        # cold start: ยังไม่เคยมี snapshot เลย ต้อง build เองครั้งเดียว
+        content = _build(name, version)
+    else:
+        snapshot_version, content = snapshot
+        if snapshot_version != version:
+            exact = cache.get(_version_snapshot_key(name, version))
+            if exact is not None:
+                content = exact
+            else:
+                _schedule_rebuild(version)
+
+    return content
+
+
+class CatalogSnapshotMixin:
+    # view ที่ใช้ต้องตั้ง snapshot_name และมี build_snapshot() ที่ไม่ใช้ self.request
+
+    snapshot_name = None
+
+    def build_snapshot(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.get_serializer(queryset, many=True).data
+
+    def list(self, request, *args, **kwargs):
+        # snapshot เป็น bytes ของ renderer ตัวแรก ใช้ได้เฉพาะเมื่อ content negotiation เลือก renderer นั้นแบบไม่มี parameter
+        # browsable API / ?format= / Accept ที่มี indent ฯลฯ render จากข้อมูลผ่าน Response ตามปกติ
+        renderer = request.accepted_renderer
+        if type(renderer) is _renderer_class() and request.accepted_media_type == renderer.media_type:
+            content = snapshot_content(self.snapshot_name)
+            if content is not None:
+                return HttpResponse(content, content_type=renderer.media_type)
+        return Response(self.build_snapshot())
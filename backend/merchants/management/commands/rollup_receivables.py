@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from merchants.services import rollup_receivables
+
+
+class Command(BaseCommand):
+    help = 'รวม ReceivableEntry ที่ค้างอยู่เข้า Merchant.receivable_balance'
+
+    def handle(self, *args, **options):
+        rolled_up = rollup_receivables()
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rolled_up} receivable entries'))
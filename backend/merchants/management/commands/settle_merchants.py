@@ -0,0 +1,71 @@
+import time as timer
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from merchants.services import settle_merchant_chunk, unsettled_merchant_ids
+
+
+def _init_worker():
+    # process ลูกต้องเปิด connection ของตัวเอง ห้ามใช้ของ parent ต่อ
+    django.setup()
+    connections.close_all()
+
+
+def _settle_chunk(merchant_ids, day, line_batch_size):
+    try:
+        return settle_merchant_chunk(merchant_ids=merchant_ids, day=day, line_batch_size=line_batch_size)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'T+1 settlement: สรุปยอด PaymentRequest ที่ PAID ของวันหนึ่ง เป็น Settlement ต่อร้าน แล้วหักออกจาก receivable_balance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='วันที่จะ settle (YYYY-MM-DD) ค่าเริ่มต้นคือเมื่อวาน')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--chunk-size', type=int, default=200, help='จำนวนร้านต่อ chunk (1 chunk = 1 transaction)')
+        parser.add_argument('--line-batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        day = options['date'] or timezone.localdate() - timedelta(days=1)
+        if day >= timezone.localdate():
+            raise CommandError('settle ได้เฉพาะวันที่ผ่านไปแล้วเท่านั้น')
+
+        merchant_ids = unsettled_merchant_ids(day)
+        chunk_size = options['chunk_size']
+        chunks = [merchant_ids[i:i + chunk_size] for i in range(0, len(merchant_ids), chunk_size)]
+
+        self.stdout.write(f'Settling {len(merchant_ids)} merchants for {day} in {len(chunks)} chunks')
+        if not chunks:
+            return
+
+        started = timer.perf_counter()
+        settled = lines = failed = 0
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(_settle_chunk, chunk, day, options['line_batch_size'])
+                for chunk in chunks
+            ]
+            for future in as_completed(futures):
+                try:
+                    chunk_settled, chunk_lines = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(f'Chunk failed (จะถูก settle ใหม่ในรอบถัดไป): {e}'))
+                    continue
+                settled += chunk_settled
+                lines += chunk_lines
+
+        elapsed = timer.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Settled {settled} merchants / {lines} payments in {elapsed:.1f}s '
+            f'({lines / elapsed if elapsed else 0:.0f} payments/s), failed chunks: {failed}'
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from merchants import catalog
+
+
+class Command(BaseCommand):
+    help = 'สร้าง snapshot ของ endpoint catalog ล่วงหน้า (รันตอน deploy เพื่อไม่ให้ request แรกต้อง build เอง)'
+
+    def handle(self, *args, **options):
+        if not catalog.enabled():
+            self.stdout.write(self.style.WARNING('CATALOG_CACHE is not shared across processes; snapshots are disabled'))
+            return
+
+        version = catalog.current_version()
+        catalog.rebuild_all(version)
+        self.stdout.write(self.style.SUCCESS(f'Catalog snapshots rebuilt for version {version}'))
@@ -1,5 +1,6 @@
 from django.db import models
 import uuid
+from datetime import timedelta
 from django.conf import settings
 # Create your models here.
 class MerchantStatus(models.Model):
@@ -41,12 +42,36 @@ class Merchant(models.Model):
         help_text="ยอดจำลอง T+1 Settlement ที่ต้องโอนให้ร้าน"
     )
 
+    payment_request_ttl_seconds = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="อายุของ QR (วินาที) ถ้าว่างจะใช้ค่า PAYMENT_REQUEST_TTL_SECONDS"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    @property
+    def payment_request_ttl(self) -> timedelta:
+        if self.payment_request_ttl_seconds:
+            return timedelta(seconds=self.payment_request_ttl_seconds)
+        return settings.PAYMENT_REQUEST_TTL
+
+class ReceivableEntry(models.Model):
+    # ยอดที่ต้องโอนให้ร้านแบบ append-only ต่อ checkout แทนการ UPDATE แถว Merchant ตรงๆ
+    # rollup_receivables จะรวมเข้า Merchant.receivable_balance เป็นระยะ
+
+    id = models.BigAutoField(primary_key=True)
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='receivable_entries')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.amount} for {self.merchant_id}"
+
 class MerchantUser(models.Model):
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -129,4 +154,38 @@ class Product(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class Settlement(models.Model):
+    # ยอดโอนให้ร้าน (T+1) ต่อร้านต่อวัน สร้างโดย settle_merchants
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name='settlements')
+    settlement_date = models.DateField(help_text="วันที่ของรายการที่ถูก settle")
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    payment_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['merchant', 'settlement_date'], name='uniq_settlement_per_day'),
+        ]
+        ordering = ['-settlement_date']
+
+    def __str__(self):
+        return f"Settlement {self.settlement_date} for {self.merchant_id}: {self.total_amount}"
+
+
+class SettlementLine(models.Model):
+
+    id = models.BigAutoField(primary_key=True)
+    settlement = models.ForeignKey(Settlement, on_delete=models.CASCADE, related_name='lines')
+    payment_request = models.OneToOneField(
+        'wallets.PaymentRequest',
+        on_delete=models.PROTECT,
+        related_name='settlement_line'
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.payment_request_id}: {self.amount}"
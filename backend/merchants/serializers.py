@@ -22,9 +22,17 @@ class PaymentRequestCreateSerializer(serializers.ModelSerializer):
         ]
     )
 
+    ttl_seconds = serializers.IntegerField(
+        required=False,
+        write_only=True,
+        min_value=30,
+        max_value=86400,
+        help_text="อายุของ QR (วินาที) ถ้าไม่ส่งจะใช้ค่าของร้าน"
+    )
+
     class Meta:
         model = PaymentRequest
-        fields = ['amount']
+        fields = ['amount', 'ttl_seconds']
 
 class PaymentRequestDisplaySerializer(serializers.ModelSerializer):
 
@@ -32,7 +40,7 @@ class PaymentRequestDisplaySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = PaymentRequest
-        fields = ['id', 'amount', 'status', 'merchant', 'created_at']
+        fields = ['id', 'amount', 'status', 'merchant', 'created_at', 'expires_at']
 
 
 class MerchantApplySerializer(serializers.ModelSerializer):
@@ -114,7 +122,8 @@ class ShopDetailsSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'filters', 'highlight', 'categories']
 
     def get_highlight(self, obj: Merchant) -> list[str]:
-        return list(obj.products.filter(is_highlight=True).values_list('id', flat=True))
+        # ใช้ products ที่ prefetch มาแล้ว ไม่ยิง query ต่อร้าน
+        return [product.id for product in obj.products.all() if product.is_highlight]
     
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,177 @@
+from decimal import Decimal
+from datetime import date, datetime, time, timedelta
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Max, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Merchant, MerchantUser, ReceivableEntry, Settlement, SettlementLine
+from wallets.models import PaymentRequest
+
+# claim ใน access token ที่ users.tokens ใส่ให้ตอน login / refresh / สมัครร้านค้า (None = ไม่ได้เป็นร้านค้า)
+MERCHANT_ID_CLAIM = 'merchant_id'
+MERCHANT_STATUS_CLAIM = 'merchant_status'
+
+
+def merchant_claims(user_id) -> dict:
+    link = MerchantUser.objects.filter(user_id=user_id).order_by('created_at').values_list(
+        'merchant_id', 'merchant__status_id'
+    ).first()
+    merchant_id, status_code = link or (None, None)
+    return {
+        MERCHANT_ID_CLAIM: str(merchant_id) if merchant_id else None,
+        MERCHANT_STATUS_CLAIM: status_code,
+    }
+
+
+def has_merchant_claims(request) -> bool:
+    # token ที่ออกก่อนมี claim หรือ force_authenticate / session ไม่มี claim ต้องถาม MerchantUser แบบเดิม
+    return MERCHANT_ID_CLAIM in getattr(request.auth, 'payload', {})
+
+
+def caller_merchants(request) -> QuerySet:
+    # ร้านของผู้เรียก: ถ้ามี claim กรองด้วย pk ตรงๆ ไม่ต้อง join MerchantUser (ไม่เป็นร้านค้า = ไม่ query เลย)
+    if not has_merchant_claims(request):
+        return Merchant.objects.filter(merchantuser__user=request.user)
+    merchant_id = request.auth[MERCHANT_ID_CLAIM]
+    return Merchant.objects.filter(pk=merchant_id) if merchant_id else Merchant.objects.none()
+
+
+def record_receivable(*, merchant_id: uuid.UUID, amount: Decimal) -> None:
+    ReceivableEntry.objects.create(merchant_id=merchant_id, amount=amount)
+
+
+def get_receivable_balance(*, merchant_id: uuid.UUID) -> Decimal:
+    # ยอดจริง = ยอดที่ rollup แล้ว + entry ที่ยังไม่ได้ rollup (อ่านใน statement เดียวให้ได้ snapshot เดียวกัน)
+    pending = ReceivableEntry.objects.filter(
+        merchant=OuterRef('pk')
+    ).values('merchant').annotate(total=Sum('amount')).values('total')
+
+    return Merchant.objects.filter(pk=merchant_id).annotate(
+        current_balance=F('receivable_balance') + Coalesce(
+            Subquery(pending),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
+        )
+    ).values_list('current_balance', flat=True).get()
+
+
+def _receivable_high_water() -> int | None:
+    return ReceivableEntry.objects.aggregate(high_water=Max('id'))['high_water']
+
+
+@transaction.atomic
+def rollup_receivables() -> int:
+    high_water = _receivable_high_water()
+    if high_water is None:
+        return 0
+
+    # ลบ entry แล้วบวกยอดจากแถวที่ลบจริง (DELETE ... RETURNING) ใน statement เดียว
+    # ถ้าแยก UPDATE กับ DELETE: checkout ที่ได้ id ต่ำกว่า high water แต่ commit ระหว่างสอง statement
+    # จะถูก DELETE ไปโดยไม่เคยถูกบวกเข้า receivable_balance (READ COMMITTED เห็น snapshot ใหม่ทุก statement)
+    entry_table = ReceivableEntry._meta.db_table
+    merchant_table = Merchant._meta.db_table
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {entry_table} WHERE id <= %s
+                RETURNING merchant_id, amount
+            ), totals AS (
+                SELECT merchant_id, sum(amount) AS total, count(*) AS entries
+                  FROM moved
+                 GROUP BY merchant_id
+            ), credited AS (
+                UPDATE {merchant_table} m
+                   SET receivable_balance = m.receivable_balance + totals.total
+                  FROM totals
+                 WHERE m.id = totals.merchant_id
+                RETURNING totals.entries
+            )
+            SELECT coalesce(sum(entries), 0) FROM credited
+            """,
+            [high_water],
+        )
+        return int(cursor.fetchone()[0])
+
+
+def paid_requests_for_day(day: date) -> QuerySet:
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = start + timedelta(days=1)
+
+    return PaymentRequest.objects.filter(
+        status=PaymentRequest.Status.PAID,
+        paid_at__gte=start,
+        paid_at__lt=end
+    ).order_by()
+
+
+def unsettled_merchant_ids(day: date) -> list[uuid.UUID]:
+    return list(
+        paid_requests_for_day(day).exclude(
+            merchant_id__in=Settlement.objects.filter(settlement_date=day).values('merchant_id')
+        ).values_list('merchant_id', flat=True).distinct().order_by('merchant_id')
+    )
+
+
+@transaction.atomic
+def settle_merchant_chunk(
+    *,
+    merchant_ids: list[uuid.UUID],
+    day: date,
+    line_batch_size: int = 5000
+) -> tuple[int, int]:
+    # 1 chunk = 1 transaction ถ้าล้มกลางทางจะ rollback ทั้ง chunk แล้วรันใหม่ได้
+    requests = paid_requests_for_day(day).filter(merchant_id__in=merchant_ids).exclude(
+        merchant_id__in=Settlement.objects.filter(settlement_date=day).values('merchant_id')
+    )
+
+    totals = requests.values('merchant_id').annotate(total=Sum('amount'), count=Count('id'))
+
+    settlements = Settlement.objects.bulk_create([
+        Settlement(
+            merchant_id=row['merchant_id'],
+            settlement_date=day,
+            total_amount=row['total'],
+            payment_count=row['count']
+        )
+        for row in totals
+    ])
+    if not settlements:
+        return 0, 0
+
+    settlement_ids = {settlement.merchant_id: settlement.id for settlement in settlements}
+
+    line_count = 0
+    batch = []
+    # ห้ามใช้ requests ตรงนี้ เพราะ exclude จะตัดร้านที่เพิ่งสร้าง Settlement ไปแล้วออก
+    rows = paid_requests_for_day(day).filter(
+        merchant_id__in=list(settlement_ids)
+    ).values_list('id', 'merchant_id', 'amount')
+    for request_id, merchant_id, amount in rows.iterator(chunk_size=line_batch_size):
+        batch.append(SettlementLine(
+            settlement_id=settlement_ids[merchant_id],
+            payment_request_id=request_id,
+            amount=amount
+        ))
+        if len(batch) >= line_batch_size:
+            SettlementLine.objects.bulk_create(batch)
+            line_count += len(batch)
+            batch = []
+
+    if batch:
+        SettlementLine.objects.bulk_create(batch)
+        line_count += len(batch)
+
+    settled_total = Settlement.objects.filter(
+        merchant=OuterRef('pk'), settlement_date=day
+    ).values('total_amount')[:1]
+
+    Merchant.objects.filter(pk__in=settlement_ids).update(
+        receivable_balance=F('receivable_balance') - Subquery(settled_total)
+    )
+
+    return len(settlements), line_count
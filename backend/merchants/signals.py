@@ -0,0 +1,27 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from . import catalog
+from .models import Merchant, Category, Product, ProductCategory, ProductFilter
+
+CATALOG_MODELS = (Merchant, Category, Product, ProductCategory, ProductFilter)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def bump_catalog_version(sender, update_fields=None, **kwargs):
+    if sender not in CATALOG_MODELS:
+        return
+
+    # checkout/settlement แก้แค่ receivable_balance ไม่กระทบ catalog
+    if sender is Merchant and update_fields and set(update_fields) <= {'receivable_balance', 'updated_at'}:
+        return
+
+    catalog.bump_version()
+
+
+@receiver(m2m_changed, sender=Merchant.categories.through)
+@receiver(m2m_changed, sender=Product.categories.through)
+def bump_catalog_version_on_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        catalog.bump_version()
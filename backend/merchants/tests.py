@@ -1,3 +1,543 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import uuid
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from JaiKorn.testing import QueryBudgetMixin
+from wallets.models import PaymentRequest, WalletAccount, WalletTransaction
+from wallets.services import expire_payment_requests
+from . import catalog, services
+from .models import (
+    Merchant, MerchantStatus, MerchantUser, Category, ProductCategory, ProductFilter, Product, ReceivableEntry,
+    Settlement, SettlementLine
+)
+from .views import ShopDetailsView, MerchantProductDictView, AsyncShopDetailsView, AsyncMerchantProductDictView
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    # endpoint catalog วัดตอน build snapshot (cache ว่าง) ซึ่งเป็นกรณีที่แพงที่สุด
+
+    urlconf = 'merchants.urls'
+    BUDGETS = {
+        'merchant-request-transaction': 2,
+        'merchant-receivable': 2,
+        'merchant-apply': 8,
+        'category-simple-list': 1,
+        'category-list': 2,
+        'shop-all-details-list': 5,
+        'shop-details': 5,
+        'merchant-products-dict': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Budget Shop', tax_id='BUDGET-0001', status=cls.active_status)
+
+        User = get_user_model()
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password=None)
+        cls.applicant = User.objects.create_user(username='applicant', email='applicant@example.com', password=None)
+        MerchantUser.objects.create(user=cls.owner, merchant=cls.merchant)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def seed(self, rows: int) -> None:
+        merchants = Merchant.objects.bulk_create(
+            Merchant(name=f'Shop {i}', tax_id=f'SEED-{i:06d}', status=self.active_status)
+            for i in range(rows)
+        )
+        categories = Category.objects.bulk_create(Category(name=f'Category {i}') for i in range(rows))
+        Merchant.categories.through.objects.bulk_create(
+            Merchant.categories.through(merchant=merchant, category=category)
+            for merchant, category in zip(merchants, categories)
+        )
+
+        # ร้านหลักมีสินค้า/ตัวกรอง/หมวดสินค้า N รายการ ร้านอื่นมีอย่างละ 1
+        owners = [self.merchant] * rows + merchants
+        ProductFilter.objects.bulk_create(
+            ProductFilter(merchant=merchant, name=f'Filter {i}') for i, merchant in enumerate(owners)
+        )
+        product_categories = ProductCategory.objects.bulk_create(
+            ProductCategory(merchant=merchant, name=f'Section {i}') for i, merchant in enumerate(owners)
+        )
+        products = Product.objects.bulk_create(
+            Product(id=f'p{i}', merchant=merchant, name=f'Product {i}', price=Decimal('9.00'), is_highlight=i % 2 == 0)
+            for i, merchant in enumerate(owners)
+        )
+        Product.categories.through.objects.bulk_create(
+            Product.categories.through(product=product, productcategory=product_category)
+            for product, product_category in zip(products, product_categories)
+        )
+
+    def call(self, name: str, seeded):
+        if name == 'merchant-request-transaction':
+            self.client.force_authenticate(self.owner)
+            return lambda: self.client.post(reverse(name), {'amount': '100.00'}, format='json')
+        if name == 'merchant-receivable':
+            self.client.force_authenticate(self.owner)
+            return lambda: self.client.get(reverse(name))
+        if name == 'merchant-apply':
+            self.client.force_authenticate(self.applicant)
+            return lambda: self.client.post(
+                reverse(name), {'name': 'New Shop', 'tax_id': 'NEW-0001'}, format='json'
+            )
+        if name == 'shop-details':
+            return lambda: self.client.get(reverse(name, args=[self.merchant.id]))
+        if name == 'merchant-products-dict':
+            return lambda: self.client.get(reverse(name, args=[self.merchant.id]))
+        return lambda: self.client.get(reverse(name))
+
+    def before_request(self):
+        caches[settings.CATALOG_CACHE].clear()
+
+
+class AsyncCatalogViewTests(TestCase):
+    # view async (ASYNC_READ_VIEWS) ต้องให้ response เหมือน view sync ทุก byte
+
+    VIEWS = {
+        'shop-details': (ShopDetailsView, AsyncShopDetailsView, 'id'),
+        'merchant-products-dict': (MerchantProductDictView, AsyncMerchantProductDictView, 'merchant_id'),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Async Shop', tax_id='ASYNC-0001', status=active_status)
+        ProductFilter.objects.create(merchant=cls.merchant, name='Spicy')
+        section = ProductCategory.objects.create(merchant=cls.merchant, name='Mains')
+        for i in range(3):
+            product = Product.objects.create(
+                id=f'a{i}', merchant=cls.merchant, name=f'Dish {i}', price=Decimal('59.00'), is_highlight=i == 0
+            )
+            product.categories.add(section)
+
+    def call(self, view, name: str, kwarg: str, merchant_id):
+        request = RequestFactory().get(reverse(name, args=[merchant_id]))
+        if view.view_is_async:
+            response = async_to_sync(view.as_view())(request, **{kwarg: merchant_id})
+        else:
+            response = view.as_view()(request, **{kwarg: merchant_id})
+        return response.render()
+
+    def test_same_response_as_sync_views(self):
+        for name, (sync_view, async_view, kwarg) in self.VIEWS.items():
+            self.assertTrue(async_view.view_is_async)
+            for merchant_id, status_code in ((self.merchant.id, 200), (uuid.uuid4(), 404)):
+                with self.subTest(name=name, status_code=status_code):
+                    expected = self.call(sync_view, name, kwarg, merchant_id)
+                    actual = self.call(async_view, name, kwarg, merchant_id)
+                    self.assertEqual(actual.status_code, status_code)
+                    self.assertEqual(actual.content, expected.content)
+
+
+class MerchantClaimsTests(TestCase):
+    # access token จาก users.tokens มี merchant_id / merchant_status ให้ QR / receivable / apply ไม่ต้อง query MerchantUser
+    PASSWORD = 'Claims-Pass-1234'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.suspended_status, _ = MerchantStatus.objects.get_or_create(code='SUSPENDED', defaults={'name': 'Suspended'})
+        cls.merchant = Merchant.objects.create(name='Claims Shop', tax_id='CLAIMS-0001', status=cls.active_status)
+
+        User = get_user_model()
+        cls.owner = User.objects.create_user(username='claims-owner', email='claims-owner@example.com', password=cls.PASSWORD)
+        cls.outsider = User.objects.create_user(username='claims-outsider', email='claims-outsider@example.com', password=cls.PASSWORD)
+        MerchantUser.objects.create(user=cls.owner, merchant=cls.merchant)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def login(self, user) -> dict:
+        response = self.client.post(
+            reverse('users:token_obtain_pair'), {'username': user.username, 'password': self.PASSWORD}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def use(self, access: str) -> None:
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def claims(self, access: str) -> tuple:
+        payload = AccessToken(access).payload
+        return payload['merchant_id'], payload['merchant_status']
+
+    def assertNoMembershipQuery(self, ctx):
+        table = MerchantUser._meta.db_table
+        self.assertFalse([q['sql'] for q in ctx.captured_queries if table in q['sql']])
+
+    def test_login_and_refresh_carry_membership(self):
+        tokens = self.login(self.owner)
+        self.assertEqual(self.claims(tokens['access']), (str(self.merchant.id), 'ACTIVE'))
+        self.assertEqual(self.claims(self.login(self.outsider)['access']), (None, None))
+
+        Merchant.objects.filter(pk=self.merchant.pk).update(status=self.suspended_status)
+        refreshed = self.client.post(reverse('users:token_refresh'), {'refresh': tokens['refresh']}, format='json')
+        self.assertEqual(self.claims(refreshed.data['access']), (str(self.merchant.id), 'SUSPENDED'))
+
+    def test_claims_skip_membership_lookup(self):
+        self.use(self.login(self.owner)['access'])
+        self.client.get(reverse('merchant-receivable'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            receivable = self.client.get(reverse('merchant-receivable'))
+            created = self.client.post(reverse('merchant-request-transaction'), {'amount': '100.00'}, format='json')
+        self.assertEqual((receivable.status_code, created.status_code), (200, 201))
+        self.assertEqual(receivable.data['merchant_id'], str(self.merchant.id))
+        self.assertNoMembershipQuery(ctx)
+
+        self.use(self.login(self.outsider)['access'])
+        self.client.get(reverse('merchant-receivable'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(reverse('merchant-receivable')).status_code, 403)
+            self.assertEqual(
+                self.client.post(reverse('merchant-request-transaction'), {'amount': '100.00'}, format='json').status_code,
+                403
+            )
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_suspension_applies_before_token_refresh(self):
+        self.use(self.login(self.owner)['access'])
+        Merchant.objects.filter(pk=self.merchant.pk).update(status=self.suspended_status)
+
+        response = self.client.post(reverse('merchant-request-transaction'), {'amount': '100.00'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_apply_returns_tokens_with_new_membership(self):
+        self.use(self.login(self.outsider)['access'])
+        response = self.client.post(reverse('merchant-apply'), {'name': 'New Shop', 'tax_id': 'CLAIMS-0002'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        merchant_id = MerchantUser.objects.values_list('merchant_id', flat=True).get(user=self.outsider)
+        self.assertEqual(self.claims(response.data['access']), (str(merchant_id), 'ACTIVE'))
+
+        self.use(response.data['access'])
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.post(reverse('merchant-apply'), {'name': 'Again', 'tax_id': 'CLAIMS-0003'}, format='json')
+        self.assertEqual(again.status_code, 400)
+        self.assertNoMembershipQuery(ctx)
+        self.assertEqual(
+            self.client.post(reverse('merchant-request-transaction'), {'amount': '100.00'}, format='json').status_code,
+            201
+        )
+
+
+class ReceivableRollupTests(TransactionTestCase):
+    # ต้อง commit จริงจากอีก connection จึงใช้ TransactionTestCase
+
+    def setUp(self):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        self.merchant = Merchant.objects.create(name='Rollup Shop', tax_id='ROLLUP-0001', status=active_status)
+
+    def test_rollup_moves_every_entry_once(self):
+        services.record_receivable(merchant_id=self.merchant.id, amount=Decimal('100.00'))
+        services.record_receivable(merchant_id=self.merchant.id, amount=Decimal('50.00'))
+
+        self.assertEqual(services.rollup_receivables(), 2)
+        self.assertEqual(services.rollup_receivables(), 0)
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.receivable_balance, Decimal('150.00'))
+        self.assertEqual(services.get_receivable_balance(merchant_id=self.merchant.id), Decimal('150.00'))
+
+    def test_entry_committed_after_high_water_is_not_lost(self):
+        ReceivableEntry.objects.create(merchant=self.merchant, amount=Decimal('100.00'))
+        gap_id = ReceivableEntry.objects.create(merchant=self.merchant, amount=Decimal('0.01')).id
+        ReceivableEntry.objects.create(merchant=self.merchant, amount=Decimal('50.00'))
+        ReceivableEntry.objects.filter(pk=gap_id).delete()
+
+        read_high_water = services._receivable_high_water
+
+        def high_water_then_late_checkout():
+            high_water = read_high_water()
+
+            # checkout อีก transaction ที่จอง id (ต่ำกว่า high water) ไว้ก่อน แต่ commit หลัง rollup อ่าน high water แล้ว
+            def late_checkout():
+                try:
+                    ReceivableEntry.objects.create(id=gap_id, merchant=self.merchant, amount=Decimal('25.00'))
+                finally:
+                    connection.close()
+
+            thread = threading.Thread(target=late_checkout)
+            thread.start()
+            thread.join()
+            return high_water
+
+        with mock.patch.object(services, '_receivable_high_water', high_water_then_late_checkout):
+            rolled_up = services.rollup_receivables()
+
+        self.assertEqual(rolled_up, 3)
+        self.assertFalse(ReceivableEntry.objects.exists())
+        self.merchant.refresh_from_db()
+        self.assertEqual(self.merchant.receivable_balance, Decimal('175.00'))
+
+
+# cache ที่แชร์ข้าม process (แทน redis ใน test)
+SHARED_CACHES = {
+    **settings.CACHES,
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='jaikorn-test-catalog-'),
+    },
+}
+
+
+class _InlineThread:
+    # rebuild ใน thread เดียวกับ test (thread จริงมองไม่เห็นข้อมูลใน transaction ของ TestCase)
+
+    def __init__(self, target, **kwargs):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@override_settings(CACHES=SHARED_CACHES, CATALOG_CACHE='shared')
+class CatalogSnapshotTests(TestCase):
+    NAME = 'simple-categories'
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.client = APIClient()
+        patches = (
+            mock.patch.object(catalog.threading, 'Thread', _InlineThread),
+            mock.patch.object(catalog.connections, 'close_all'),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def names(self, queries=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('category-simple-list'))
+        if queries is not None:
+            self.assertEqual(len(ctx.captured_queries), queries)
+        return [row['name'] for row in json.loads(response.content)]
+
+    def test_bump_rebuild_serve(self):
+        self.assertEqual(self.names(queries=1), ['Near You'])
+        self.assertEqual(self.names(queries=0), ['Near You'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Food')
+        self.assertEqual(catalog.current_version(), 1)
+        self.assertEqual(self.names(queries=0), ['Near You', 'Food'])
+
+    def test_older_rebuild_does_not_overwrite_newer_snapshot(self):
+        self.names()
+        with mock.patch.object(catalog, '_schedule_rebuild'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name='Food')
+        catalog.rebuild_all(catalog.current_version())
+
+        # rebuild ของ version 0 ที่ช้าจบทีหลัง
+        with mock.patch.object(catalog, '_render', return_value=b'[{"id": 0, "name": "Stale"}]'):
+            catalog._build(self.NAME, 0)
+        self.assertEqual(self.names(queries=0), ['Near You', 'Food'])
+
+        # ถ้าค่าล่าสุดถูกทับไปแล้ว ยังเสิร์ฟ content ของ version ปัจจุบันได้
+        caches['shared'].set(catalog._snapshot_key(self.NAME), (0, b'[{"id": 0, "name": "Stale"}]'))
+        self.assertEqual(self.names(queries=0), ['Near You', 'Food'])
+
+    def test_failed_rebuild_releases_marker(self):
+        with mock.patch.object(catalog, 'rebuild_all', side_effect=RuntimeError):
+            catalog._schedule_rebuild(7)
+        self.assertIsNone(caches['shared'].get(catalog._rebuilding_key(7)))
+
+        with mock.patch.object(catalog, 'rebuild_all') as rebuild_all:
+            catalog._schedule_rebuild(7)
+        rebuild_all.assert_called_once_with(7)
+
+    def test_snapshot_only_for_negotiated_json(self):
+        self.names()
+        url = reverse('category-simple-list')
+
+        browsable = self.client.get(url, {'format': 'api'})
+        self.assertEqual(browsable.status_code, 200)
+        self.assertTrue(browsable['Content-Type'].startswith('text/html'))
+        self.assertContains(browsable, 'Near You')
+
+        with CaptureQueriesContext(connection) as ctx:
+            indented = self.client.get(url, headers={'Accept': 'application/json; indent=4'})
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn(b'\n    {', indented.content)
+        self.assertEqual([row['name'] for row in json.loads(indented.content)], ['Near You'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            negotiated = self.client.get(url, headers={'Accept': 'application/json'})
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(negotiated['Content-Type'], 'application/json')
+
+    def test_local_memory_cache_is_not_used(self):
+        with override_settings(CATALOG_CACHE='default'):
+            self.assertFalse(catalog.enabled())
+            self.names(queries=1)
+            with self.captureOnCommitCallbacks(execute=True):
+                Category.objects.create(name='Food')
+            self.assertEqual(self.names(queries=1), ['Near You', 'Food'])
+
+
+class SettlementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.shops = [
+            Merchant.objects.create(
+                name=f'Settle Shop {i}', tax_id=f'SETTLE-000{i}', status=active_status,
+                receivable_balance=Decimal('1000.00')
+            )
+            for i in range(3)
+        ]
+        cls.day = timezone.localdate() - timedelta(days=2)
+        start = timezone.make_aware(datetime.combine(cls.day, time.min))
+
+        def paid(shop, amount, at, status=PaymentRequest.Status.PAID):
+            return PaymentRequest.objects.create(merchant=shop, amount=Decimal(amount), status=status, paid_at=at)
+
+        first, second, third = cls.shops
+        cls.first_requests = [
+            paid(first, '100.00', start),
+            paid(first, '25.50', start + timedelta(hours=23, minutes=59)),
+        ]
+        cls.second_requests = [paid(second, '40.00', start + timedelta(hours=12))]
+        # วันอื่น / ยังไม่จ่าย ไม่นับ
+        paid(second, '999.00', start + timedelta(days=1))
+        paid(second, '999.00', start - timedelta(microseconds=1))
+        paid(third, '999.00', start + timedelta(hours=1), status=PaymentRequest.Status.PENDING)
+
+    def settle(self, merchant_ids=None):
+        merchant_ids = services.unsettled_merchant_ids(self.day) if merchant_ids is None else merchant_ids
+        return services.settle_merchant_chunk(merchant_ids=merchant_ids, day=self.day, line_batch_size=1)
+
+    def test_totals_per_merchant_and_day(self):
+        first, second, third = self.shops
+        self.assertEqual(services.unsettled_merchant_ids(self.day), sorted([first.pk, second.pk]))
+
+        self.assertEqual(self.settle(), (2, 3))
+
+        settlements = {s.merchant_id: s for s in Settlement.objects.filter(settlement_date=self.day)}
+        self.assertEqual(set(settlements), {first.pk, second.pk})
+        self.assertEqual(
+            (settlements[first.pk].total_amount, settlements[first.pk].payment_count), (Decimal('125.50'), 2)
+        )
+        self.assertEqual(
+            (settlements[second.pk].total_amount, settlements[second.pk].payment_count), (Decimal('40.00'), 1)
+        )
+        self.assertEqual(
+            set(SettlementLine.objects.values_list('settlement__merchant_id', 'payment_request_id', 'amount')),
+            {(req.merchant_id, req.id, req.amount) for req in self.first_requests + self.second_requests}
+        )
+        self.assertEqual(
+            dict(Merchant.objects.filter(pk__in=[s.pk for s in self.shops]).values_list('pk', 'receivable_balance')),
+            {first.pk: Decimal('874.50'), second.pk: Decimal('960.00'), third.pk: Decimal('1000.00')}
+        )
+
+    def test_rerun_is_noop(self):
+        first, second, _ = self.shops
+        self.settle([first.pk])
+        self.assertEqual(services.unsettled_merchant_ids(self.day), [second.pk])
+
+        # chunk ที่มีร้านที่ settle ไปแล้วปนอยู่ (เช่น retry หลัง chunk ล้ม) settle เฉพาะร้านที่ยังไม่ได้ทำ
+        self.assertEqual(self.settle([first.pk, second.pk]), (1, 1))
+        self.assertEqual(services.unsettled_merchant_ids(self.day), [])
+
+        balances = list(Merchant.objects.order_by('pk').values_list('pk', 'receivable_balance'))
+        lines = SettlementLine.objects.count()
+        self.assertEqual(self.settle([first.pk, second.pk]), (0, 0))
+        self.assertEqual(self.settle(), (0, 0))
+        self.assertEqual(list(Merchant.objects.order_by('pk').values_list('pk', 'receivable_balance')), balances)
+        self.assertEqual(SettlementLine.objects.count(), lines)
+        self.assertEqual(Settlement.objects.filter(settlement_date=self.day).count(), 2)
+
+
+@override_settings(PAYMENT_REQUEST_TTL=timedelta(seconds=600))
+class PaymentRequestExpiryTests(TestCase):
+    # อายุ QR: ttl_seconds ที่ส่งมา -> Merchant.payment_request_ttl_seconds -> PAYMENT_REQUEST_TTL
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Expiry Shop', tax_id='EXPIRY-0001', status=active_status)
+        User = get_user_model()
+        cls.owner = User.objects.create_user(username='expiry-owner', email='expiry-owner@example.com', password=None)
+        cls.customer = User.objects.create_user(username='expiry-customer', email='expiry-customer@example.com', password=None)
+        MerchantUser.objects.create(user=cls.owner, merchant=cls.merchant)
+        WalletAccount.objects.filter(user=cls.customer).update(credit_limit=Decimal('1000.00'))
+
+    def create(self, **data) -> tuple[PaymentRequest, timedelta]:
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        started = timezone.now()
+        response = client.post(reverse('merchant-request-transaction'), {'amount': '50.00', **data}, format='json')
+        self.assertEqual(response.status_code, 201)
+        req = PaymentRequest.objects.get(pk=response.data['id'])
+        return req, req.expires_at - started
+
+    def assertTTL(self, actual: timedelta, seconds: int):
+        self.assertGreaterEqual(actual, timedelta(seconds=seconds))
+        self.assertLess(actual, timedelta(seconds=seconds + 5))
+
+    def test_ttl_precedence(self):
+        _, ttl = self.create()
+        self.assertTTL(ttl, 600)
+
+        Merchant.objects.filter(pk=self.merchant.pk).update(payment_request_ttl_seconds=300)
+        _, ttl = self.create()
+        self.assertTTL(ttl, 300)
+
+        _, ttl = self.create(ttl_seconds=45)
+        self.assertTTL(ttl, 45)
+
+    def test_expired_request_cannot_be_paid(self):
+        req, _ = self.create(ttl_seconds=30)
+        fresh, _ = self.create()
+        # แถวเก่าที่ไม่มี expires_at หมดอายุตาม created_at + PAYMENT_REQUEST_TTL
+        legacy, _ = self.create()
+        PaymentRequest.objects.filter(pk=legacy.pk).update(
+            expires_at=None, created_at=timezone.now() - timedelta(seconds=601)
+        )
+
+        client = APIClient()
+        client.force_authenticate(self.customer)
+
+        def pay(pk):
+            return client.post(reverse('wallets:customer-pay-request', args=[pk]), {'installment_months': 3}, format='json')
+
+        now = timezone.now() + timedelta(seconds=31)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            # เลยเวลาแล้วแต่ sweeper ยังไม่รัน ก็จ่ายไม่ได้
+            response = pay(req.pk)
+            self.assertEqual((response.status_code, response.data), (400, {'error': 'QR นี้หมดอายุแล้ว'}))
+
+            self.assertEqual(sum(expire_payment_requests(now=now)), 2)
+
+            for pk in (req.pk, legacy.pk):
+                response = pay(pk)
+                self.assertEqual((response.status_code, response.data), (400, {'error': 'QR นี้หมดอายุแล้ว'}))
+
+            response = pay(fresh.pk)
+            self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(
+            dict(PaymentRequest.objects.values_list('pk', 'status')),
+            {req.pk: PaymentRequest.Status.EXPIRED, legacy.pk: PaymentRequest.Status.EXPIRED, fresh.pk: PaymentRequest.Status.PAID}
+        )
+        self.assertFalse(WalletTransaction.objects.filter(payment_request__in=[req.pk, legacy.pk]).exists())
 
-# Create your tests here.
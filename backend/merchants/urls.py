@@ -1,6 +1,8 @@
 from django.urls import path
 
-from .views import MerchantRequestTransactionView, MerchantApplyView, CategoryListView, ShopDetailsView, ShopAllDetailsListView, SimpleCategoryListView, MerchantProductDictView
+from JaiKorn.async_views import read_view
+from .views import MerchantRequestTransactionView, MerchantApplyView, CategoryListView, ShopDetailsView, ShopAllDetailsListView, SimpleCategoryListView, MerchantProductDictView, MerchantReceivableView
+from .views import AsyncShopDetailsView, AsyncMerchantProductDictView
 
 
 
@@ -12,6 +14,12 @@ urlpatterns = [
         name='merchant-request-transaction'
     ),
 
+    path(
+        'me/receivable/',
+        MerchantReceivableView.as_view(),
+        name='merchant-receivable'
+    ),
+
     path(
         'apply/',
         MerchantApplyView.as_view(),
@@ -38,13 +46,13 @@ urlpatterns = [
 
     path(
         '<uuid:id>/details/',
-        ShopDetailsView.as_view(),
+        read_view(ShopDetailsView, AsyncShopDetailsView),
         name='shop-details'
     ),
 
     path(
         '<uuid:merchant_id>/products/', 
-        MerchantProductDictView.as_view(),
+        read_view(MerchantProductDictView, AsyncMerchantProductDictView),
         name='merchant-products-dict'
     ),
 ]
@@ -8,7 +8,13 @@ from django.db.models import Prefetch
 from rest_framework.views import APIView 
 from .models import Product 
 from .serializers import ProductSerializer 
-from django.shortcuts import get_object_or_404
+from django.shortcuts import aget_object_or_404, get_object_or_404
+from django.utils import timezone
+from datetime import timedelta
+from .services import MERCHANT_ID_CLAIM, caller_merchants, get_receivable_balance, has_merchant_claims
+from users.tokens import token_pair
+from . import catalog
+from JaiKorn.async_views import AsyncAPIView
 
 class MerchantRequestTransactionView(generics.CreateAPIView):
 
@@ -17,16 +23,18 @@ class MerchantRequestTransactionView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
 
-        try:
-            merchant_link = MerchantUser.objects.select_related('merchant').get(user=self.request.user)
-            merchant = merchant_link.merchant
-        except MerchantUser.DoesNotExist:
+        # สถานะอ่านจากแถวของร้านทุกครั้ง (ไม่ใช้ merchant_status ใน token) ร้านที่ถูกระงับจึงสร้าง QR ไม่ได้ทันที
+        merchant = caller_merchants(self.request).select_related('status').first()
+        if merchant is None:
             raise PermissionDenied("คุณไม่มีสิทธิ์ในการสร้าง QR (ไม่ใช่ร้านค้า)")
 
-        if merchant.status.code != 'ACTIVE':
+        if merchant.status_id != 'ACTIVE':
             raise ValidationError(f"ไม่สามารถสร้าง QR Code ได้ เนื่องจากสถานะของร้านค้าคือ '{merchant.status.name}'")
 
-        serializer.save(merchant=merchant)
+        ttl_seconds = serializer.validated_data.pop('ttl_seconds', None)
+        ttl = timedelta(seconds=ttl_seconds) if ttl_seconds else merchant.payment_request_ttl
+
+        serializer.save(merchant=merchant, expires_at=timezone.now() + ttl)
 
     def create(self, request, *args, **kwargs):
 
@@ -48,7 +56,9 @@ class MerchantApplyView(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, *args, **kwargs):
-        if MerchantUser.objects.filter(user=request.user).exists():
+        # claim บอกว่าเป็นร้านค้าแล้วเชื่อได้เลย แต่ claim ว่าง อาจมาจาก token ที่ออกก่อนสมัคร ต้องถาม MerchantUser
+        already_merchant = has_merchant_claims(request) and request.auth[MERCHANT_ID_CLAIM] is not None
+        if already_merchant or MerchantUser.objects.filter(user=request.user).exists():
             return Response(
                 {"error": "คุณได้สมัครเป็นร้านค้าไปแล้ว"},
                 status=status.HTTP_400_BAD_REQUEST
@@ -80,16 +90,19 @@ class MerchantApplyView(generics.CreateAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # token ชุดใหม่ที่มี merchant_id ของร้านที่เพิ่งสมัคร ใช้สร้าง QR ได้ทันทีไม่ต้อง login ใหม่
         headers = self.get_success_headers(serializer.data)
-        return Response(serializer.data, status=status.HTTP_201_CREATED, headers=headers)
+        return Response({**serializer.data, **token_pair(request.user)}, status=status.HTTP_201_CREATED, headers=headers)
 
-class SimpleCategoryListView(generics.ListAPIView):
+@catalog.register
+class SimpleCategoryListView(catalog.CatalogSnapshotMixin, generics.ListAPIView):
 
     queryset = Category.objects.all().order_by('name')
     serializer_class = SimpleCategorySerializer
     permission_classes = [permissions.AllowAny]
+    snapshot_name = 'simple-categories'
 
-    def list(self, request, *args, **kwargs):
+    def build_snapshot(self):
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
         database_categories = serializer.data
@@ -102,9 +115,10 @@ class SimpleCategoryListView(generics.ListAPIView):
 
         final_data = [near_you_category] + database_categories
 
-        return Response(final_data)
+        return final_data
 
-class CategoryListView(generics.ListAPIView):
+@catalog.register
+class CategoryListView(catalog.CatalogSnapshotMixin, generics.ListAPIView):
 
     queryset = Category.objects.prefetch_related(
         Prefetch(
@@ -117,10 +131,14 @@ class CategoryListView(generics.ListAPIView):
 
     permission_classes = [permissions.AllowAny]
 
-class ShopAllDetailsListView(generics.ListAPIView):
+    snapshot_name = 'shops-sections'
+
+@catalog.register
+class ShopAllDetailsListView(catalog.CatalogSnapshotMixin, generics.ListAPIView):
 
     serializer_class = ShopDetailsSerializer
     permission_classes = [permissions.AllowAny]
+    snapshot_name = 'all-details'
 
     def get_queryset(self):
 
@@ -130,13 +148,13 @@ class ShopAllDetailsListView(generics.ListAPIView):
             'product_categories__products'
         ).filter(status__code='ACTIVE').order_by('name')
 
-    def list(self, request, *args, **kwargs):
+    def build_snapshot(self):
         queryset = self.filter_queryset(self.get_queryset())
         serializer = self.get_serializer(queryset, many=True)
 
         data = {item['id']: item for item in serializer.data}
 
-        return Response(data)
+        return data
 
 class ShopDetailsView(generics.RetrieveAPIView):
 
@@ -164,4 +182,52 @@ class MerchantProductDictView(APIView):
         for item in serializer.data:
             product_dict[item['id']] = item
 
-        return Response(product_dict, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(product_dict, status=status.HTTP_200_OK)
+
+class AsyncShopDetailsView(AsyncAPIView, ShopDetailsView):
+
+    async def get(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        merchant = await aget_object_or_404(
+            self.filter_queryset(self.get_queryset()), **{self.lookup_field: kwargs[lookup_url_kwarg]}
+        )
+        self.check_object_permissions(request, merchant)
+        return Response(self.get_serializer(merchant).data)
+
+class AsyncMerchantProductDictView(AsyncAPIView, MerchantProductDictView):
+
+    async def get(self, request, merchant_id, format=None):
+
+        merchant = await aget_object_or_404(Merchant, pk=merchant_id)
+        products = [product async for product in Product.objects.filter(merchant=merchant)]
+        serializer = ProductSerializer(products, many=True)
+
+        product_dict = {item['id']: item for item in serializer.data}
+
+        return Response(product_dict, status=status.HTTP_200_OK)
+
+class MerchantReceivableView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, format=None):
+
+        if has_merchant_claims(request):
+            merchant_id = request.auth[MERCHANT_ID_CLAIM]
+        else:
+            merchant_id = caller_merchants(request).values_list('pk', flat=True).first()
+        if merchant_id is None:
+            raise PermissionDenied("คุณไม่ใช่ร้านค้า")
+
+        try:
+            receivable_balance = get_receivable_balance(merchant_id=merchant_id)
+        except Merchant.DoesNotExist:
+            # ร้านถูกลบหลังออก token
+            raise PermissionDenied("คุณไม่ใช่ร้านค้า")
+
+        return Response(
+            {
+                'merchant_id': merchant_id,
+                'receivable_balance': receivable_balance,
+            },
+            status=status.HTTP_200_OK
+        )
@@ -0,0 +1,70 @@
+import sys
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from users.services import bulk_onboard_users, read_user_rows, USER_COLUMNS
+
+FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class Command(BaseCommand):
+    help = (
+        f'นำเข้า user จากไฟล์ CSV / NDJSON (คอลัมน์ {", ".join(USER_COLUMNS)}) พร้อมเปิด WalletAccount '
+        'ทีละ chunk (hash password ใน process pool, bulk insert ใน transaction เดียวต่อ chunk) '
+        'แถวที่ username / email มีในระบบแล้วจะถูกข้าม'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='ไฟล์ .csv / .ndjson หรือ - เพื่ออ่านจาก stdin')
+        parser.add_argument('--format', choices=sorted(set(FORMATS.values())), help='ค่าเริ่มต้นดูจากนามสกุลไฟล์')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='จำนวนแถวต่อ transaction')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='จำนวน process ที่ใช้ hash password (ค่าเริ่มต้น = จำนวน CPU, 0 = hash ใน process นี้)')
+        parser.add_argument('--credit-limit', type=Decimal, default=None,
+                            help=f'วงเงินของ WalletAccount (ค่าเริ่มต้น {settings.WALLET_DEFAULT_CREDIT_LIMIT})')
+        parser.add_argument('--show-skipped', type=int, default=20, help='จำนวนแถวที่ถูกข้ามที่จะแสดง')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or next((f for ext, f in FORMATS.items() if path.lower().endswith(ext)), None)
+        if fmt is None:
+            raise CommandError('ระบุ --format (csv / ndjson) เมื่อนามสกุลไฟล์ไม่ใช่ .csv / .ndjson หรืออ่านจาก stdin')
+
+        # utf-8-sig: CSV ที่ export จาก Excel มี BOM นำหน้า
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8-sig')
+        started = time.perf_counter()
+        rows = created = skipped_count = 0
+        skipped = []
+
+        try:
+            for chunk_rows, chunk_created, chunk_skipped in bulk_onboard_users(
+                read_user_rows(stream, fmt=fmt),
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+                credit_limit=options['credit_limit'],
+            ):
+                rows += chunk_rows
+                created += chunk_created
+                skipped_count += len(chunk_skipped)
+                skipped.extend(chunk_skipped[:options['show_skipped'] - len(skipped)])
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'  {rows} rows: {created} created, {skipped_count} skipped ({rows / elapsed:.0f} rows/s)'
+                )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for line, reason in skipped:
+            self.stdout.write(self.style.WARNING(f'  line {line}: {reason}'))
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Onboarded {created} users with wallets from {rows} rows ({skipped_count} skipped) '
+            f'in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s, '
+            f'{created / elapsed if elapsed else 0:.0f} users/s)'
+        ))
@@ -0,0 +1,165 @@
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from decimal import Decimal
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+
+from wallets.models import WalletAccount
+
+# นำเข้า user จำนวนมาก (เช่นฐานลูกค้าของ partner) จาก CSV / NDJSON
+# hash password ใน process pool (PBKDF2 กิน CPU และติด GIL) แล้ว bulk insert CustomUser + WalletAccount ทีละ chunk ใน transaction เดียว
+# bulk_create ไม่ส่ง post_save จึงเปิด WalletAccount ที่นี่ด้วยวงเงิน WALLET_DEFAULT_CREDIT_LIMIT เหมือน users.signals
+# username / email ที่มีในระบบแล้วหรือซ้ำในไฟล์จะถูกข้าม รันไฟล์เดิมซ้ำได้
+
+USER_COLUMNS = ('username', 'email', 'password', 'first_name', 'last_name', 'phone')
+
+
+def read_user_rows(stream, *, fmt: str):
+    # yield (เลขบรรทัด, dict หรือ None ถ้าอ่านแถวนั้นไม่ได้) ทีละแถว ไม่โหลดทั้งไฟล์
+    if fmt == 'csv':
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row
+    elif fmt == 'ndjson':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+    else:
+        raise ValueError(f'Unknown format: {fmt}')
+
+
+def _clean_row(row: dict | None) -> tuple[dict | None, str | None]:
+    if row is None:
+        return None, 'อ่านแถวนี้ไม่ได้ (ไม่ใช่ JSON object)'
+
+    User = get_user_model()
+    values = {column: str(row.get(column) or '') for column in USER_COLUMNS}
+    for column in ('username', 'email', 'first_name', 'last_name', 'phone'):
+        values[column] = values[column].strip()
+
+    if not values['username'] or not values['email']:
+        return None, 'ต้องมีทั้ง username และ email'
+    values['email'] = User.objects.normalize_email(values['email'])
+
+    for column in ('username', 'email', 'first_name', 'last_name', 'phone'):
+        if values[column]:
+            try:
+                User._meta.get_field(column).run_validators(values[column])
+            except ValidationError as e:
+                return None, f'{column}: {" ".join(e.messages)}'
+    return values, None
+
+
+def _hash_passwords(passwords: list[str], executor, workers: int) -> list[str]:
+    # แถวที่ไม่มี password ได้ unusable password (ตั้งเองภายหลังผ่าน reset password)
+    to_hash = [password for password in passwords if password]
+    if executor is None:
+        hashed = iter([make_password(password) for password in to_hash])
+    else:
+        hashed = executor.map(make_password, to_hash, chunksize=max(1, len(to_hash) // (workers * 4)))
+    return [next(hashed) if password else make_password(None) for password in passwords]
+
+
+def _onboard_chunk(chunk: list, *, executor, workers: int, credit_limit: Decimal) -> tuple[int, list]:
+    User = get_user_model()
+    skipped = []
+    accepted = {}
+    emails = set()
+
+    for line, row in chunk:
+        values, error = _clean_row(row)
+        if error is None and (values['username'] in accepted or values['email'] in emails):
+            error = 'username หรือ email ซ้ำกับแถวก่อนหน้าในไฟล์'
+        if error is not None:
+            skipped.append((line, error))
+            continue
+        accepted[values['username']] = (line, values)
+        emails.add(values['email'])
+
+    existing = User.objects.filter(
+        Q(username__in=list(accepted)) | Q(email__in=list(emails))
+    ).values_list('username', 'email') if accepted else []
+    taken_usernames, taken_emails = set(), set()
+    for username, email in existing:
+        taken_usernames.add(username)
+        taken_emails.add(email)
+
+    rows = []
+    for username, (line, values) in accepted.items():
+        if username in taken_usernames or values['email'] in taken_emails:
+            skipped.append((line, 'username หรือ email มีในระบบแล้ว'))
+        else:
+            rows.append((line, values))
+
+    passwords = _hash_passwords([values['password'] for _, values in rows], executor, workers)
+    users = [
+        User(
+            username=values['username'],
+            email=values['email'],
+            first_name=values['first_name'],
+            last_name=values['last_name'],
+            phone=values['phone'],
+            password=password,
+        )
+        for (_, values), password in zip(rows, passwords)
+    ]
+
+    with transaction.atomic():
+        # ignore_conflicts: user ที่สมัครเข้ามาพร้อมกันระหว่าง import ไม่ทำให้ทั้ง chunk ล้ม ตรวจกลับว่าแถวไหน insert ได้จริง
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        created = set(User.objects.filter(id__in=[user.id for user in users]).values_list('id', flat=True))
+        WalletAccount.objects.bulk_create(
+            WalletAccount(user_id=user_id, credit_limit=credit_limit) for user_id in created
+        )
+
+    skipped.extend(
+        (line, 'username หรือ email มีในระบบแล้ว')
+        for (line, _), user in zip(rows, users)
+        if user.id not in created
+    )
+    return len(created), sorted(skipped)
+
+
+def bulk_onboard_users(
+        rows,
+        *,
+        chunk_size: int = 1000,
+        workers: int | None = None,
+        credit_limit: Decimal | None = None
+):
+    # rows = (เลขบรรทัด, dict) จาก read_user_rows, 1 chunk = 1 transaction
+    # workers=0 hash ใน process นี้ (ไฟล์เล็ก / test), ค่าเริ่มต้นใช้ทุก CPU
+    # yield (จำนวนแถว, จำนวน user ที่สร้าง, [(บรรทัด, เหตุผล) ที่ข้าม]) ต่อ chunk
+    credit_limit = settings.WALLET_DEFAULT_CREDIT_LIMIT if credit_limit is None else credit_limit
+    workers = (os.cpu_count() or 1) if workers is None else workers
+
+    # spawn ไม่ใช่ fork: process ลูกไม่ได้ socket ของ DB connection ที่เปิดค้างอยู่ไปด้วย
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup,
+    ) if workers else None
+
+    rows = iter(rows)
+    with executor or nullcontext():
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            created, skipped = _onboard_chunk(chunk, executor=executor, workers=workers, credit_limit=credit_limit)
+            yield len(chunk), created, skipped
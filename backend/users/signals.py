@@ -1,11 +1,25 @@
-from django.db.models.signals import post_save
+import logging
+
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.conf import settings
+from JaiKorn.authentication import forget_user
 from wallets.models import WalletAccount
 
+logger = logging.getLogger(__name__)
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_wallet_account_for_new_user(sender, instance, created, **kwargs):
+    # bulk_create ไม่ส่ง post_save: bulk_onboard_users สร้าง WalletAccount เองใน users.services
 
     if created:
-        WalletAccount.objects.create(user=instance, credit_limit=2000.00)
-        print(f"WalletAccount with 2000 credit limit created for new user: {instance.email}")
+        WalletAccount.objects.create(user=instance, credit_limit=settings.WALLET_DEFAULT_CREDIT_LIMIT)
+        logger.info("WalletAccount with %s credit limit created for new user: %s", settings.WALLET_DEFAULT_CREDIT_LIMIT, instance.email)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_authenticated_user(sender, instance, **kwargs):
+    # ปิด user / เปลี่ยน password / เปลี่ยนสิทธิ์ ต้องมีผลกับ token ที่ออกไปแล้วใน request ถัดไป
+    # (QuerySet.update() ไม่ส่ง signal: process อื่นเห็นค่าใหม่หลัง JWT_USER_CACHE_SECONDS)
+    forget_user(instance.pk)
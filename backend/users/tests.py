@@ -1,3 +1,195 @@
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from asgiref.sync import async_to_sync
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
+
+from JaiKorn.authentication import JWTAuthentication, forget_user
+from JaiKorn.testing import QueryBudgetMixin
+
+from users.services import bulk_onboard_users, read_user_rows
+from wallets.models import WalletAccount
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    # endpoint token ยิงผ่าน flow จริง (username/password, refresh token)
+
+    urlconf = 'users.urls'
+    PASSWORD = 'Budget-Pass-1234'
+
+    BUDGETS = {
+        'token_obtain_pair': 2,
+        'token_refresh': 2,
+        'user-me': 1,
+        'user-register': 4,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='budget', email='budget@example.com', password=cls.PASSWORD
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def seed(self, rows: int) -> None:
+        User = get_user_model()
+        User.objects.bulk_create(
+            User(username=f'seed-{i}', email=f'seed-{i}@example.com') for i in range(rows)
+        )
+
+    def call(self, name: str, seeded):
+        url = reverse(f'users:{name}')
+        self.client.force_authenticate(None)
+        if name == 'token_obtain_pair':
+            return lambda: self.client.post(
+                url, {'username': self.user.username, 'password': self.PASSWORD}, format='json'
+            )
+        if name == 'token_refresh':
+            refresh = self.client.post(
+                reverse('users:token_obtain_pair'),
+                {'username': self.user.username, 'password': self.PASSWORD},
+                format='json'
+            ).data['refresh']
+            return lambda: self.client.post(url, {'refresh': refresh}, format='json')
+        if name == 'user-register':
+            return lambda: self.client.post(
+                url, {'username': 'newcomer', 'email': 'newcomer@example.com', 'password': self.PASSWORD},
+                format='json'
+            )
+        self.client.force_authenticate(self.user)
+        return lambda: self.client.get(url)
+
+
+class BulkOnboardTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.create_user(username='taken', email='taken@example.com', password=None)
+
+    def onboard(self, content: str, fmt: str, **kwargs):
+        rows, created, skipped = 0, 0, []
+        for chunk_rows, chunk_created, chunk_skipped in bulk_onboard_users(
+            read_user_rows(io.StringIO(content), fmt=fmt), chunk_size=2, **kwargs
+        ):
+            rows += chunk_rows
+            created += chunk_created
+            skipped.extend(chunk_skipped)
+        return rows, created, skipped
+
+    def test_csv_hashes_in_process_pool(self):
+        content = (
+            'username,email,password,first_name,phone\n'
+            'alice,alice@EXAMPLE.com,Secret-Pass-1,Alice,0812345678\n'
+            'bob,bob@example.com,,Bob,\n'
+            'taken,new@example.com,Secret-Pass-1,,\n'
+            'alice,other@example.com,Secret-Pass-1,,\n'
+            'carol,not-an-email,Secret-Pass-1,,\n'
+            'dave,,Secret-Pass-1,,\n'
+        )
+        rows, created, skipped = self.onboard(content, 'csv', workers=1)
+
+        self.assertEqual((rows, created), (6, 2))
+        self.assertEqual([line for line, _ in skipped], [4, 5, 6, 7])
+
+        User = get_user_model()
+        alice = User.objects.get(username='alice')
+        self.assertEqual((alice.email, alice.first_name, alice.phone), ('alice@example.com', 'Alice', '0812345678'))
+        self.assertTrue(alice.check_password('Secret-Pass-1'))
+        self.assertFalse(User.objects.get(username='bob').has_usable_password())
+
+        limits = WalletAccount.objects.filter(user__username__in=['alice', 'bob']).values_list('credit_limit', flat=True)
+        self.assertEqual(list(limits), [settings.WALLET_DEFAULT_CREDIT_LIMIT] * 2)
+
+    def test_ndjson_rerun_skips_existing(self):
+        content = '\n'.join([
+            json.dumps({'username': 'erin', 'email': 'erin@example.com', 'password': 'Secret-Pass-1'}),
+            'not json',
+            '',
+            json.dumps({'username': 'frank', 'email': 'frank@example.com'}),
+        ])
+        rows, created, skipped = self.onboard(content, 'ndjson', workers=0, credit_limit=Decimal('500.00'))
+        self.assertEqual((rows, created, [line for line, _ in skipped]), (3, 2, [2]))
+        self.assertEqual(
+            set(WalletAccount.objects.filter(user__username__in=['erin', 'frank']).values_list('credit_limit', flat=True)),
+            {Decimal('500.00')}
+        )
+
+        rows, created, skipped = self.onboard(content, 'ndjson', workers=0)
+        self.assertEqual((rows, created, [line for line, _ in skipped]), (3, 0, [1, 2, 4]))
+
+    def test_query_count_is_per_chunk(self):
+        counts = []
+        for users in (10, 100):
+            content = 'username,email\n' + ''.join(f'bulk-{users}-{i},bulk-{users}-{i}@example.com\n' for i in range(users))
+            with CaptureQueriesContext(connection) as ctx:
+                for _ in bulk_onboard_users(read_user_rows(io.StringIO(content), fmt='csv'), chunk_size=100, workers=0):
+                    pass
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(WalletAccount.objects.filter(user__username__startswith='bulk-').count(), 110)
+
+
+class JWTUserCacheTests(TestCase):
+    PASSWORD = 'Cache-Pass-1234'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(
+            username='cached', email='cached@example.com', password=cls.PASSWORD, is_staff=True
+        )
+
+    def setUp(self):
+        forget_user(self.user.pk)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def authenticate(self, token=None):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        with CaptureQueriesContext(connection) as ctx:
+            user, _ = JWTAuthentication().authenticate(request)
+        return user, len(ctx.captured_queries)
+
+    def test_second_request_needs_no_query(self):
+        user, queries = self.authenticate()
+        self.assertEqual(queries, 1)
+        user, queries = self.authenticate()
+        self.assertEqual(queries, 0)
+
+        self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, 'cached', True))
+        self.assertEqual(user, self.user)
+        self.assertEqual(user.get_deferred_fields(), {'password', 'first_name', 'last_name', 'phone', 'last_login', 'date_joined'})
+
+    def test_async_shares_cache(self):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        user, _ = async_to_sync(JWTAuthentication().aauthenticate)(request)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(self.authenticate()[1], 0)
+
+    def test_deactivation_invalidates(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+
+        with self.assertRaises(AuthenticationFailed) as ctx:
+            self.authenticate()
+        self.assertEqual(ctx.exception.detail['code'], 'user_inactive')
+
+    def test_password_change_revokes_old_tokens(self):
+        self.authenticate()
+        self.user.set_password('Changed-Pass-5678')
+        self.user.save()
 
-# Create your tests here.
+        with self.assertRaises(AuthenticationFailed) as ctx:
+            self.authenticate()
+        self.assertEqual(ctx.exception.detail['code'], 'password_changed')
+        self.assertEqual(self.authenticate(str(AccessToken.for_user(self.user)))[0].pk, self.user.pk)
@@ -0,0 +1,30 @@
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+
+from merchants.services import merchant_claims
+
+
+class RefreshToken(tokens.RefreshToken):
+    # access token ทุกใบ (login / refresh / MerchantApplyView) มี merchant_id / merchant_status ล่าสุดของ user
+    # ร้านเปลี่ยนสถานะแล้ว client เรียก token/refresh/ ก็ได้ claim ใหม่
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        access.payload.update(merchant_claims(self[api_settings.USER_ID_CLAIM]))
+        return access
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    token_class = RefreshToken
+
+
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+def token_pair(user) -> dict:
+    refresh = RefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
@@ -1,7 +1,12 @@
 from django.contrib import admin
-from .models import WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill
+from .models import WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill, IdempotencyKey, Statement, StatementPartition, LedgerCheckpoint, WalletArchive
 # Register your models here.
 admin.site.register(WalletAccount)
 admin.site.register(PaymentRequest)
 admin.site.register(WalletTransaction)
-admin.site.register(InstallmentBill)
\ No newline at end of file
+admin.site.register(InstallmentBill)
+admin.site.register(IdempotencyKey)
+admin.site.register(Statement)
+admin.site.register(StatementPartition)
+admin.site.register(LedgerCheckpoint)
+admin.site.register(WalletArchive)
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class WalletsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "wallets"
+
+    def ready(self):
+
+        try:
+            import wallets.signals
+        except ImportError:
+            pass
+
+        from wallets.cache import warn_if_disabled
+        warn_if_disabled()
@@ -0,0 +1,238 @@
+import bisect
+import functools
+import gzip
+import hashlib
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from .models import WalletAccount, WalletTransaction, InstallmentBill, LedgerCheckpoint, WalletArchive
+
+# ย้ายประวัติที่จ่ายครบแล้ว (WalletTransaction + InstallmentBill ที่ PAID) ที่เก่ากว่า WALLET_ARCHIVE_AFTER_MONTHS
+# ออกไปเป็นไฟล์ NDJSON (gzip) ใน storage WALLET_ARCHIVE_STORAGE ทีละบัญชี: เขียนไฟล์ -> อ่านกลับมาตรวจ -> ลบจาก DB
+# ในบัญชีหนึ่งรายการที่ archive แล้วเก่ากว่ารายการที่ยังอยู่ใน DB เสมอ ประวัติจึงอ่านต่อจาก archive ได้ตามลำดับ (created_at, id)
+# เฉพาะรายการก่อน LedgerCheckpoint (reconcile_ledger ตรวจแล้ว) และก่อนรายการแรกที่ยังมีบิลค้างจ่าย
+
+TRANSACTION_COLUMNS = (
+    'id',
+    'type_code',
+    'signed_amount',
+    'balance_due_after',
+    'payment_request_id',
+    'payment_request__merchant__name',
+    'occurred_at',
+    'created_at',
+)
+
+BILL_COLUMNS = (
+    'id',
+    'transaction_id',
+    'amount_due',
+    'due_date',
+    'status',
+    'paid_at',
+    'repayment_transaction_id',
+)
+
+_TYPES = {
+    'id': uuid.UUID,
+    'transaction_id': uuid.UUID,
+    'payment_request_id': uuid.UUID,
+    'repayment_transaction_id': uuid.UUID,
+    'signed_amount': Decimal,
+    'balance_due_after': Decimal,
+    'amount_due': Decimal,
+    'occurred_at': datetime.fromisoformat,
+    'created_at': datetime.fromisoformat,
+    'paid_at': datetime.fromisoformat,
+    'due_date': date.fromisoformat,
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_storage():
+    return storages[settings.WALLET_ARCHIVE_STORAGE]
+
+
+def _default(value):
+    # datetime เก็บ microsecond ครบ (DjangoJSONEncoder ตัดเหลือ millisecond ทำให้ keyset เพี้ยน)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _encode(transactions: list[dict], bills: list[dict]) -> bytes:
+    lines = [
+        json.dumps({'kind': kind, **row}, default=_default, ensure_ascii=False, separators=(',', ':'))
+        for kind, rows in (('transaction', transactions), ('bill', bills))
+        for row in rows
+    ]
+    return gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+
+
+def _decode(content: bytes) -> tuple[list[dict], list[dict]]:
+    rows = {'transaction': [], 'bill': []}
+    for line in gzip.decompress(content).decode('utf-8').splitlines():
+        row = json.loads(line)
+        kind = row.pop('kind')
+        rows[kind].append({
+            key: _TYPES[key](value) if value is not None and key in _TYPES else value
+            for key, value in row.items()
+        })
+    return rows['transaction'], rows['bill']
+
+
+def read_archive(archive: WalletArchive) -> tuple[list[dict], list[dict]]:
+    # (รายการเรียงใหม่ไปเก่า, บิล) ในรูปเดียวกับ values(*TRANSACTION_COLUMNS) / values(*BILL_COLUMNS)
+    with archive_storage().open(archive.path, 'rb') as f:
+        return _decode(f.read())
+
+
+@functools.lru_cache(maxsize=32)
+def _archived_transactions(path: str) -> tuple[dict, ...]:
+    # ไฟล์ archive ไม่ถูกเขียนทับ (ชื่อไฟล์มี uuid) แปลงครั้งเดียวต่อ process แล้วใช้ซ้ำทุกหน้าของประวัติ
+    with archive_storage().open(path, 'rb') as f:
+        transactions, _ = _decode(f.read())
+    return tuple(transactions)
+
+
+def archive_account_history(*, account_id: uuid.UUID, before: datetime) -> WalletArchive | None:
+    storage = archive_storage()
+
+    with transaction.atomic():
+        # lock บัญชี กันรายการ / การจ่ายบิลใหม่ระหว่าง export
+        WalletAccount.objects.select_for_update().filter(pk=account_id).values_list('pk', flat=True).get()
+
+        checkpoint = LedgerCheckpoint.objects.filter(account_id=account_id).values_list(
+            'last_created_at', flat=True
+        ).first()
+        if checkpoint is None:
+            return None
+        open_from = InstallmentBill.objects.filter(account_id=account_id).exclude(
+            status=InstallmentBill.Status.PAID
+        ).aggregate(first=Min('transaction__created_at'))['first']
+        boundary = min(value for value in (before, checkpoint, open_from) if value is not None)
+
+        txn_rows = WalletTransaction.objects.filter(account_id=account_id, created_at__lt=boundary)
+        bill_rows = InstallmentBill.objects.filter(
+            account_id=account_id, transaction__account_id=account_id, transaction__created_at__lt=boundary
+        )
+        transactions = list(txn_rows.order_by('-created_at', '-id').values(*TRANSACTION_COLUMNS))
+        if not transactions:
+            return None
+        bills = list(bill_rows.order_by('due_date', 'id').values(*BILL_COLUMNS))
+
+        content = _encode(transactions, bills)
+        checksum = hashlib.sha256(content).hexdigest()
+        name = storage.save(
+            f'{account_id}/{timezone.localtime(boundary):%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.ndjson.gz',
+            ContentFile(content)
+        )
+
+        try:
+            with storage.open(name, 'rb') as f:
+                stored = f.read()
+            if hashlib.sha256(stored).hexdigest() != checksum or _decode(stored) != (transactions, bills):
+                raise ArchiveError(f'ไฟล์ {name} ที่อ่านกลับมาไม่ตรงกับข้อมูลใน DB')
+
+            archive = WalletArchive.objects.create(
+                account_id=account_id,
+                path=name,
+                first_created_at=transactions[-1]['created_at'],
+                last_created_at=transactions[0]['created_at'],
+                last_transaction_id=transactions[0]['id'],
+                balance=transactions[0]['balance_due_after'],
+                transaction_count=len(transactions),
+                bill_count=len(bills),
+                size=len(content),
+                checksum=checksum,
+            )
+
+            _, deleted_bills = bill_rows.delete()
+            _, deleted_txns = txn_rows.delete()
+            if (
+                deleted_bills.get(InstallmentBill._meta.label, 0) != len(bills)
+                or deleted_txns.get(WalletTransaction._meta.label, 0) != len(transactions)
+            ):
+                raise ArchiveError(f'จำนวนแถวที่ลบของบัญชี {account_id} ไม่ตรงกับไฟล์ {name}')
+        except Exception:
+            storage.delete(name)
+            raise
+
+    return archive
+
+
+def archive_wallet_history(*, before: datetime, batch_size: int = 100):
+    # ไล่บัญชีที่มีรายการเก่ากว่า before ตาม id ทีละ batch (1 บัญชี = 1 transaction)
+    # yield (จำนวนบัญชีที่ตรวจ, WalletArchive ที่สร้างใน batch นี้)
+    accounts = WalletAccount.objects.filter(
+        Exists(WalletTransaction.objects.filter(account_id=OuterRef('pk'), created_at__lt=before))
+    ).order_by('id').values_list('id', flat=True)
+
+    after = None
+    while True:
+        batch = list((accounts.filter(id__gt=after) if after else accounts)[:batch_size])
+        if not batch:
+            return
+        after = batch[-1]
+
+        archives = [archive_account_history(account_id=account_id, before=before) for account_id in batch]
+        yield len(batch), [archive for archive in archives if archive is not None]
+
+
+def archived_history_rows(*, user_id, before: tuple[datetime, uuid.UUID] | None = None, limit: int) -> list[dict]:
+    # read-through ของประวัติ: รายการใน archive ที่เก่ากว่า before เรียงใหม่ไปเก่า (รูปเดียวกับ TRANSACTION_HISTORY_COLUMNS)
+    archives = WalletArchive.objects.filter(account__user_id=user_id).order_by('-last_created_at')
+    if before is not None:
+        archives = archives.filter(first_created_at__lte=before[0])
+
+    rows = []
+    for archive in archives:
+        transactions = _archived_transactions(archive.path)
+        # รายการในไฟล์เรียง (created_at, id) ใหม่ไปเก่า: หาแถวแรกที่เก่ากว่า before ด้วย bisect แทนการไล่ทีละแถว
+        start = 0 if before is None else bisect.bisect_left(
+            transactions, True, key=lambda row: (row['created_at'], row['id']) < before
+        )
+        rows.extend(dict(row) for row in transactions[start:start + limit - len(rows)])
+        if len(rows) >= limit:
+            return rows
+    return rows
+
+
+def has_archive_subquery(*, user_id):
+    # ใส่ใน values() ของประวัติ ให้รู้ว่ามี archive ต่อจากหน้าสุดท้ายโดยไม่ต้องเพิ่ม query (ไม่ผูกกับแถว จึงถูกประเมินครั้งเดียว)
+    return Exists(WalletArchive.objects.filter(account__user_id=user_id))
+
+
+def restore_archive_checkpoints() -> int:
+    # หลังลบ LedgerCheckpoint (reconcile_ledger --reset) บัญชีที่มี archive ต้องเริ่มตรวจต่อจากรายการสุดท้ายใน archive
+    # เพราะรายการก่อนหน้านั้นไม่อยู่ใน DB แล้ว
+    latest = WalletArchive.objects.order_by('account_id', '-last_created_at').distinct('account_id')
+    checkpoints = LedgerCheckpoint.objects.bulk_create(
+        [
+            LedgerCheckpoint(
+                account_id=archive.account_id,
+                last_created_at=archive.last_created_at,
+                last_transaction_id=archive.last_transaction_id,
+                balance=archive.balance,
+            )
+            for archive in latest
+        ],
+        update_conflicts=True,
+        unique_fields=['account'],
+        update_fields=['last_created_at', 'last_transaction_id', 'balance', 'checked_at'],
+    )
+    return len(checkpoints)
@@ -0,0 +1,103 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from JaiKorn.cache import shared_cache
+
+logger = logging.getLogger(__name__)
+
+# cache ของ me/summary ต่อ user: อ่านจาก DB ตอน miss แล้ว fill, ทุกทางที่แก้ยอดเลื่อน version หลัง commit
+# ข้อมูลอยู่ใต้ key ที่มี version ของ user: fill ที่อ่าน DB ก่อนการเขียน commit จะลงที่ version เก่าซึ่งไม่มีใครอ่านอีก
+# การเขียนที่ commit พร้อมกันแค่ incr version จึงไม่มีลำดับให้ผิด (read-your-writes หลัง commit ทุก process)
+# ทำงานเฉพาะเมื่อ CREDIT_SUMMARY_CACHE เป็น cache ที่แชร์กัน (redis ฯลฯ) ถ้าเป็น locmem จะอ่านจาก DB ทุกครั้ง
+
+
+def _cache():
+    return shared_cache(settings.CREDIT_SUMMARY_CACHE)
+
+
+def warn_if_disabled() -> None:
+    # เรียกตอน start (WalletsConfig.ready) ให้รู้ว่า me/summary ไม่ได้ cache ไม่ใช่เงียบไป
+    if _cache() is None:
+        logger.warning(
+            'Credit summary cache is disabled: CREDIT_SUMMARY_CACHE=%r is per-process (%s), '
+            'a checkout on one worker cannot invalidate the summary cached by another. '
+            'Point it at a shared cache (set REDIS_URL) to enable it.',
+            settings.CREDIT_SUMMARY_CACHE, type(caches[settings.CREDIT_SUMMARY_CACHE]).__name__
+        )
+
+
+def _version_key(user_id) -> str:
+    return f'wallets:credit-summary-version:{user_id}'
+
+
+def _data_key(user_id, version) -> str:
+    return f'wallets:credit-summary:{user_id}:{version}'
+
+
+def _new_version() -> int:
+    # version เริ่มจากเวลา ไม่ใช่ 0: version key ที่ถูก evict แล้วสร้างใหม่จะไม่ชนกับข้อมูลเก่าที่ยังค้างอยู่
+    return time.time_ns()
+
+
+def get_credit_summary(user_id) -> tuple[dict | None, str | None]:
+    # (ข้อมูลใน cache หรือ None, key ที่ต้องส่งให้ fill_credit_summary หลังอ่าน DB)
+    # อ่าน version ก่อนอ่าน DB เสมอ
+    cache = _cache()
+    if cache is None:
+        return None, None
+
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), _new_version(), settings.CREDIT_SUMMARY_CACHE_TIMEOUT)
+        version = cache.get(_version_key(user_id))
+        if version is None:
+            return None, None
+
+    key = _data_key(user_id, version)
+    return cache.get(key), key
+
+
+def fill_credit_summary(key: str | None, data: dict) -> None:
+    if key is not None:
+        _cache().add(key, data, settings.CREDIT_SUMMARY_CACHE_TIMEOUT)
+
+
+async def aget_credit_summary(user_id) -> tuple[dict | None, str | None]:
+    cache = _cache()
+    if cache is None:
+        return None, None
+
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        await cache.aadd(_version_key(user_id), _new_version(), settings.CREDIT_SUMMARY_CACHE_TIMEOUT)
+        version = await cache.aget(_version_key(user_id))
+        if version is None:
+            return None, None
+
+    key = _data_key(user_id, version)
+    return await cache.aget(key), key
+
+
+async def afill_credit_summary(key: str | None, data: dict) -> None:
+    if key is not None:
+        await _cache().aadd(key, data, settings.CREDIT_SUMMARY_CACHE_TIMEOUT)
+
+
+def _bump_version(user_id) -> None:
+    cache = _cache()
+    if cache is None:
+        return
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # ยังไม่มี version (ไม่เคย cache หรือหมดอายุแล้ว): version ใหม่จากเวลาไม่ชนกับข้อมูลที่ค้างอยู่
+        cache.add(_version_key(user_id), _new_version(), settings.CREDIT_SUMMARY_CACHE_TIMEOUT)
+
+
+def invalidate_credit_summary_on_commit(user_id) -> None:
+    # rollback = callback ไม่ถูกเรียก cache เดิมยังถูกต้อง
+    transaction.on_commit(lambda: _bump_version(user_id))
@@ -0,0 +1,158 @@
+import csv
+import heapq
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .archive import read_archive
+from .models import WalletTransaction, InstallmentBill, WalletArchive
+
+# export ประวัติทั้งหมดของ user เป็น CSV / NDJSON แบบ stream
+# อ่านผ่าน server-side cursor (iterator) ทีละ chunk หน่วยความจำคงที่ไม่ว่าประวัติจะยาวแค่ไหน
+# แล้วต่อด้วยรายการที่ย้ายไป archive แล้ว (wallets.archive) ทีละไฟล์ ผลเหมือนกับก่อน archive
+# ช่วงวันที่ใช้ index เดิม: txn_account_created_idx (created_at) และ bill_account_due_idx (due_date)
+
+TRANSACTION_COLUMNS = {
+    'id': 'id',
+    'created_at': 'created_at',
+    'type': 'type_code',
+    'amount': 'signed_amount',
+    'balance_due_after': 'balance_due_after',
+    'merchant': 'payment_request__merchant__name',
+    'payment_request_id': 'payment_request_id',
+}
+
+BILL_COLUMNS = {
+    'id': 'id',
+    'transaction_id': 'transaction_id',
+    'due_date': 'due_date',
+    'amount_due': 'amount_due',
+    'status': 'status',
+    'paid_at': 'paid_at',
+    'merchant': 'transaction__payment_request__merchant__name',
+}
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _start_of(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _archives(*, user_id):
+    return WalletArchive.objects.filter(account__user_id=user_id).order_by('-last_created_at')
+
+
+def transactions_for_export(*, user_id, date_from: date | None = None, date_to: date | None = None):
+    queryset = WalletTransaction.objects.filter(account__user_id=user_id)
+    archives = _archives(user_id=user_id)
+    # ช่วงวันที่ตามเวลาท้องถิ่น (date_to รวมทั้งวัน)
+    start = _start_of(date_from) if date_from is not None else None
+    end = _start_of(date_to + timedelta(days=1)) if date_to is not None else None
+    if start is not None:
+        queryset = queryset.filter(created_at__gte=start)
+        archives = archives.filter(last_created_at__gte=start)
+    if end is not None:
+        queryset = queryset.filter(created_at__lt=end)
+        archives = archives.filter(first_created_at__lt=end)
+
+    rows = queryset.order_by('-created_at', '-id').values_list(*TRANSACTION_COLUMNS.values())
+    yield from rows.iterator(chunk_size=settings.WALLET_EXPORT_CHUNK_SIZE)
+
+    # รายการใน archive เก่ากว่ารายการใน DB ของบัญชีเดียวกันเสมอ ต่อท้ายได้เลยโดยลำดับไม่เปลี่ยน
+    for archive in archives:
+        transactions, _ = read_archive(archive)
+        for row in transactions:
+            if (start is None or row['created_at'] >= start) and (end is None or row['created_at'] < end):
+                yield tuple(row[column] for column in TRANSACTION_COLUMNS.values())
+
+
+def _archived_bills(archive, *, date_from, date_to) -> list[tuple]:
+    transactions, bills = read_archive(archive)
+    merchants = {row['id']: row['payment_request__merchant__name'] for row in transactions}
+    return [
+        tuple(
+            merchants.get(row['transaction_id']) if column == BILL_COLUMNS['merchant'] else row[column]
+            for column in BILL_COLUMNS.values()
+        )
+        for row in bills
+        if (date_from is None or row['due_date'] >= date_from) and (date_to is None or row['due_date'] <= date_to)
+    ]
+
+
+def bills_for_export(*, user_id, date_from: date | None = None, date_to: date | None = None):
+    queryset = InstallmentBill.objects.filter(account__user_id=user_id)
+    if date_from is not None:
+        queryset = queryset.filter(due_date__gte=date_from)
+    if date_to is not None:
+        queryset = queryset.filter(due_date__lte=date_to)
+    rows = queryset.order_by('due_date', 'id').values_list(*BILL_COLUMNS.values())
+
+    # บิลใน archive (จ่ายครบแล้ว) กำหนดชำระคาบเกี่ยวกับบิลใน DB ได้ merge ตาม (due_date, id) ที่ทั้งสองฝั่งเรียงไว้แล้ว
+    archived = [_archived_bills(archive, date_from=date_from, date_to=date_to) for archive in _archives(user_id=user_id)]
+    due_date, pk = list(BILL_COLUMNS).index('due_date'), list(BILL_COLUMNS).index('id')
+    yield from heapq.merge(
+        rows.iterator(chunk_size=settings.WALLET_EXPORT_CHUNK_SIZE), *archived, key=lambda row: (row[due_date], row[pk])
+    )
+
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+class _Echo:
+    # csv.writer เขียนลง object นี้แล้วได้บรรทัดกลับมาเลย ไม่ต้องมี buffer
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, header):
+    writer = csv.writer(_Echo())
+    # BOM ให้ Excel เปิดภาษาไทยได้ถูก
+    yield '\ufeff' + writer.writerow(header)
+
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow(['' if value is None else _text(value) for value in row]))
+        if len(chunk) >= settings.WALLET_EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def stream_ndjson(rows, header):
+    chunk = []
+    for row in rows:
+        item = dict(zip(header, map(_text, row)))
+        chunk.append(json.dumps(item, ensure_ascii=False, separators=(',', ':')) + '\n')
+        if len(chunk) >= settings.WALLET_EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export_stream(*, kind: str, output: str, user_id, date_from=None, date_to=None):
+    if kind == 'bills':
+        rows = bills_for_export(user_id=user_id, date_from=date_from, date_to=date_to)
+        header = list(BILL_COLUMNS)
+    else:
+        rows = transactions_for_export(user_id=user_id, date_from=date_from, date_to=date_to)
+        header = list(TRANSACTION_COLUMNS)
+
+    if output == 'ndjson':
+        return stream_ndjson(rows, header)
+    return stream_csv(rows, header)
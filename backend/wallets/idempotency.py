@@ -0,0 +1,143 @@
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _replay(record: dict) -> Response:
+    response = Response(record['response_body'], status=record['status_code'])
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _request_hash(request) -> str:
+    # body ที่ parse แล้วเรียง key ใหม่: ลำดับ field / ช่องว่างต่างกันยังนับเป็น request เดียวกัน
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _in_flight(record: dict, now) -> bool:
+    # คีย์ที่จองไว้นานเกิน IDEMPOTENCY_IN_FLIGHT_TIMEOUT โดยไม่มีผล = worker ตายกลางทาง ไม่นับว่ากำลังประมวลผล
+    return record['status_code'] is None and record['created_at'] > now - settings.IDEMPOTENCY_IN_FLIGHT_TIMEOUT
+
+
+def _reserve(lookup: dict, request_hash: str, now) -> IdempotencyKey | None:
+    expires_at = now + settings.IDEMPOTENCY_KEY_TTL
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(**lookup, request_hash=request_hash, expires_at=expires_at)
+    except IntegrityError:
+        pass
+
+    # คีย์เดิมหมดอายุแต่ sweeper ยังไม่ได้ลบ หรือจองค้างไว้จาก worker ที่ตายไปแล้ว
+    # request ที่แย่งกันจองใหม่ มีแค่รายเดียวที่ลบแถวเดิมได้
+    deleted, _ = IdempotencyKey.objects.filter(
+        Q(expires_at__lte=now)
+        | Q(status_code__isnull=True, created_at__lte=now - settings.IDEMPOTENCY_IN_FLIGHT_TIMEOUT),
+        **lookup
+    ).delete()
+    if not deleted:
+        return None
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(**lookup, request_hash=request_hash, expires_at=expires_at)
+    except IntegrityError:
+        return None
+
+
+def idempotent(view_method):
+    # ใช้กับ post() ของ view ที่ตัดเงิน/จ่ายบิล ถ้า client ส่ง Idempotency-Key มา
+    # request ที่ซ้ำจะได้ response เดิมกลับไปโดยไม่แตะ WalletAccount lock เลย
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} ยาวเกินไป"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        lookup = {'user': request.user, 'key': key, 'endpoint': request.path}
+        request_hash = _request_hash(request)
+        now = timezone.now()
+
+        record = IdempotencyKey.objects.filter(
+            **lookup, expires_at__gt=now
+        ).values('status_code', 'response_body', 'created_at', 'request_hash').first()
+
+        # คีย์เดิมแต่ body ไม่เหมือนเดิม (เช่นยอดเงินต่างกัน) ไม่ใช่ retry ห้าม replay ผลของรายการอื่น
+        # (แถวที่ request_hash ว่างจองไว้ก่อนมี field นี้ ไม่มีอะไรให้เทียบ)
+        if record is not None and record['request_hash'] and record['request_hash'] != request_hash:
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} นี้ถูกใช้กับรายการอื่นแล้ว"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if record is not None and record['status_code'] is not None:
+            return _replay(record)
+        if record is not None and _in_flight(record, now):
+            return Response(
+                {"error": "รายการนี้กำลังประมวลผลอยู่ กรุณารอสักครู่"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        # จองคีย์ก่อนทำรายการ กัน retry ที่ยิงมาพร้อมกันไม่ให้ทำรายการซ้ำ
+        reserved = _reserve(lookup, request_hash, now)
+        if reserved is None:
+            return Response(
+                {"error": "รายการนี้กำลังประมวลผลอยู่ กรุณารอสักครู่"},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            reserved.delete()
+            raise
+
+        if response.status_code >= 500:
+            # ระบบขัดข้อง ให้ client retry ด้วยคีย์เดิมได้
+            reserved.delete()
+            return response
+
+        IdempotencyKey.objects.filter(pk=reserved.pk).update(
+            status_code=response.status_code,
+            response_body=response.data
+        )
+        return response
+
+    return wrapper
+
+
+def purge_expired_keys(*, batch_size: int = 1000) -> int:
+    now = timezone.now()
+    deleted = 0
+
+    while True:
+        batch = list(
+            IdempotencyKey.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return deleted
+
+        IdempotencyKey.objects.filter(pk__in=batch).delete()
+        deleted += len(batch)
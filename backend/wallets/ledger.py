@@ -0,0 +1,182 @@
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalidate_credit_summary_on_commit
+from .models import WalletAccount, WalletTransaction, LedgerCheckpoint
+from .services import _prep
+
+# ตรวจว่า balance_due_after ของทุกรายการเท่ากับยอดสะสมของ signed_amount (เรียงตาม created_at, id)
+# และรายการสุดท้ายเท่ากับ WalletAccount.balance_due
+# คำนวณยอดสะสมด้วย window function ใน statement เดียว (snapshot เดียวกับ balance_due)
+# เริ่มจาก LedgerCheckpoint ของแต่ละบัญชี จึงอ่านเฉพาะรายการใหม่ตั้งแต่รอบก่อน
+
+_CENTS = Decimal('0.01')
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_ZERO_ID = uuid.UUID(int=0)
+
+_LEDGER_SQL = """
+WITH accounts AS (
+    SELECT a.id, a.user_id, a.balance_due, a.credit_limit,
+           COALESCE(c.last_created_at, %s) AS last_created_at,
+           COALESCE(c.last_transaction_id, %s) AS last_transaction_id,
+           COALESCE(c.balance, 0) AS opening
+      FROM {account} a
+      LEFT JOIN {checkpoint} c ON c.account_id = a.id
+     {account_filter}
+),
+ledger AS (
+    SELECT t.account_id, t.id, t.created_at, t.balance_due_after,
+           acc.opening + SUM(t.signed_amount) OVER (
+               PARTITION BY t.account_id ORDER BY t.created_at, t.id ROWS UNBOUNDED PRECEDING
+           ) AS expected,
+           ROW_NUMBER() OVER (PARTITION BY t.account_id ORDER BY t.created_at DESC, t.id DESC) AS rn,
+           COUNT(*) OVER (PARTITION BY t.account_id) AS scanned
+      FROM accounts acc
+      JOIN {txn} t ON t.account_id = acc.id
+     WHERE t.created_at >= acc.last_created_at
+       AND (t.created_at > acc.last_created_at OR t.id > acc.last_transaction_id)
+)
+SELECT acc.id, acc.user_id, acc.balance_due, acc.credit_limit, acc.opening,
+       l.id, l.created_at, l.balance_due_after, l.expected, l.rn, l.scanned
+  FROM accounts acc
+  LEFT JOIN ledger l ON l.account_id = acc.id AND (l.rn = 1 OR l.balance_due_after <> l.expected)
+ ORDER BY acc.id, l.created_at, l.id
+"""
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value)).quantize(_CENTS)
+
+
+def _scan(*, after: uuid.UUID | None = None, limit: int = 1000, account_id: uuid.UUID | None = None) -> list[dict]:
+    if account_id is not None:
+        account_filter = 'WHERE a.id = %s'
+        params = [_prep(WalletAccount, 'id', account_id)]
+    else:
+        account_filter = 'WHERE a.id > %s ORDER BY a.id LIMIT %s'
+        params = [_prep(WalletAccount, 'id', after or _ZERO_ID), limit]
+
+    sql = _LEDGER_SQL.format(
+        account=WalletAccount._meta.db_table,
+        checkpoint=LedgerCheckpoint._meta.db_table,
+        txn=WalletTransaction._meta.db_table,
+        account_filter=account_filter,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [
+            _prep(LedgerCheckpoint, 'last_created_at', _EPOCH),
+            _prep(LedgerCheckpoint, 'last_transaction_id', _ZERO_ID),
+            *params,
+        ])
+        rows = cursor.fetchall()
+
+    to_uuid = WalletAccount._meta.pk.to_python
+    to_datetime = WalletTransaction._meta.get_field('created_at')
+
+    reports = {}
+    for (acc_id, user_id, balance_due, credit_limit, opening,
+         txn_id, created_at, recorded, expected, rn, scanned) in rows:
+        acc_id = to_uuid(acc_id)
+        report = reports.get(acc_id)
+        if report is None:
+            report = reports[acc_id] = {
+                'account_id': acc_id,
+                'user_id': to_uuid(user_id),
+                'balance_due': _money(balance_due),
+                'credit_limit': _money(credit_limit),
+                'expected_balance': _money(opening),
+                'scanned': 0,
+                'last': None,
+                'mismatches': [],
+            }
+        if txn_id is None:
+            continue
+
+        txn_id = to_uuid(txn_id)
+        expected = _money(expected)
+        if _money(recorded) != expected:
+            report['mismatches'].append((txn_id, _money(recorded), expected))
+        if rn == 1:
+            created_at = to_datetime.to_python(created_at)
+            if timezone.is_naive(created_at):
+                created_at = timezone.make_aware(created_at, dt_timezone.utc)
+            report['last'] = (created_at, txn_id)
+            report['expected_balance'] = expected
+            report['scanned'] = scanned
+
+    for report in reports.values():
+        report['balance_ok'] = report['balance_due'] == report['expected_balance']
+        report['ok'] = report['balance_ok'] and not report['mismatches']
+
+    return list(reports.values())
+
+
+def _save_checkpoints(reports: list[dict]) -> None:
+    LedgerCheckpoint.objects.bulk_create(
+        [
+            LedgerCheckpoint(
+                account_id=report['account_id'],
+                last_created_at=report['last'][0],
+                last_transaction_id=report['last'][1],
+                balance=report['expected_balance'],
+            )
+            for report in reports
+            if report['last'] is not None
+        ],
+        update_conflicts=True,
+        unique_fields=['account'],
+        update_fields=['last_created_at', 'last_transaction_id', 'balance', 'checked_at'],
+    )
+
+
+@transaction.atomic
+def repair_account_ledger(*, account_id: uuid.UUID) -> dict:
+    # lock บัญชีก่อนแล้วตรวจใหม่ กันรายการที่เข้ามาระหว่างทาง ยึด signed_amount ใน ledger เป็นหลัก
+    WalletAccount.objects.select_for_update().filter(pk=account_id).values_list('pk', flat=True).get()
+    report = _scan(account_id=account_id)[0]
+
+    if report['mismatches']:
+        WalletTransaction.objects.bulk_update(
+            [
+                WalletTransaction(id=txn_id, balance_due_after=expected)
+                for txn_id, _, expected in report['mismatches']
+            ],
+            ['balance_due_after'],
+            batch_size=1000
+        )
+
+    if not report['balance_ok']:
+        WalletAccount.objects.filter(pk=account_id).update(
+            balance_due=report['expected_balance'],
+            updated_at=timezone.now()
+        )
+        invalidate_credit_summary_on_commit(report['user_id'])
+
+    _save_checkpoints([report])
+    report['repaired'] = not report['ok']
+    return report
+
+
+def reconcile_ledger(*, batch_size: int = 1000, repair: bool = False):
+    # ไล่ทุกบัญชีตาม id ทีละ batch, yield (จำนวนบัญชี, จำนวนรายการที่อ่าน, report ของบัญชีที่ไม่ตรง)
+    # บัญชีที่ไม่ตรงและไม่ได้ repair จะไม่ขยับ checkpoint จึงถูกรายงานซ้ำทุกรอบจนกว่าจะแก้
+    after = None
+    while True:
+        reports = _scan(after=after, limit=batch_size)
+        if not reports:
+            return
+        after = reports[-1]['account_id']
+
+        clean = [report for report in reports if report['ok']]
+        problems = [report for report in reports if not report['ok']]
+        _save_checkpoints(clean)
+
+        if repair:
+            problems = [repair_account_ledger(account_id=report['account_id']) for report in problems]
+            problems = [report for report in problems if report['repaired']]
+
+        yield len(reports), sum(report['scanned'] for report in reports), problems
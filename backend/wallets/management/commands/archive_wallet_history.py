@@ -0,0 +1,51 @@
+import time
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wallets.archive import archive_wallet_history
+from wallets.models import WalletTransaction
+
+
+class Command(BaseCommand):
+    help = (
+        'ย้ายประวัติที่จ่ายครบแล้วที่เก่ากว่า --months เดือนไปเป็นไฟล์ใน cold storage ทีละบัญชี '
+        '(เขียนไฟล์ ตรวจ checksum แล้วจึงลบจาก DB) ควรรันหลัง reconcile_ledger'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months', type=int, default=settings.WALLET_ARCHIVE_AFTER_MONTHS)
+        parser.add_argument('--batch-size', type=int, default=100, help='จำนวนบัญชีต่อ batch')
+        parser.add_argument('--dry-run', action='store_true', help='นับจำนวนรายการที่เก่ากว่ากำหนดเท่านั้น')
+
+    def handle(self, *args, **options):
+        before = timezone.now() - relativedelta(months=options['months'])
+
+        if options['dry_run']:
+            count = WalletTransaction.objects.filter(created_at__lt=before).count()
+            self.stdout.write(
+                f'[dry-run] {count} transactions older than {before:%Y-%m-%d} '
+                f'(เฉพาะที่จ่ายครบและ reconcile แล้วจะถูกย้าย)'
+            )
+            return
+
+        started = time.perf_counter()
+        accounts = archived_accounts = transactions = bills = size = 0
+
+        for checked, archives in archive_wallet_history(before=before, batch_size=options['batch_size']):
+            accounts += checked
+            archived_accounts += len(archives)
+            for archive in archives:
+                transactions += archive.transaction_count
+                bills += archive.bill_count
+                size += archive.size
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'  {archive.path}: {archive.transaction_count} txns / {archive.bill_count} bills')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {transactions} transactions / {bills} bills of {archived_accounts}/{accounts} accounts '
+            f'({size / 1024 / 1024:.1f} MB) in {elapsed:.2f}s ({transactions / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
@@ -0,0 +1,260 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from merchants.models import Merchant, MerchantStatus, Product
+from wallets.management.commands.bench_checkout import _percentile
+from wallets.management.commands.bench_db_pool import _CONNECTIONS_SQL
+from wallets.models import WalletAccount, PaymentRequest
+from wallets.services import execute_bnpl_transaction
+
+# --compare รันแต่ละโหมดใน process ใหม่ เพราะ urls เลือก view sync / async จาก ASYNC_READ_VIEWS ตอน import
+# ทั้งสองโหมดใช้ DB_POOL ขนาดเท่า --threads ให้ได้ connection เท่ากัน
+MODES = {
+    'wsgi': {'ASYNC_READ_VIEWS': 'False'},
+    'asgi': {'ASYNC_READ_VIEWS': 'True'},
+}
+
+ENDPOINTS = (
+    ('wallets:customer-credit-summary', False),
+    ('wallets:home-list-bills', False),
+    ('wallets:customer-unpaid-bills', False),
+    ('wallets:list-transactions', False),
+    ('wallets:my-transaction-history', False),
+    ('shop-details', True),
+    ('merchant-products-dict', True),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test ของ endpoint อ่านอย่างเดียว: WSGI (thread ละ request แบบ gunicorn --threads) เทียบ ASGI (event loop เดียว) '
+        'ที่ concurrency สูง จำลอง client มือถือที่รับ response ช้า (--client-ms) วัด throughput และ latency p50/p99'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500, help='จำนวน client พร้อมกัน')
+        parser.add_argument('--requests', type=int, default=4, help='จำนวน request ต่อ client')
+        parser.add_argument('--threads', type=int, default=32, help='worker thread ของ WSGI และขนาด DB pool')
+        parser.add_argument('--client-ms', type=float, default=1000, help='เวลาที่ client (มือถือเน็ตช้า) ใช้รับ response')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--compare', action='store_true', help='รันทั้ง WSGI และ ASGI แล้วเทียบกัน')
+        parser.add_argument('--keep', action='store_true', help='ไม่ลบข้อมูลที่ seed ไว้หลังจบ')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self._compare(options)
+            return
+
+        run_id = uuid.uuid4().hex[:8]
+        merchant, tokens = self._seed(run_id, options['users'])
+        paths = [
+            reverse(name, args=[merchant.id]) if per_merchant else reverse(name)
+            for name, per_merchant in ENDPOINTS
+        ]
+
+        try:
+            mode = 'asgi' if settings.ASYNC_READ_VIEWS else 'wsgi'
+            result = asyncio.run(self._drive(mode, paths, tokens, options))
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(username__startswith=f'bench-{run_id}-').delete()
+                merchant.delete()
+
+        self._report(mode, result, options)
+
+    def _compare(self, options):
+        argv = [
+            sys.executable, '-m', 'django', 'bench_asgi',
+            '--clients', str(options['clients']),
+            '--requests', str(options['requests']),
+            '--threads', str(options['threads']),
+            '--client-ms', str(options['client_ms']),
+            '--users', str(options['users']),
+        ]
+        pool = {'DB_POOL': 'True', 'DB_POOL_MAX_SIZE': str(options['threads'])}
+        for name, env in MODES.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} =='))
+            self.stdout.flush()
+            subprocess.run(argv, env={**os.environ, **pool, **env}, check=True)
+
+    def _seed(self, run_id: str, customers: int):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name=f'Bench {run_id}', tax_id=f'A{run_id}', status=active_status)
+        Product.objects.bulk_create(
+            Product(id=f'{run_id}{i}', merchant=merchant, name=f'Product {i}', price=Decimal('9.00'))
+            for i in range(10)
+        )
+
+        User = get_user_model()
+        users = [
+            User.objects.create_user(
+                username=f'bench-{run_id}-{i}',
+                email=f'bench-{run_id}-{i}@example.com',
+                password=None,
+            )
+            for i in range(customers)
+        ]
+        WalletAccount.objects.filter(user__in=users).update(credit_limit=Decimal('99999999.00'))
+        for user in users:
+            for _ in range(5):
+                req = PaymentRequest.objects.create(merchant=merchant, amount=Decimal('100.00'))
+                execute_bnpl_transaction(user=user, payment_request_id=req.id, installment_months=3)
+
+        connection.close()
+        return merchant, [str(AccessToken.for_user(user)) for user in users]
+
+    async def _drive(self, mode: str, paths: list[str], tokens: list[str], options: dict) -> dict:
+        host = next((h for h in settings.ALLOWED_HOSTS if h != '*' and not h.startswith('.')), 'localhost')
+        client_delay = options['client_ms'] / 1000
+        handle = self._wsgi_handler(host, client_delay, options['threads']) if mode == 'wsgi' \
+            else self._asgi_handler(host, client_delay)
+
+        latencies: list[float] = []
+        errors: dict[int, int] = {}
+
+        async def client(i: int):
+            for n in range(options['requests']):
+                started = time.perf_counter()
+                status = await handle(paths[(i + n) % len(paths)], tokens[i % len(tokens)])
+                if status == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[status] = errors.get(status, 0) + 1
+
+        peak = {'threads': 0, 'connections': 0}
+        done = threading.Event()
+
+        def monitor():
+            db = connection.Database.connect(**connection.get_connection_params())
+            db.autocommit = True
+            try:
+                with db.cursor() as cursor:
+                    while not done.wait(0.02):
+                        cursor.execute(_CONNECTIONS_SQL)
+                        peak['connections'] = max(peak['connections'], cursor.fetchone()[0])
+                        peak['threads'] = max(peak['threads'], threading.active_count() - 1)
+            finally:
+                db.close()
+
+        watcher = threading.Thread(target=monitor)
+        watcher.start()
+        wall_started = time.perf_counter()
+        try:
+            await asyncio.gather(*(client(i) for i in range(options['clients'])))
+        finally:
+            wall = time.perf_counter() - wall_started
+            done.set()
+            watcher.join()
+
+        return {'latencies': latencies, 'errors': errors, 'wall': wall, **peak}
+
+    def _wsgi_handler(self, host: str, client_delay: float, threads: int):
+        application = get_wsgi_application()
+        executor = ThreadPoolExecutor(max_workers=threads)
+
+        def run(path: str, token: str) -> int:
+            # worker thread ถูกถือไว้ตลอดจนส่ง response ให้ client ช้าครบ
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': path,
+                'QUERY_STRING': '',
+                'SERVER_NAME': host,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': host,
+                'HTTP_AUTHORIZATION': f'Bearer {token}',
+                'wsgi.version': (1, 0),
+                'wsgi.url_scheme': 'http',
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr,
+                'wsgi.multithread': True,
+                'wsgi.multiprocess': False,
+                'wsgi.run_once': False,
+            }
+            statuses = []
+            body = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                for _ in body:
+                    pass
+                time.sleep(client_delay)
+            finally:
+                body.close()
+            return int(statuses[0].split()[0])
+
+        async def handle(path: str, token: str) -> int:
+            return await asyncio.get_running_loop().run_in_executor(executor, run, path, token)
+
+        return handle
+
+    def _asgi_handler(self, host: str, client_delay: float):
+        application = get_asgi_application()
+
+        async def handle(path: str, token: str) -> int:
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': path,
+                'raw_path': path.encode(),
+                'query_string': b'',
+                'root_path': '',
+                'headers': [(b'host', host.encode()), (b'authorization', f'Bearer {token}'.encode())],
+                'client': ('127.0.0.1', 50000),
+                'server': (host, 80),
+            }
+            statuses = []
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # client ไม่ตัดสาย: รอจน Django ยกเลิกเองหลังส่ง response
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    # ส่ง response ให้ client ช้า: รอได้โดยไม่ถือ thread
+                    await asyncio.sleep(client_delay)
+
+            await application(scope, receive, send)
+            return statuses[0]
+
+        return handle
+
+    def _report(self, mode: str, result: dict, options: dict):
+        latencies = [v * 1000 for v in result['latencies']]
+        ok = len(latencies)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'[{mode}] clients={options["clients"]} client_ms={options["client_ms"]:.0f}'
+        ))
+        self.stdout.write(f'  ok={ok} errors={sum(result["errors"].values())} wall={result["wall"]:.2f}s '
+                          f'throughput={ok / result["wall"]:.1f} req/s')
+        self.stdout.write(f'  peak threads={result["threads"]} db connections={result["connections"]}')
+        if latencies:
+            self.stdout.write(f'  latency   p50={_percentile(latencies, 50):.2f}ms p99={_percentile(latencies, 99):.2f}ms')
+        for status_code, count in sorted(result['errors'].items()):
+            self.stdout.write(self.style.WARNING(f'  HTTP {status_code}: {count}'))
@@ -0,0 +1,225 @@
+import statistics
+import threading
+import time
+import uuid
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from merchants.models import Merchant, MerchantStatus, MerchantUser
+from wallets.models import WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill
+from wallets.services import BNPLServiceError, execute_bnpl_transaction
+
+
+@transaction.atomic
+def legacy_execute_bnpl_transaction(
+        *,
+        user: settings.AUTH_USER_MODEL,
+        payment_request_id: uuid.UUID,
+        installment_months: int
+) -> WalletTransaction:
+    # สำเนาของ execute_bnpl_transaction เวอร์ชันก่อนหน้า เก็บไว้เป็น baseline ของ benchmark
+
+    try:
+        req = PaymentRequest.objects.get(id=payment_request_id)
+    except PaymentRequest.DoesNotExist:
+        raise BNPLServiceError("Payment Request นี้ไม่มีอยู่จริง")
+
+    if req.status != PaymentRequest.Status.PENDING:
+        raise BNPLServiceError(f"ไม่สามารถทำรายการได้เนื่องจากสถานะเป็น '{req.status}'")
+
+    amount = req.amount
+    merchant = req.merchant
+
+    if MerchantUser.objects.filter(user=user, merchant=merchant).exists():
+        raise BNPLServiceError("ร้านค้าไม่สามารถทำรายการชำระเงินให้ตัวเองได้")
+
+    try:
+        account = WalletAccount.objects.select_for_update().get(user=user)
+    except WalletAccount.DoesNotExist:
+        raise BNPLServiceError("ไม่พบบัญชีเครดิต (WalletAccount) ของผู้ใช้")
+
+    available_credit = account.credit_limit - account.balance_due
+    if available_credit < amount:
+        raise BNPLServiceError(f"วงเงินไม่เพียงพอ (คงเหลือ: {available_credit})")
+
+    new_txn = WalletTransaction.objects.create(
+        account=account,
+        type_code=WalletTransaction.TxnType.PAYMENT,
+        signed_amount=amount,
+        balance_due_after=account.balance_due + amount,
+        payment_request=req
+    )
+
+    account.balance_due += amount
+    account.save()
+
+    req.status = PaymentRequest.Status.PAID
+    req.customer = user
+    req.paid_at = timezone.now()
+    req.save()
+
+    merchant.receivable_balance = F('receivable_balance') + amount
+    merchant.save()
+
+    monthly_amount = (amount / Decimal(installment_months)).quantize(
+        Decimal('0.01'), rounding=ROUND_HALF_UP
+    )
+    final_amount = amount - (monthly_amount * (installment_months - 1))
+
+    today = date.today()
+    bills_to_create = []
+    for i in range(installment_months):
+        current_amount = final_amount if (i == installment_months - 1) else monthly_amount
+        bills_to_create.append(
+            InstallmentBill(
+                transaction=new_txn,
+                account=account,
+                amount_due=current_amount,
+                due_date=today + relativedelta(months=i + 1),
+                status=InstallmentBill.Status.PENDING
+            )
+        )
+
+    InstallmentBill.objects.bulk_create(bills_to_create)
+
+    return new_txn
+
+
+IMPLEMENTATIONS = {
+    'legacy': legacy_execute_bnpl_transaction,
+    'current': execute_bnpl_transaction,
+}
+
+
+def _percentile(values: list[float], pct: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[pct - 1]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark execute_bnpl_transaction (latency p50/p99 และเวลาที่ถือ lock ของ WalletAccount) เทียบกับเวอร์ชันเดิม'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=20)
+        parser.add_argument('--payments', type=int, default=25, help='จำนวนรายการต่อลูกค้า')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--months', type=int, default=3)
+        parser.add_argument('--impl', choices=[*IMPLEMENTATIONS, 'both'], default='both')
+        parser.add_argument('--keep', action='store_true', help='ไม่ลบข้อมูลที่ seed ไว้หลังจบ')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        merchant, users = self._seed(run_id, options['customers'])
+
+        try:
+            impls = list(IMPLEMENTATIONS) if options['impl'] == 'both' else [options['impl']]
+            for name in impls:
+                result = self._run(
+                    IMPLEMENTATIONS[name], merchant, users,
+                    payments=options['payments'],
+                    threads=options['threads'],
+                    months=options['months'],
+                )
+                self._report(name, result)
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(username__startswith=f'bench-{run_id}-').delete()
+                merchant.delete()
+
+    def _seed(self, run_id: str, customers: int):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name=f'Bench {run_id}', tax_id=f'B{run_id}', status=active_status)
+
+        User = get_user_model()
+        users = [
+            User.objects.create_user(
+                username=f'bench-{run_id}-{i}',
+                email=f'bench-{run_id}-{i}@example.com',
+                password=None,
+            )
+            for i in range(customers)
+        ]
+        WalletAccount.objects.filter(user__in=users).update(credit_limit=Decimal('99999999.00'))
+        return merchant, users
+
+    def _run(self, impl, merchant: Merchant, users: list, *, payments: int, threads: int, months: int) -> dict:
+        requests = PaymentRequest.objects.bulk_create(
+            PaymentRequest(merchant=merchant, amount=Decimal('100.00'))
+            for _ in range(len(users) * payments)
+        )
+        tasks = [(users[i % len(users)], req.id) for i, req in enumerate(requests)]
+
+        latencies: list[float] = []
+        lock_holds: list[float] = []
+        errors: list[str] = []
+        results_lock = threading.Lock()
+        account_table = WalletAccount._meta.db_table
+
+        def worker(chunk):
+            lock_started = {}
+
+            def track_lock(execute, sql, params, many, context):
+                if account_table in sql and ('FOR UPDATE' in sql or sql.lstrip().upper().startswith('UPDATE')):
+                    lock_started.setdefault('t', time.perf_counter())
+                return execute(sql, params, many, context)
+
+            try:
+                with connection.execute_wrapper(track_lock):
+                    for user, req_id in chunk:
+                        lock_started.clear()
+                        started = time.perf_counter()
+                        try:
+                            impl(user=user, payment_request_id=req_id, installment_months=months)
+                        except BNPLServiceError as e:
+                            with results_lock:
+                                errors.append(str(e))
+                            continue
+                        finished = time.perf_counter()
+
+                        with results_lock:
+                            latencies.append(finished - started)
+                            if 't' in lock_started:
+                                lock_holds.append(finished - lock_started['t'])
+            finally:
+                connection.close()
+
+        chunks = [tasks[i::threads] for i in range(threads)]
+        pool = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks if chunk]
+
+        wall_started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        wall = time.perf_counter() - wall_started
+
+        return {
+            'latencies': latencies,
+            'lock_holds': lock_holds,
+            'errors': errors,
+            'wall': wall,
+        }
+
+    def _report(self, name: str, result: dict):
+        latencies = [v * 1000 for v in result['latencies']]
+        lock_holds = [v * 1000 for v in result['lock_holds']]
+        ok = len(latencies)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'[{name}]'))
+        self.stdout.write(f'  ok={ok} errors={len(result["errors"])} wall={result["wall"]:.2f}s '
+                          f'throughput={ok / result["wall"]:.1f} txn/s')
+        if latencies:
+            self.stdout.write(f'  latency   p50={_percentile(latencies, 50):.2f}ms p99={_percentile(latencies, 99):.2f}ms')
+        if lock_holds:
+            self.stdout.write(f'  lock hold p50={_percentile(lock_holds, 50):.2f}ms p99={_percentile(lock_holds, 99):.2f}ms')
+        for message in sorted(set(result['errors']))[:5]:
+            self.stdout.write(self.style.WARNING(f'  error: {message}'))
@@ -0,0 +1,193 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from merchants.models import Merchant, MerchantStatus
+from wallets.management.commands.bench_checkout import _percentile
+from wallets.models import WalletAccount, PaymentRequest
+from wallets.services import BNPLServiceError, execute_bnpl_transaction, execute_bulk_bill_repayment
+
+# --compare รัน benchmark ซ้ำใน process ใหม่ต่อโหมด เพราะ pool / prepare_threshold ถูกอ่านจาก settings ตอนเปิด connection
+MODES = {
+    'persistent': {'DB_POOL': 'False', 'DB_PREPARED_STATEMENTS': 'False'},
+    'pool': {'DB_POOL': 'True', 'DB_PREPARED_STATEMENTS': 'False'},
+    'pool+prepared': {'DB_POOL': 'True', 'DB_PREPARED_STATEMENTS': 'True'},
+}
+
+_CONNECTIONS_SQL = """
+SELECT count(*) FROM pg_stat_activity
+ WHERE datname = current_database() AND backend_type = 'client backend' AND pid <> pg_backend_pid()
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Load benchmark ของ connection: thread จำลอง worker ของ web server ทำ checkout สลับกับจ่ายบิล '
+        'วัด latency p50/p99 และจำนวน connection ที่เปิดค้างกับ DB (ตาม DB_POOL / DB_PREPARED_STATEMENTS ใน .env)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=32, help='จำนวน worker thread')
+        parser.add_argument('--requests', type=int, default=40, help='จำนวน request ต่อ thread')
+        parser.add_argument('--think-ms', type=float, default=5, help='เวลาพักระหว่าง request (ไม่ถือ connection)')
+        parser.add_argument('--months', type=int, default=3)
+        parser.add_argument('--compare', action='store_true', help=f'รันทุกโหมด ({", ".join(MODES)}) แล้วเทียบกัน')
+        parser.add_argument('--keep', action='store_true', help='ไม่ลบข้อมูลที่ seed ไว้หลังจบ')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            self._compare(options)
+            return
+
+        run_id = uuid.uuid4().hex[:8]
+        merchant, users = self._seed(run_id, options['threads'])
+        baseline = self._connections()
+
+        try:
+            result = self._run(merchant, users, options)
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(username__startswith=f'bench-{run_id}-').delete()
+                merchant.delete()
+
+        pool = settings.DATABASES['default']['OPTIONS'].get('pool')
+        mode = f'pool max_size={pool["max_size"]}' if pool else f'CONN_MAX_AGE={settings.DATABASES["default"]["CONN_MAX_AGE"]}'
+        self._report(f'{mode} prepared={settings.DB_PREPARED_STATEMENTS}', result, baseline)
+
+    def _compare(self, options):
+        argv = [
+            sys.executable, '-m', 'django', 'bench_db_pool',
+            '--threads', str(options['threads']),
+            '--requests', str(options['requests']),
+            '--think-ms', str(options['think_ms']),
+            '--months', str(options['months']),
+        ]
+        for name, env in MODES.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {name} =='))
+            self.stdout.flush()
+            subprocess.run(argv, env={**os.environ, **env}, check=True)
+
+    def _seed(self, run_id: str, customers: int):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name=f'Bench {run_id}', tax_id=f'P{run_id}', status=active_status)
+
+        User = get_user_model()
+        users = [
+            User.objects.create_user(
+                username=f'bench-{run_id}-{i}',
+                email=f'bench-{run_id}-{i}@example.com',
+                password=None,
+            )
+            for i in range(customers)
+        ]
+        WalletAccount.objects.filter(user__in=users).update(credit_limit=Decimal('99999999.00'))
+        # seed เสร็จแล้วคืน connection ของ main thread ให้เหลือแต่ connection ของ worker ในตัวเลข
+        connection.close()
+        return merchant, users
+
+    def _connections(self) -> int:
+        # นับจาก connection แยก (ไม่ยืมจาก pool) ไม่นับตัวเอง
+        monitor = connection.Database.connect(**connection.get_connection_params())
+        try:
+            with monitor.cursor() as cursor:
+                cursor.execute(_CONNECTIONS_SQL)
+                return cursor.fetchone()[0]
+        finally:
+            monitor.close()
+
+    def _run(self, merchant: Merchant, users: list, options: dict) -> dict:
+        requests_per_thread = options['requests']
+        checkouts = (requests_per_thread + 1) // 2
+        payment_requests = PaymentRequest.objects.bulk_create(
+            PaymentRequest(merchant=merchant, amount=Decimal('100.00'))
+            for _ in range(len(users) * checkouts)
+        )
+        connection.close()
+
+        latencies = {'checkout': [], 'repayment': []}
+        errors: list[str] = []
+        results_lock = threading.Lock()
+        done = threading.Event()
+        peak = [0]
+
+        def monitor():
+            db = connection.Database.connect(**connection.get_connection_params())
+            # pg_stat_activity เป็น snapshot ต่อ transaction ต้อง autocommit ถึงจะเห็นค่าใหม่ทุกรอบ
+            db.autocommit = True
+            try:
+                with db.cursor() as cursor:
+                    while not done.wait(0.02):
+                        cursor.execute(_CONNECTIONS_SQL)
+                        peak[0] = max(peak[0], cursor.fetchone()[0])
+            finally:
+                db.close()
+
+        def worker(user, req_ids):
+            # 1 รอบ = 1 request: เปิด/คืน connection ตามจังหวะของ request_started / request_finished
+            pending = []
+            try:
+                for i in range(requests_per_thread):
+                    close_old_connections()
+                    if i % 2 == 0:
+                        kind = 'checkout'
+                        call = lambda: pending.append(execute_bnpl_transaction(
+                            user=user, payment_request_id=req_ids[i // 2], installment_months=options['months']
+                        ).id)
+                    else:
+                        kind = 'repayment'
+                        call = lambda: execute_bulk_bill_repayment(user=user, transaction_id=pending.pop())
+
+                    started = time.perf_counter()
+                    try:
+                        call()
+                    except BNPLServiceError as e:
+                        with results_lock:
+                            errors.append(str(e))
+                    else:
+                        with results_lock:
+                            latencies[kind].append(time.perf_counter() - started)
+                    close_old_connections()
+                    time.sleep(options['think_ms'] / 1000)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(user, [r.id for r in payment_requests[i::len(users)]]))
+            for i, user in enumerate(users)
+        ]
+        watcher = threading.Thread(target=monitor)
+        watcher.start()
+
+        wall_started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - wall_started
+
+        done.set()
+        watcher.join()
+        return {'latencies': latencies, 'errors': errors, 'wall': wall, 'peak': peak[0]}
+
+    def _report(self, name: str, result: dict, baseline: int):
+        ok = sum(len(values) for values in result['latencies'].values())
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'[{name}]'))
+        self.stdout.write(f'  ok={ok} errors={len(result["errors"])} wall={result["wall"]:.2f}s '
+                          f'throughput={ok / result["wall"]:.1f} req/s')
+        self.stdout.write(f'  connections peak={result["peak"]} (before run={baseline})')
+        for kind, values in result['latencies'].items():
+            values = [v * 1000 for v in values]
+            if values:
+                self.stdout.write(f'  {kind:<9} p50={_percentile(values, 50):.2f}ms p99={_percentile(values, 99):.2f}ms')
+        for message in sorted(set(result['errors']))[:5]:
+            self.stdout.write(self.style.WARNING(f'  error: {message}'))
@@ -0,0 +1,137 @@
+import io
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from JaiKorn.renderers import FastJSONParser, FastJSONRenderer, orjson
+from merchants.models import Merchant, MerchantStatus, ProductCategory, ProductFilter, Product
+from merchants.views import ShopAllDetailsListView
+from wallets.models import WalletAccount, PaymentRequest, WalletTransaction
+from wallets.serializers import TransactionHistorySerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark JSON renderer/parser ของ DRF เทียบกับ JaiKorn.renderers (orjson) บน payload all-details และประวัติรายการ'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merchants', type=int, default=200)
+        parser.add_argument('--products', type=int, default=20, help='จำนวนสินค้าต่อร้าน')
+        parser.add_argument('--transactions', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help='ไม่ลบข้อมูลที่ seed ไว้หลังจบ')
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('ไม่ได้ติดตั้ง orjson: FastJSONRenderer จะใช้ของ DRF (ผลจะเท่ากัน)'))
+
+        run_id = uuid.uuid4().hex[:8]
+        merchants, user = self._seed(run_id, options)
+
+        try:
+            view = ShopAllDetailsListView()
+            view.request = None
+            view.format_kwarg = None
+            all_details = view.build_snapshot()
+
+            txns = WalletTransaction.objects.filter(account__user=user).select_related(
+                'payment_request__merchant'
+            ).order_by('-created_at', '-id')
+            history = TransactionHistorySerializer(txns, many=True).data
+
+            for name, data in (('all-details', all_details), ('transaction-history', history)):
+                self._compare(name, data, options['repeat'])
+        finally:
+            if not options['keep']:
+                user.delete()
+                Merchant.objects.filter(pk__in=[m.pk for m in merchants]).delete()
+
+    def _seed(self, run_id: str, options: dict):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchants = Merchant.objects.bulk_create(
+            Merchant(name=f'Bench {run_id} ร้าน {i}', tax_id=f'J{run_id}{i:05d}', status=active_status)
+            for i in range(options['merchants'])
+        )
+
+        filters, sections, products = [], [], []
+        for i, merchant in enumerate(merchants):
+            filters.extend(ProductFilter(merchant=merchant, name=f'ตัวกรอง {n}') for n in range(3))
+            sections.extend(ProductCategory(merchant=merchant, name=f'หมวด {n}') for n in range(3))
+            products.extend(
+                Product(
+                    id=f'{run_id}-{i}-{n}', merchant=merchant, name=f'สินค้า {n}',
+                    price=Decimal('99.00'), is_highlight=n % 5 == 0
+                )
+                for n in range(options['products'])
+            )
+        ProductFilter.objects.bulk_create(filters)
+        sections = ProductCategory.objects.bulk_create(sections)
+        products = Product.objects.bulk_create(products)
+
+        section_of = {}
+        for section in sections:
+            section_of.setdefault(section.merchant_id, []).append(section)
+        Product.categories.through.objects.bulk_create(
+            Product.categories.through(
+                product=product, productcategory=section_of[product.merchant_id][n % 3]
+            )
+            for n, product in enumerate(products)
+        )
+
+        user = get_user_model().objects.create_user(
+            username=f'bench-json-{run_id}', email=f'bench-json-{run_id}@example.com', password=None
+        )
+        account = WalletAccount.objects.get(user=user)
+        requests = PaymentRequest.objects.bulk_create(
+            PaymentRequest(
+                merchant=merchants[i % len(merchants)], amount=Decimal('250.75'),
+                status=PaymentRequest.Status.PAID, customer=user, paid_at=timezone.now()
+            )
+            for i in range(options['transactions'])
+        )
+        WalletTransaction.objects.bulk_create(
+            WalletTransaction(
+                account=account, type_code=WalletTransaction.TxnType.PAYMENT,
+                signed_amount=Decimal('250.75'), balance_due_after=Decimal('0.00'), payment_request=req
+            )
+            for req in requests
+        )
+        return merchants, user
+
+    def _best(self, func, repeat: int) -> float:
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - started)
+        return best
+
+    def _compare(self, name: str, data, repeat: int):
+        drf_content = JSONRenderer().render(data)
+        fast_content = FastJSONRenderer().render(data)
+        size_mb = len(drf_content) / 1024 / 1024
+
+        timings = {
+            'render': (
+                self._best(lambda: JSONRenderer().render(data), repeat),
+                self._best(lambda: FastJSONRenderer().render(data), repeat),
+            ),
+            'parse': (
+                self._best(lambda: JSONParser().parse(io.BytesIO(drf_content)), repeat),
+                self._best(lambda: FastJSONParser().parse(io.BytesIO(drf_content)), repeat),
+            ),
+        }
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'[{name}] {len(drf_content):,} bytes (best of {repeat})'))
+        for step, (drf_time, fast_time) in timings.items():
+            self.stdout.write(
+                f'  {step:<6} drf {drf_time * 1000:8.2f}ms ({size_mb / drf_time:7.1f} MB/s)'
+                f'  fast {fast_time * 1000:8.2f}ms ({size_mb / fast_time:7.1f} MB/s)  x{drf_time / fast_time:.1f}'
+            )
+        if fast_content != drf_content:
+            self.stdout.write(self.style.ERROR('  output ไม่ตรงกับ JSONRenderer'))
@@ -0,0 +1,111 @@
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from merchants.models import Merchant, MerchantStatus
+from wallets.fastpath import HOME_BILL_COLUMNS, TRANSACTION_HISTORY_COLUMNS, home_bill_rows, transaction_history_rows
+from wallets.models import WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill
+from wallets.serializers import HomeBillSerializer, TransactionHistorySerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark การ render list บิล/ประวัติรายการ (rows/s) ระหว่าง serializer เดิมกับ wallets.fastpath'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help='จำนวนรายการ (และบิล) ของลูกค้าที่ seed')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keep', action='store_true', help='ไม่ลบข้อมูลที่ seed ไว้หลังจบ')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        merchant, user = self._seed(run_id, options['rows'])
+
+        try:
+            bills = InstallmentBill.objects.filter(account__user=user).select_related(
+                'transaction__payment_request__merchant'
+            ).order_by('due_date', 'id')
+            txns = WalletTransaction.objects.filter(account__user=user).select_related(
+                'payment_request__merchant'
+            ).order_by('-created_at', '-id')
+
+            cases = {
+                'home-bills': (
+                    lambda: HomeBillSerializer(bills, many=True).data,
+                    lambda: home_bill_rows(bills.values(*HOME_BILL_COLUMNS)),
+                ),
+                'transaction-history': (
+                    lambda: TransactionHistorySerializer(txns, many=True).data,
+                    lambda: transaction_history_rows(txns.values(*TRANSACTION_HISTORY_COLUMNS)),
+                ),
+            }
+            for name, (serializer_impl, fast_impl) in cases.items():
+                self._compare(name, serializer_impl, fast_impl, options['repeat'])
+        finally:
+            if not options['keep']:
+                user.delete()
+                merchant.delete()
+
+    def _seed(self, run_id: str, rows: int):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name=f'Bench {run_id}', tax_id=f'L{run_id}', status=active_status)
+        user = get_user_model().objects.create_user(
+            username=f'bench-list-{run_id}', email=f'bench-list-{run_id}@example.com', password=None
+        )
+        account = WalletAccount.objects.get(user=user)
+
+        today = timezone.localdate()
+        requests = PaymentRequest.objects.bulk_create(
+            PaymentRequest(
+                merchant=merchant, amount=Decimal('100.00'),
+                status=PaymentRequest.Status.PAID, customer=user, paid_at=timezone.now()
+            )
+            for _ in range(rows // 2)
+        )
+        txns = WalletTransaction.objects.bulk_create(
+            WalletTransaction(
+                account=account,
+                type_code=WalletTransaction.TxnType.PAYMENT if i < len(requests) else WalletTransaction.TxnType.REPAYMENT,
+                signed_amount=Decimal('100.00'),
+                balance_due_after=Decimal('0.00'),
+                payment_request=requests[i] if i < len(requests) else None,
+            )
+            for i in range(rows)
+        )
+        statuses = list(InstallmentBill.Status)
+        InstallmentBill.objects.bulk_create(
+            InstallmentBill(
+                transaction=txn, account=account, amount_due=Decimal('33.33'),
+                due_date=today + timedelta(days=i % 90 - 30), status=statuses[i % len(statuses)]
+            )
+            for i, txn in enumerate(txns)
+        )
+        return merchant, user
+
+    def _measure(self, impl, repeat: int) -> tuple[float, bytes]:
+        renderer = JSONRenderer()
+        best = float('inf')
+        content = b''
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = impl()
+            content = renderer.render(data)
+            best = min(best, time.perf_counter() - started)
+        return best, content
+
+    def _compare(self, name: str, serializer_impl, fast_impl, repeat: int):
+        serializer_time, serializer_content = self._measure(serializer_impl, repeat)
+        fast_time, fast_content = self._measure(fast_impl, repeat)
+        rows = len(fast_impl())
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'[{name}] rows={rows} (best of {repeat}, query + render)'))
+        self.stdout.write(f'  serializer {rows / serializer_time:>10.0f} rows/s  ({serializer_time * 1000:.1f}ms)')
+        self.stdout.write(f'  fastpath   {rows / fast_time:>10.0f} rows/s  ({fast_time * 1000:.1f}ms)'
+                          f'  x{serializer_time / fast_time:.1f}')
+        if fast_content != serializer_content:
+            self.stdout.write(self.style.ERROR('  output ไม่ตรงกับ serializer'))
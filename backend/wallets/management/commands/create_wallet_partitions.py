@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallets.partitions import PARTITIONED_MODELS, PartitioningError, ensure_partitions
+
+
+class Command(BaseCommand):
+    help = 'สร้าง partition รายเดือนล่วงหน้าของ WalletTransaction / InstallmentBill ที่ยังไม่มี (รันทุกวัน รันซ้ำได้)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int,
+            help='จำนวนเดือนล่วงหน้า ค่าเริ่มต้นตาม PARTITIONED_MODELS (รายการ 2 เดือน, บิล 14 เดือน)'
+        )
+
+    def handle(self, *args, **options):
+        for model in PARTITIONED_MODELS:
+            try:
+                created = ensure_partitions(model, months_ahead=options['months_ahead'])
+            except PartitioningError as e:
+                raise CommandError(str(e))
+
+            self.stdout.write(f'{model._meta.db_table}: created {len(created)} partitions')
+            for name in created:
+                self.stdout.write(f'  {name}')
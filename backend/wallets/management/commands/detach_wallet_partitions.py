@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallets.partitions import PARTITIONED_MODELS, PartitioningError, detach_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        'ถอด partition ของ WalletTransaction / InstallmentBill ที่เก่ากว่า --older-than เดือนออกจากตารางแม่ '
+        '(ตารางที่ถอดยังอยู่ให้ archive ต่อ) ข้าม partition ที่ยังมีบิลค้างจ่าย'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=24, help='จำนวนเดือนที่เก็บไว้ในตารางหลัก')
+        parser.add_argument('--drop', action='store_true', help='ลบตารางที่ถอดออกทิ้งเลย')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError('--older-than ต้องมากกว่า 0')
+
+        for model in PARTITIONED_MODELS:
+            detached = skipped = 0
+            try:
+                for name, done in detach_partitions(
+                    model, older_than_months=options['older_than'], drop=options['drop']
+                ):
+                    if done:
+                        detached += 1
+                        self.stdout.write(f'  {"dropped" if options["drop"] else "detached"} {name}')
+                    else:
+                        skipped += 1
+                        self.stdout.write(self.style.WARNING(f'  skipped {name}: ยังมีบิลค้างจ่าย'))
+            except PartitioningError as e:
+                raise CommandError(str(e))
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.db_table}: detached {detached} partitions, skipped {skipped}'
+            ))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wallets.services import expire_payment_requests
+
+
+class Command(BaseCommand):
+    help = 'เปลี่ยน PaymentRequest ที่ PENDING แต่หมดอายุแล้วเป็น EXPIRED (รันตาม schedule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        total = batches = 0
+
+        for updated in expire_payment_requests(now=timezone.now(), batch_size=options['batch_size']):
+            total += updated
+            batches += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Expired {total} payment requests in {batches} batches, {elapsed:.2f}s'
+        ))
@@ -0,0 +1,88 @@
+import time as timer
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+import django
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from wallets.services import generate_statement_partition, statement_partitions
+
+
+def _init_worker():
+    # process ลูกต้องเปิด connection ของตัวเอง ห้ามใช้ของ parent ต่อ
+    django.setup()
+    connections.close_all()
+
+
+def _generate_partition(period, first_account_id, last_account_id, txn_batch_size):
+    try:
+        partition = generate_statement_partition(
+            period=period,
+            first_account_id=first_account_id,
+            last_account_id=last_account_id,
+            txn_batch_size=txn_batch_size
+        )
+        return partition.statement_count, partition.transaction_count, partition.elapsed_seconds
+    finally:
+        connections.close_all()
+
+
+def _month(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m').date()
+
+
+class Command(BaseCommand):
+    help = 'สร้าง Statement รายเดือนของทุก WalletAccount แบ่งบัญชีเป็นช่วง id แล้วรันแต่ละช่วงใน process pool (รันซ้ำได้)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', type=_month, help='เดือนของ statement (YYYY-MM) ค่าเริ่มต้นคือเดือนที่แล้ว')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--partition-size', type=int, default=5000, help='จำนวนบัญชีต่อ partition (1 partition = 1 transaction)')
+        parser.add_argument('--txn-batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        this_month = timezone.localdate().replace(day=1)
+        period = options['month'] or this_month - relativedelta(months=1)
+        if period >= this_month:
+            raise CommandError('สร้าง statement ได้เฉพาะเดือนที่ปิดไปแล้วเท่านั้น')
+
+        partitions = list(statement_partitions(period=period, size=options['partition_size']))
+        self.stdout.write(f'Generating statements for {period:%Y-%m} in {len(partitions)} partitions')
+        if not partitions:
+            return
+
+        started = timer.perf_counter()
+        statements = transactions = failed = 0
+
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(_generate_partition, period, first, last, options['txn_batch_size']): (first, last)
+                for first, last in partitions
+            }
+            for future in as_completed(futures):
+                first, last = futures[future]
+                try:
+                    count, txn_count, elapsed = future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(self.style.ERROR(
+                        f'Partition {first}..{last} failed (จะถูกสร้างใหม่ในรอบถัดไป): {e}'
+                    ))
+                    continue
+
+                statements += count
+                transactions += txn_count
+                self.stdout.write(
+                    f'  {first}..{last}: {count} statements / {txn_count} txns in {elapsed:.2f}s '
+                    f'({count / elapsed if elapsed else 0:.0f} accounts/s)'
+                )
+
+        elapsed = timer.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {statements} statements from {transactions} transactions in {elapsed:.1f}s '
+            f'({statements / elapsed if elapsed else 0:.0f} accounts/s), failed partitions: {failed}'
+        ))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from wallets.models import InstallmentBill
+from wallets.services import mark_overdue_bills
+
+
+class Command(BaseCommand):
+    help = 'เปลี่ยนสถานะบิล PENDING ที่เลยวันครบกำหนดเป็น OVERDUE (รันตาม schedule)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='นับจำนวนบิลที่จะถูกเปลี่ยนสถานะเท่านั้น')
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+
+        if options['dry_run']:
+            count = InstallmentBill.objects.filter(
+                status=InstallmentBill.Status.PENDING,
+                due_date__lt=today
+            ).count()
+            self.stdout.write(f'[dry-run] {count} bills would be marked OVERDUE (due before {today})')
+            return
+
+        started = time.perf_counter()
+        total = batches = 0
+
+        for updated in mark_overdue_bills(today=today, batch_size=options['batch_size']):
+            total += updated
+            batches += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  batch {batches}: {updated} rows')
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Marked {total} bills OVERDUE in {batches} batches, {elapsed:.2f}s ({rate:.0f} rows/s)'
+        ))
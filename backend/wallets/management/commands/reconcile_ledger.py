@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wallets.archive import restore_archive_checkpoints
+from wallets.ledger import reconcile_ledger
+from wallets.models import LedgerCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'ตรวจ balance_due_after ของ WalletTransaction และ balance_due ของ WalletAccount กับยอดสะสมใน ledger (รันทุกคืน)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='จำนวนบัญชีต่อ statement')
+        parser.add_argument('--repair', action='store_true', help='แก้ค่าที่ไม่ตรงให้ตรงกับยอดสะสมของ signed_amount')
+        parser.add_argument('--reset', action='store_true', help='ลบ checkpoint ทั้งหมดแล้วตรวจใหม่ตั้งแต่รายการแรก (ที่ยังไม่ได้ archive)')
+        parser.add_argument('--show', type=int, default=20, help='จำนวนรายการที่ไม่ตรงที่จะแสดงต่อบัญชี')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            deleted, _ = LedgerCheckpoint.objects.all().delete()
+            # บัญชีที่ archive แล้วต้องเริ่มต่อจากรายการสุดท้ายใน archive
+            restored = restore_archive_checkpoints()
+            self.stdout.write(f'Removed {deleted} checkpoints, restored {restored} from archives')
+
+        started = time.perf_counter()
+        accounts = transactions = bad_accounts = bad_rows = 0
+
+        for batch_accounts, batch_transactions, problems in reconcile_ledger(
+            batch_size=options['batch_size'], repair=options['repair']
+        ):
+            accounts += batch_accounts
+            transactions += batch_transactions
+            bad_accounts += len(problems)
+
+            for report in problems:
+                bad_rows += len(report['mismatches'])
+                self._report(report, options)
+
+        elapsed = time.perf_counter() - started
+        rate = transactions / elapsed if elapsed else 0
+        action = 'repaired' if options['repair'] else 'mismatched'
+        style = self.style.SUCCESS if not bad_accounts or options['repair'] else self.style.ERROR
+        self.stdout.write(style(
+            f'Checked {accounts} accounts / {transactions} new transactions in {elapsed:.2f}s ({rate:.0f} rows/s), '
+            f'{action}: {bad_accounts} accounts / {bad_rows} transactions'
+        ))
+
+    def _report(self, report: dict, options: dict):
+        prefix = 'REPAIRED' if report.get('repaired') else 'MISMATCH'
+        self.stdout.write(self.style.WARNING(f'{prefix} account {report["account_id"]}'))
+
+        if not report['balance_ok']:
+            self.stdout.write(
+                f'  balance_due {report["balance_due"]} != ledger {report["expected_balance"]}'
+            )
+        for txn_id, recorded, expected in report['mismatches'][:options['show']]:
+            self.stdout.write(f'  txn {txn_id}: balance_due_after {recorded} != {expected}')
+        if len(report['mismatches']) > options['show']:
+            self.stdout.write(f'  ... and {len(report["mismatches"]) - options["show"]} more')
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from JaiKorn.db import record_replica_lag, replica_lag
+
+
+class Command(BaseCommand):
+    help = 'วัด replication lag ของทุก read replica (DB_REPLICA_HOSTS) ใช้กับ cron / health check ของ monitoring'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-lag', type=float, help='จบด้วย error ถ้า replica ใด lag เกินกี่วินาที')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            self.stdout.write('ไม่ได้ตั้ง DB_REPLICA_HOSTS')
+            return
+
+        failed = []
+        for alias in settings.DATABASE_REPLICAS:
+            lag = replica_lag(alias)
+            record_replica_lag(alias, lag)
+            host = settings.DATABASES[alias]['HOST']
+            if lag is None:
+                failed.append(alias)
+                self.stdout.write(self.style.ERROR(f'{alias} ({host}): unreachable'))
+                continue
+            healthy = lag <= settings.DB_REPLICA_MAX_LAG_SECONDS
+            if options['max_lag'] is not None and lag > options['max_lag']:
+                failed.append(alias)
+            style = self.style.SUCCESS if healthy else self.style.WARNING
+            self.stdout.write(style(f'{alias} ({host}): lag {lag:.3f}s{"" if healthy else " (skipped by router)"}'))
+
+        if failed:
+            raise CommandError(f'replica ที่มีปัญหา: {", ".join(failed)}')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from wallets.partitions import PARTITIONED_MODELS, PartitioningError, convert_to_partitioned, ensure_partitions, is_partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        'แปลง WalletTransaction / InstallmentBill เป็น partitioned table รายเดือน (PostgreSQL) '
+        'ข้อมูลเดิมอยู่ใน partition เดียว ไม่ต้อง copy แต่ lock ตารางตลอดการแปลง ควรรันตอนปิดระบบ'
+    )
+
+    def handle(self, *args, **options):
+        # WalletTransaction ก่อน เพื่อถอด FK จากบิลที่ชี้เข้ามา
+        for model in PARTITIONED_MODELS:
+            table = model._meta.db_table
+            if is_partitioned(model):
+                self.stdout.write(f'{table}: partitioned อยู่แล้ว ข้าม')
+                continue
+            try:
+                legacy = convert_to_partitioned(model)
+                created = ensure_partitions(model)
+            except PartitioningError as e:
+                raise CommandError(str(e))
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{table}: ข้อมูลเดิมอยู่ใน {legacy}, สร้าง {len(created)} partitions'
+            ))
+            for name in created:
+                self.stdout.write(f'  {name}')
@@ -2,6 +2,7 @@ from django.db import models
 import uuid
 from django.conf import settings
 from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
 # Create your models here.
 class WalletAccount(models.Model):
     class Status(models.TextChoices):
@@ -15,8 +16,8 @@ class WalletAccount(models.Model):
         related_name='wallet_account'
     )
 
-    credit_limit = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text='วงเงินเต็ม')
-    balance_due = models.DecimalField(max_digits=10, decimal_places=2, default=0.00, help_text='ยอดหนี้คงค้าง')
+    credit_limit = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text='วงเงินเต็ม')
+    balance_due = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text='ยอดหนี้คงค้าง')
     status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -50,10 +51,27 @@ class PaymentRequest(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True, help_text='หลังเวลานี้ QR จ่ายไม่ได้แล้ว')
 
     def __str__(self):
         return f'Request {self.id} from {self.merchant} for {self.amount} ({self.get_status_display()})'
 
+    class Meta:
+        indexes = [
+            # settle_merchants: PAID ของวันหนึ่ง แยกตามร้าน
+            models.Index(
+                fields=['paid_at', 'merchant'],
+                condition=models.Q(status='PAID'),
+                name='pr_paid_day_idx'
+            ),
+            # expire_payment_requests: expires_at <= now หรือ (expires_at IS NULL AND created_at <= cutoff)
+            models.Index(
+                fields=['expires_at', 'created_at'],
+                condition=models.Q(status='PENDING'),
+                name='pr_pending_expiry_idx'
+            ),
+        ]
+
 class WalletTransaction(models.Model):
     class TxnType(models.TextChoices):
         PAYMENT = 'PAYMENT', 'Payment'
@@ -74,7 +92,8 @@ class WalletTransaction(models.Model):
     account = models.ForeignKey(
         WalletAccount,
         on_delete=models.CASCADE,
-        related_name='transactions'
+        related_name='transactions',
+        db_index=False  # ใช้ txn_account_created_idx แทน
     )
 
     occurred_at = models.DateTimeField(default=timezone.now)
@@ -85,6 +104,10 @@ class WalletTransaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # TransactionHistoryView / MyTransactionHistoryView
+            models.Index(fields=['account', '-created_at', '-id'], name='txn_account_created_idx'),
+        ]
 
 class InstallmentBill(models.Model):
     class Status(models.TextChoices):
@@ -101,16 +124,179 @@ class InstallmentBill(models.Model):
     account = models.ForeignKey(
         WalletAccount,
         on_delete=models.CASCADE,
-        related_name='bills'
+        related_name='bills',
+        db_index=False  # ใช้ bill_account_due_idx แทน
     )
 
     amount_due = models.DecimalField(max_digits=10, decimal_places=2)
     due_date = models.DateField()
     status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
     paid_at = models.DateTimeField(null=True, blank=True)
+    repayment_transaction = models.ForeignKey(
+        WalletTransaction,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='repaid_bills',
+        help_text='รายการ REPAYMENT ที่ปิดบิลนี้'
+    )
 
     def __str__(self):
         return f'Bill {self.id} for {self.account.user} due on {self.due_date} ({self.get_status_display()})'
 
     class Meta:
-        ordering = ['due_date']
\ No newline at end of file
+        ordering = ['due_date']
+        indexes = [
+            # HomeBillListView
+            models.Index(fields=['account', 'due_date'], name='bill_account_due_idx'),
+            # UnpaidBillListView, execute_bulk_bill_repayment
+            models.Index(
+                fields=['account', 'due_date'],
+                condition=models.Q(status__in=['PENDING', 'OVERDUE']),
+                name='bill_account_unpaid_idx'
+            ),
+            # mark_overdue_bills
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(status='PENDING'),
+                name='bill_pending_due_idx'
+            ),
+        ]
+
+
+class IdempotencyKey(models.Model):
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='idempotency_keys'
+    )
+    key = models.CharField(max_length=255, help_text='ค่าจาก header Idempotency-Key')
+    endpoint = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64, blank=True, help_text='sha256 ของ body ที่ใช้คีย์นี้ครั้งแรก')
+
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, help_text='NULL = กำลังประมวลผล')
+    response_body = models.JSONField(null=True, blank=True, encoder=JSONEncoder)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.key} @ {self.endpoint} for {self.user}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key', 'endpoint'], name='uniq_idempotency_key'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+
+class Statement(models.Model):
+    # ใบแจ้งยอดรายเดือนต่อบัญชี สร้างโดย generate_statements
+    # รายการในใบแจ้งยอดคือ WalletTransaction ของบัญชีในช่วง [period, เดือนถัดไป)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(
+        WalletAccount,
+        on_delete=models.CASCADE,
+        related_name='statements',
+        db_index=False  # ใช้ uniq_statement_per_month แทน
+    )
+    period = models.DateField(help_text='วันแรกของเดือน')
+
+    opening_balance = models.DecimalField(max_digits=12, decimal_places=2)
+    payment_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    repayment_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    fee_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+    bills_due_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, help_text='ยอดบิลที่ครบกำหนดในเดือนนี้')
+    bills_due_count = models.PositiveIntegerField(default=0)
+    closing_balance = models.DecimalField(max_digits=12, decimal_places=2)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Statement {self.period:%Y-%m} for {self.account_id}: {self.closing_balance}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'period'], name='uniq_statement_per_month'),
+        ]
+        ordering = ['-period']
+
+
+class StatementPartition(models.Model):
+    # ผลของแต่ละ partition (ช่วง id ของ WalletAccount) ที่ generate_statements ทำเสร็จ ใช้ดู throughput
+
+    period = models.DateField()
+    first_account_id = models.UUIDField()
+    last_account_id = models.UUIDField()
+    statement_count = models.PositiveIntegerField()
+    transaction_count = models.PositiveIntegerField()
+    elapsed_seconds = models.FloatField()
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.period:%Y-%m} {self.first_account_id}..{self.last_account_id}: {self.statement_count} statements'
+
+    @property
+    def accounts_per_second(self) -> float:
+        return self.statement_count / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    class Meta:
+        ordering = ['-completed_at']
+        indexes = [
+            models.Index(fields=['period', 'completed_at'], name='stmt_partition_period_idx'),
+        ]
+
+
+class LedgerCheckpoint(models.Model):
+    # ตำแหน่งล่าสุดใน ledger ของบัญชีที่ reconcile_ledger ตรวจแล้วว่าถูกต้อง รอบถัดไปตรวจเฉพาะรายการหลังจากนี้
+
+    account = models.OneToOneField(
+        WalletAccount,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='ledger_checkpoint'
+    )
+    last_created_at = models.DateTimeField()
+    last_transaction_id = models.UUIDField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, help_text='ผลรวม signed_amount ถึงรายการนี้')
+    checked_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Checkpoint {self.account_id} @ {self.last_created_at}: {self.balance}'
+
+
+class WalletArchive(models.Model):
+    # ไฟล์ใน cold storage ที่ archive_wallet_history ย้ายประวัติที่จ่ายครบแล้วของบัญชีออกจาก DB
+    # 1 ไฟล์ = รายการทั้งหมดของบัญชีที่เก่ากว่า boundary ของรอบนั้น (ช่วงของแต่ละไฟล์ไม่ซ้อนกัน) พร้อมบิลของรายการเหล่านั้น
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    account = models.ForeignKey(
+        WalletAccount,
+        on_delete=models.CASCADE,
+        related_name='archives',
+        db_index=False  # ใช้ archive_account_last_idx แทน
+    )
+    path = models.CharField(max_length=255, help_text='ชื่อไฟล์ใน storage WALLET_ARCHIVE_STORAGE')
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    last_transaction_id = models.UUIDField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, help_text='balance_due_after ของรายการสุดท้ายในไฟล์')
+    transaction_count = models.PositiveIntegerField()
+    bill_count = models.PositiveIntegerField()
+    size = models.PositiveBigIntegerField(help_text='bytes (gzip)')
+    checksum = models.CharField(max_length=64, help_text='sha256 ของไฟล์')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Archive {self.account_id} {self.first_created_at:%Y-%m-%d}..{self.last_created_at:%Y-%m-%d}'
+
+    class Meta:
+        ordering = ['-last_created_at']
+        indexes = [
+            models.Index(fields=['account', '-last_created_at'], name='archive_account_last_idx'),
+        ]
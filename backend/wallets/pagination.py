@@ -0,0 +1,120 @@
+import base64
+import binascii
+import uuid
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    # keyset บน (created_at, id) เรียงใหม่ไปเก่า หน้าลึกแค่ไหนก็ใช้ index seek เท่าหน้าแรก (ไม่มี OFFSET)
+    # body ยังเป็น list เหมือนเดิม cursor ของหน้าถัดไปส่งกลับทาง header Link / X-Next-Cursor
+    # view ที่มี read_archive(before=, limit=) อ่านต่อจาก cold storage เมื่อเลยรายการใน DB ไปแล้ว (wallets.archive)
+
+    page_size = settings.WALLET_HISTORY_PAGE_SIZE
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset, position = self.get_page_queryset(queryset, request)
+        results = self.split_page(list(queryset[:self.page_size + 1]))
+
+        read_archive = getattr(view, 'read_archive', None)
+        if not self.has_next and read_archive is not None:
+            # หมดรายการใน DB แล้ว: ถ้าบัญชีมี archive (แถวมี 'archived' จาก values()) หน้าถัดไปอ่านจาก archive
+            # cursor ที่เลยรายการใน DB ไปแล้ว (หรือไม่มีรายการใน DB เลย) อ่านจาก archive ทั้งหน้า
+            if results:
+                self.has_next = results[-1]['archived']
+            else:
+                results = self.split_page(read_archive(before=position, limit=self.page_size + 1))
+
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        # สำหรับ async view: อ่านหน้าผ่าน async ORM, archive (ไฟล์ใน storage) อ่านใน thread
+        queryset, position = self.get_page_queryset(queryset, request)
+        results = self.split_page([row async for row in queryset[:self.page_size + 1]])
+
+        read_archive = getattr(view, 'read_archive', None)
+        if not self.has_next and read_archive is not None:
+            if results:
+                self.has_next = results[-1]['archived']
+            else:
+                results = self.split_page(
+                    await sync_to_async(read_archive)(before=position, limit=self.page_size + 1)
+                )
+
+        self.next_position = self.get_position(results[-1]) if self.has_next else None
+        return results
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by('-created_at', '-id')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, pk = position
+            # created_at__lte ซ้ำไว้ให้ planner ใช้เป็น Index Cond ได้
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk),
+                created_at__lte=created_at
+            )
+        return queryset, position
+
+    def split_page(self, results: list) -> list:
+        # ดึงมาเกิน 1 แถวไว้ดูว่ามีหน้าถัดไปไหม
+        self.has_next = len(results) > self.page_size
+        return results[:self.page_size]
+
+    def get_position(self, item) -> tuple[datetime, uuid.UUID]:
+        # รองรับทั้ง model instance และ dict จาก values()
+        if isinstance(item, dict):
+            return item['created_at'], item['id']
+        return item.created_at, item.id
+
+    def get_paginated_response(self, data):
+        headers = {}
+        if self.next_position is not None:
+            cursor = self.encode_cursor(self.next_position)
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, cursor
+            )
+            headers['X-Next-Cursor'] = cursor
+            headers['Link'] = f'<{next_url}>; rel="next"'
+
+        return Response(data, headers=headers)
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def encode_cursor(self, position: tuple[datetime, uuid.UUID]) -> str:
+        created_at, pk = position
+        raw = f'{created_at.isoformat()}|{pk}'.encode('ascii')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def decode_cursor(self, request) -> tuple[datetime, uuid.UUID] | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            created_at, pk = raw.split('|')
+            return datetime.fromisoformat(created_at), uuid.UUID(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
@@ -0,0 +1,287 @@
+import re
+from datetime import date, datetime, time
+
+from dateutil.relativedelta import relativedelta
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import WalletTransaction, InstallmentBill
+
+# โหมด declarative partitioning ของ PostgreSQL: แบ่ง WalletTransaction ตาม created_at และ InstallmentBill ตาม due_date รายเดือน
+# ORM ใช้ได้เหมือนเดิมเพราะชื่อตาราง / คอลัมน์ไม่เปลี่ยน ข้อแตกต่างใน DB หลังแปลง:
+# - primary key เป็น (id, คอลัมน์ partition) เพราะ PostgreSQL บังคับ; id ยังเป็น UUID สุ่มจึงไม่ซ้ำในทางปฏิบัติ
+# - FK ที่ชี้เข้า WalletTransaction (bill.transaction, bill.repayment_transaction) ถูกถอดออกจาก DB
+#   (Django ยัง cascade / ตรวจใน python ตามปกติ)
+# - unique ที่ไม่มีคอลัมน์ partition (payment_request ของ WalletTransaction) กลายเป็น unique (..., คอลัมน์ partition)
+#   ข้อมูลเดิมยังมี unique ตัวเดิมอยู่ใน partition until_, payment_request ถูก claim PENDING -> PAID ได้ครั้งเดียวอยู่แล้ว
+# partition: <table>_pYYYYMM รายเดือน, <table>_until_YYYYMM ข้อมูลเดิมจนถึงสิ้นเดือนนี้ (แถวที่เลยไปย้ายเข้า partition รายเดือน),
+# <table>_default กันแถวที่ไม่มี partition รองรับ
+
+PARTITIONED_MODELS = {
+    # model: (คอลัมน์ partition, จำนวนเดือนล่วงหน้าที่ต้องมี partition)
+    WalletTransaction: ('created_at', 2),
+    # บิลงวดสุดท้ายครบกำหนดได้ถึง 12 เดือนข้างหน้า
+    InstallmentBill: ('due_date', 14),
+}
+
+_NAME_RE = re.compile(r'_(p|until_)(\d{4})(\d{2})$')
+
+
+class PartitioningError(Exception):
+    pass
+
+
+def _qn(name: str) -> str:
+    return connection.ops.quote_name(name)
+
+
+def _literal(value) -> str:
+    # DDL รับ bind parameter ไม่ได้เมื่อเปิด server-side binding (DB_PREPARED_STATEMENTS) ขอบเขตของ partition จึงฝังเป็น literal
+    return connection.ops.compose_sql('%s', [value])
+
+
+def _month_start(value) -> date:
+    if isinstance(value, datetime):
+        value = timezone.localtime(value).date()
+    return value.replace(day=1)
+
+
+def _bound(model, month: date):
+    column, _ = PARTITIONED_MODELS[model]
+    if column == 'created_at':
+        return timezone.make_aware(datetime.combine(month, time.min))
+    return month
+
+
+def _rel_name(name: str, suffix: str) -> str:
+    # ชื่อ relation ใน PostgreSQL ยาวได้ไม่เกิน 63 bytes
+    return name[:63 - len(suffix)] + suffix
+
+
+def _parent_index(definition: str, *, name: str, table: str, column: str) -> str:
+    # index เดิมบนตารางแม่ชื่อเดิม: unique ของ partitioned table ต้องมีคอลัมน์ partition ด้วย จึงต่อท้ายให้
+    # unique บน expression (แยกคอลัมน์ไม่ได้) ทำได้แค่ index ธรรมดา
+    match = re.match(r'^CREATE (UNIQUE )?INDEX \S+ ON \S+ (USING \w+ )\(([^()]*)\)(.*)$', definition)
+    if match is None or not match[1]:
+        return re.sub(r'^CREATE (UNIQUE )?INDEX \S+ ON \S+ ', f'CREATE INDEX {_qn(name)} ON {_qn(table)} ', definition)
+
+    columns = match[3]
+    if column not in [part.strip().strip('"') for part in columns.split(',')]:
+        columns = f'{columns}, {_qn(column)}'
+    return f'CREATE UNIQUE INDEX {_qn(name)} ON {_qn(table)} {match[2]}({columns}){match[4]}'
+
+
+def is_partitioned(model) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid '
+            'WHERE c.oid = to_regclass(%s)',
+            [model._meta.db_table]
+        )
+        return cursor.fetchone() is not None
+
+
+def partitions_of(model) -> dict[str, date | None]:
+    # {ชื่อ partition: เดือนที่เป็นขอบบน (ไม่รวม)} ของ partition ที่ยังแนบอยู่, default = None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname',
+            [model._meta.db_table]
+        )
+        names = [name for name, in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = _NAME_RE.search(name)
+        if match is None:
+            partitions[name] = None
+            continue
+        month = date(int(match[2]), int(match[3]), 1)
+        partitions[name] = month + relativedelta(months=1) if match[1] == 'p' else month
+    return partitions
+
+
+@transaction.atomic
+def convert_to_partitioned(model) -> str:
+    # แปลงตารางเดิมเป็น partitioned table โดยไม่ copy ข้อมูล:
+    # ตารางเดิมกลายเป็น partition เดียวช่วง (MINVALUE, เดือนถัดจากแถวล่าสุด) แล้วสร้าง partition รายเดือนต่อจากนั้น
+    # ถือ ACCESS EXCLUSIVE lock ตลอด และ ATTACH ต้อง scan ตารางเดิมหนึ่งรอบ ควรรันตอนปิดระบบ
+    if connection.vendor != 'postgresql':
+        raise PartitioningError('partitioning รองรับเฉพาะ PostgreSQL')
+    if is_partitioned(model):
+        raise PartitioningError(f'{model._meta.db_table} เป็น partitioned table อยู่แล้ว')
+
+    table = model._meta.db_table
+    column, _ = PARTITIONED_MODELS[model]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {_qn(table)} IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'SELECT MAX({_qn(column)}) FROM {_qn(table)}')
+        latest = cursor.fetchone()[0]
+        # ขอบบนไม่เกินสิ้นเดือนนี้ (บิลครบกำหนดล่วงหน้าได้ถึง 12 เดือน ไม่ให้ until_ กินช่วงเดือนข้างหน้าไปด้วย)
+        this_month = _month_start(timezone.localdate())
+        upper = min(_month_start(latest or this_month), this_month) + relativedelta(months=1)
+        legacy = f'{table}_until_{upper:%Y%m}'
+
+        cursor.execute(f'ALTER TABLE {_qn(table)} RENAME TO {_qn(legacy)}')
+
+        # FK จากตารางอื่นที่ชี้เข้ามา: partitioned table ไม่มี unique บน id อย่างเดียวให้อ้างอิงได้
+        cursor.execute(
+            "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+            "WHERE contype = 'f' AND confrelid = %s::regclass",
+            [legacy]
+        )
+        for referencing, name in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {referencing} DROP CONSTRAINT {_qn(name)}')
+
+        cursor.execute(
+            'SELECT i.relname, pg_get_indexdef(i.oid), x.indisprimary FROM pg_index x '
+            'JOIN pg_class i ON i.oid = x.indexrelid WHERE x.indrelid = %s::regclass',
+            [legacy]
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE contype = 'f' AND conrelid = %s::regclass",
+            [legacy]
+        )
+        foreign_keys = cursor.fetchall()
+
+        # index ของตารางเดิมเปลี่ยนชื่อหลบ แล้วสร้างชื่อเดิมบนตารางแม่
+        # primary key เดิมถอดออก ATTACH จะสร้าง (id, คอลัมน์ partition) ให้แทน
+        parent_indexes = []
+        for name, definition, primary in indexes:
+            if primary:
+                cursor.execute(f'ALTER TABLE {_qn(legacy)} DROP CONSTRAINT {_qn(name)}')
+                continue
+            cursor.execute(f'ALTER INDEX {_qn(name)} RENAME TO {_qn(_rel_name(name, "_legacy"))}')
+            parent_indexes.append(_parent_index(definition, name=name, table=table, column=column))
+
+        cursor.execute(
+            f'CREATE TABLE {_qn(table)} (LIKE {_qn(legacy)} INCLUDING DEFAULTS INCLUDING STORAGE) '
+            f'PARTITION BY RANGE ({_qn(column)})'
+        )
+        cursor.execute(f'ALTER TABLE {_qn(table)} ADD PRIMARY KEY (id, {_qn(column)})')
+        for definition in parent_indexes:
+            cursor.execute(definition)
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {_qn(table)} ADD CONSTRAINT {_qn(name)} {definition}')
+
+        cursor.execute(f'CREATE TABLE {_qn(table + "_default")} PARTITION OF {_qn(table)} DEFAULT')
+
+        # แถวที่เลยขอบบน ย้ายเข้า partition รายเดือนก่อน ATTACH
+        if latest is not None and _month_start(latest) >= upper:
+            month = upper
+            while month <= _month_start(latest):
+                create_month_partition(model, month=month)
+                month += relativedelta(months=1)
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {_qn(legacy)} WHERE {_qn(column)} >= %s RETURNING *) '
+                f'INSERT INTO {_qn(table)} SELECT * FROM moved',
+                [_bound(model, upper)]
+            )
+
+        cursor.execute(
+            f'ALTER TABLE {_qn(table)} ATTACH PARTITION {_qn(legacy)} '
+            f'FOR VALUES FROM (MINVALUE) TO ({_literal(_bound(model, upper))})'
+        )
+
+    return legacy
+
+
+@transaction.atomic
+def create_month_partition(model, *, month: date) -> str:
+    table = model._meta.db_table
+    name = f'{table}_p{month:%Y%m}'
+    default = table + '_default'
+    column, _ = PARTITIONED_MODELS[model]
+    lower, upper = _bound(model, month), _bound(model, month + relativedelta(months=1))
+
+    with connection.cursor() as cursor:
+        # แถวที่ตกไปอยู่ default ในช่วงนี้ต้องย้ายออกก่อน ไม่อย่างนั้นสร้าง partition ไม่ได้
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM {_qn(default)} WHERE {_qn(column)} >= %s AND {_qn(column)} < %s)',
+            [lower, upper]
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f'CREATE TABLE {_qn(name)} PARTITION OF {_qn(table)} '
+                f'FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})'
+            )
+            return name
+
+        cursor.execute(f'ALTER TABLE {_qn(table)} DETACH PARTITION {_qn(default)}')
+        cursor.execute(
+            f'CREATE TABLE {_qn(name)} PARTITION OF {_qn(table)} '
+            f'FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})'
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {_qn(default)} WHERE {_qn(column)} >= %s AND {_qn(column)} < %s RETURNING *) '
+            f'INSERT INTO {_qn(name)} SELECT * FROM moved',
+            [lower, upper]
+        )
+        cursor.execute(f'ALTER TABLE {_qn(table)} ATTACH PARTITION {_qn(default)} DEFAULT')
+    return name
+
+
+def ensure_partitions(model, *, months_ahead: int | None = None, today: date | None = None) -> list[str]:
+    # สร้าง partition รายเดือนที่ยังไม่มีจนถึง months_ahead เดือนข้างหน้า (รันซ้ำได้)
+    if not is_partitioned(model):
+        raise PartitioningError(f'{model._meta.db_table} ยังไม่ได้แปลงเป็น partitioned table')
+    if months_ahead is None:
+        _, months_ahead = PARTITIONED_MODELS[model]
+
+    this_month = _month_start(today or timezone.localdate())
+    existing = partitions_of(model)
+    # เริ่มต่อจากขอบบนของ partition ข้อมูลเดิม (until_) ไม่ให้มีช่วงเดือนที่ตกไป default หรือซ้อนกัน
+    month = max((upper for name, upper in existing.items() if '_until_' in name), default=this_month)
+    last = this_month + relativedelta(months=months_ahead)
+
+    created = []
+    while month <= last:
+        if f'{model._meta.db_table}_p{month:%Y%m}' not in existing:
+            created.append(create_month_partition(model, month=month))
+        month += relativedelta(months=1)
+    return created
+
+
+def _has_open_bills(model, partition: str) -> bool:
+    # partition ที่ยังมีบิลค้างจ่ายถอดไม่ได้ ไม่อย่างนั้นบิล / รายการต้นทางจะหายไปจากแอป
+    bills = InstallmentBill._meta.db_table
+    with connection.cursor() as cursor:
+        if model is InstallmentBill:
+            cursor.execute(
+                f'SELECT EXISTS (SELECT 1 FROM {_qn(partition)} WHERE status <> %s)',
+                [InstallmentBill.Status.PAID]
+            )
+        else:
+            cursor.execute(
+                f'SELECT EXISTS (SELECT 1 FROM {_qn(bills)} b JOIN {_qn(partition)} t ON t.id = b.transaction_id '
+                f'WHERE b.status <> %s)',
+                [InstallmentBill.Status.PAID]
+            )
+        return cursor.fetchone()[0]
+
+
+def detach_partitions(model, *, older_than_months: int, drop: bool = False, today: date | None = None):
+    # ถอด partition ที่ทั้งช่วงเก่ากว่า older_than_months เดือนออกจากตารางแม่ (ตารางยังอยู่ไว้ archive / ลบทิ้งเมื่อ drop)
+    # yield (ชื่อ partition, True ถ้าถอดแล้ว / False ถ้าข้ามเพราะยังมีบิลค้าง)
+    if not is_partitioned(model):
+        raise PartitioningError(f'{model._meta.db_table} ยังไม่ได้แปลงเป็น partitioned table')
+
+    cutoff = _month_start(today or timezone.localdate()) - relativedelta(months=older_than_months)
+    table = model._meta.db_table
+
+    for name, upper in partitions_of(model).items():
+        if upper is None or upper > cutoff:
+            continue
+        with transaction.atomic():
+            if _has_open_bills(model, name):
+                yield name, False
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE {_qn(table)} DETACH PARTITION {_qn(name)}')
+                if drop:
+                    cursor.execute(f'DROP TABLE {_qn(name)}')
+        yield name, True
@@ -212,3 +212,42 @@ class GenericSpendSerializer(serializers.Serializer):
         decimal_places=2,
         validators=[MinValueValidator(Decimal('0.01'))]
     )
+
+class BulkRepaySerializer(serializers.Serializer):
+
+    bill_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        required=False,
+        allow_empty=False,
+        max_length=500,
+        help_text="รายการ id ของบิลที่ต้องการจ่าย"
+    )
+    transaction_id = serializers.UUIDField(
+        required=False,
+        help_text="จ่ายบิลที่ค้างทั้งหมดของรายการผ่อนนี้"
+    )
+    due_before = serializers.DateField(
+        required=False,
+        help_text="จ่ายบิลที่ค้างทั้งหมดที่ครบกำหนดก่อนวันนี้"
+    )
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("ต้องระบุ bill_ids, transaction_id หรือ due_before อย่างน้อยหนึ่งอย่าง")
+        return attrs
+
+class WalletExportQuerySerializer(serializers.Serializer):
+
+    kind = serializers.ChoiceField(choices=['transactions', 'bills'], default='transactions')
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    user = serializers.UUIDField(
+        required=False,
+        help_text="(staff เท่านั้น) export ประวัติของ user อื่น"
+    )
+
+    def validate(self, attrs):
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from ต้องไม่เกิน date_to")
+        return attrs
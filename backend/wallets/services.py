@@ -1,80 +1,165 @@
 from decimal import Decimal, ROUND_HALF_UP
-from datetime import date
+from datetime import date, datetime, time
+from time import perf_counter
 from dateutil.relativedelta import relativedelta
 import uuid
 
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils import timezone
 from django.conf import settings
-from django.db.models import F
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 
-from .models import WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill
+from .models import (
+    WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill, Statement, StatementPartition, WalletArchive
+)
 from merchants.models import Merchant, MerchantUser
+from merchants.services import record_receivable
+from .cache import invalidate_credit_summary_on_commit
 
 class BNPLServiceError(Exception):
     pass
 
 
-@transaction.atomic
-def execute_bnpl_transaction(
-        *,
-        user: settings.AUTH_USER_MODEL,
-        payment_request_id: uuid.UUID,
-        installment_months: int
-) -> WalletTransaction:
-
+def _raise_claim_error(*, user, payment_request_id: uuid.UUID):
+    # เรียกเฉพาะตอน claim ไม่สำเร็จ เพื่อหาสาเหตุให้ข้อความ error เหมือนเดิม
     try:
-        req = PaymentRequest.objects.get(id=payment_request_id)
+        req = PaymentRequest.objects.only('status', 'merchant_id', 'expires_at').get(id=payment_request_id)
     except PaymentRequest.DoesNotExist:
         raise BNPLServiceError("Payment Request นี้ไม่มีอยู่จริง")
 
+    if req.status == PaymentRequest.Status.PAID:
+        raise BNPLServiceError("บิลนี้ถูกจ่ายไปแล้ว")
+    if req.status == PaymentRequest.Status.EXPIRED:
+        raise BNPLServiceError("QR นี้หมดอายุแล้ว")
+    if req.expires_at is not None and req.expires_at <= timezone.now():
+        # ยังเป็น PENDING แต่เลยเวลาแล้ว (expire_payment_requests ยังไม่ได้รันถึง)
+        raise BNPLServiceError("QR นี้หมดอายุแล้ว")
     if req.status != PaymentRequest.Status.PENDING:
-
-        if req.status == PaymentRequest.Status.PAID:
-            raise BNPLServiceError("บิลนี้ถูกจ่ายไปแล้ว")
-        if req.status == PaymentRequest.Status.EXPIRED:
-            raise BNPLServiceError("QR นี้หมดอายุแล้ว")
-
         raise BNPLServiceError(f"ไม่สามารถทำรายการได้เนื่องจากสถานะเป็น '{req.status}'")
 
-    amount = req.amount
-    merchant = req.merchant
+    if MerchantUser.objects.filter(user=user, merchant_id=req.merchant_id).exists():
+        raise BNPLServiceError("ร้านค้าไม่สามารถทำรายการชำระเงินให้ตัวเองได้")
 
-    is_self_payment = MerchantUser.objects.filter(
-        user=user,
-        merchant=merchant
-    ).exists()
+    # ตรวจแล้วไม่พบสาเหตุ (สถานะเปลี่ยนระหว่าง claim กับตอนตรวจ) ให้ client ลองใหม่
+    raise BNPLServiceError("ไม่สามารถทำรายการได้ในขณะนี้ กรุณาลองใหม่อีกครั้ง")
 
-    if is_self_payment:
-        raise BNPLServiceError("ร้านค้าไม่สามารถทำรายการชำระเงินให้ตัวเองได้")
 
+def _raise_debit_error(*, user, amount: Decimal):
     try:
-        account = WalletAccount.objects.select_for_update().get(user=user)
+        account = WalletAccount.objects.only('credit_limit', 'balance_due').get(user=user)
     except WalletAccount.DoesNotExist:
         raise BNPLServiceError("ไม่พบบัญชีเครดิต (WalletAccount) ของผู้ใช้")
 
     available_credit = account.credit_limit - account.balance_due
-    if available_credit < amount:
-        raise BNPLServiceError(f"วงเงินไม่เพียงพอ (คงเหลือ: {available_credit})")
-
-    new_txn = WalletTransaction.objects.create(
-        account=account,
-        type_code=WalletTransaction.TxnType.PAYMENT,
-        signed_amount=amount,
-        balance_due_after=account.balance_due + amount,
-        payment_request=req
+    raise BNPLServiceError(f"วงเงินไม่เพียงพอ (คงเหลือ: {available_credit})")
+
+
+def _prep(model, field_name: str, value):
+    return model._meta.get_field(field_name).get_db_prep_value(value, connection)
+
+
+def _claim_payment_request(cursor, *, user, payment_request_id: uuid.UUID, paid_at) -> tuple[Decimal, uuid.UUID] | None:
+    # PENDING -> PAID ใน statement เดียว พร้อมเช็คอายุ QR และว่าไม่ใช่ร้านค้าจ่ายให้ตัวเอง
+    req_table = PaymentRequest._meta.db_table
+    merchant_user_table = MerchantUser._meta.db_table
+
+    cursor.execute(
+        f"""
+        UPDATE {req_table}
+           SET status = %s, customer_id = %s, paid_at = %s
+         WHERE id = %s
+           AND status = %s
+           AND (expires_at IS NULL OR expires_at > %s)
+           AND NOT EXISTS (
+               SELECT 1 FROM {merchant_user_table} mu
+                WHERE mu.user_id = %s AND mu.merchant_id = {req_table}.merchant_id
+           )
+        RETURNING amount, merchant_id
+        """,
+        [
+            PaymentRequest.Status.PAID,
+            _prep(PaymentRequest, 'customer', user.pk),
+            _prep(PaymentRequest, 'paid_at', paid_at),
+            _prep(PaymentRequest, 'id', payment_request_id),
+            PaymentRequest.Status.PENDING,
+            _prep(PaymentRequest, 'expires_at', paid_at),
+            _prep(MerchantUser, 'user', user.pk),
+        ],
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    amount = PaymentRequest._meta.get_field('amount').to_python(row[0])
+    merchant_id = Merchant._meta.pk.to_python(row[1])
+    return amount, merchant_id
+
+
+def _debit_credit(cursor, *, user, amount: Decimal, now) -> tuple[uuid.UUID, Decimal, Decimal] | None:
+    # ตัดวงเงินแบบมีเงื่อนไข ถ้าวงเงินไม่พอจะไม่มีแถวกลับมา
+    account_table = WalletAccount._meta.db_table
+
+    cursor.execute(
+        f"""
+        UPDATE {account_table}
+           SET balance_due = balance_due + %s, updated_at = %s
+         WHERE user_id = %s
+           AND balance_due + %s <= credit_limit
+        RETURNING id, balance_due, credit_limit
+        """,
+        [
+            _prep(WalletAccount, 'balance_due', amount),
+            _prep(WalletAccount, 'updated_at', now),
+            _prep(WalletAccount, 'user', user.pk),
+            _prep(WalletAccount, 'balance_due', amount),
+        ],
+    )
+    row = cursor.fetchone()
+    if row is None:
+        return None
+
+    account_id = WalletAccount._meta.pk.to_python(row[0])
+    balance_due = WalletAccount._meta.get_field('balance_due').to_python(row[1])
+    credit_limit = WalletAccount._meta.get_field('credit_limit').to_python(row[2])
+    return account_id, balance_due, credit_limit
+
+
+def _credit_repayment(cursor, *, user, amount: Decimal, now) -> tuple[uuid.UUID, Decimal, Decimal] | None:
+    # คืนวงเงินและ lock แถวบัญชีใน statement เดียว
+    account_table = WalletAccount._meta.db_table
+
+    cursor.execute(
+        f"""
+        UPDATE {account_table}
+           SET balance_due = balance_due - %s, updated_at = %s
+         WHERE user_id = %s
+        RETURNING id, balance_due, credit_limit
+        """,
+        [
+            _prep(WalletAccount, 'balance_due', amount),
+            _prep(WalletAccount, 'updated_at', now),
+            _prep(WalletAccount, 'user', user.pk),
+        ],
     )
+    row = cursor.fetchone()
+    if row is None:
+        return None
 
-    account.balance_due += amount
-    account.save()
+    account_id = WalletAccount._meta.pk.to_python(row[0])
+    balance_due = WalletAccount._meta.get_field('balance_due').to_python(row[1])
+    credit_limit = WalletAccount._meta.get_field('credit_limit').to_python(row[2])
+    return account_id, balance_due, credit_limit
 
-    req.status = PaymentRequest.Status.PAID
-    req.customer = user
-    req.paid_at = timezone.now()
-    req.save()
 
-    merchant.receivable_balance = F('receivable_balance') + amount
-    merchant.save()
+def build_installment_bills(
+        *,
+        txn_id: uuid.UUID,
+        account_id: uuid.UUID,
+        amount: Decimal,
+        installment_months: int,
+        start_date: date
+) -> list[InstallmentBill]:
 
     monthly_amount = (amount / Decimal(installment_months)).quantize(
         Decimal('0.01'), rounding=ROUND_HALF_UP
@@ -82,28 +167,109 @@ def execute_bnpl_transaction(
 
     final_amount = amount - (monthly_amount * (installment_months - 1))
 
-    today = date.today()
     bills_to_create = []
 
     for i in range(installment_months):
-        due_date = today + relativedelta(months=i + 1)
+        due_date = start_date + relativedelta(months=i + 1)
 
         current_amount = final_amount if (i == installment_months - 1) else monthly_amount
 
         bills_to_create.append(
             InstallmentBill(
-                transaction=new_txn,
-                account=account,
+                transaction_id=txn_id,
+                account_id=account_id,
                 amount_due=current_amount,
                 due_date=due_date,
                 status=InstallmentBill.Status.PENDING
             )
         )
 
-    InstallmentBill.objects.bulk_create(bills_to_create)
+    return bills_to_create
+
+
+@transaction.atomic
+def execute_bnpl_transaction(
+        *,
+        user: settings.AUTH_USER_MODEL,
+        payment_request_id: uuid.UUID,
+        installment_months: int
+) -> WalletTransaction:
+
+    # Happy path = 5 statements: claim QR, ตัดวงเงิน, insert ledger, insert bills, insert ยอดค้างโอนร้าน
+    # row lock ของ WalletAccount ถูกถือแค่ตั้งแต่ขั้นตัดวงเงินจนถึง commit
+    now = timezone.now()
+
+    with connection.cursor() as cursor:
+        claimed = _claim_payment_request(
+            cursor, user=user, payment_request_id=payment_request_id, paid_at=now
+        )
+        if claimed is None:
+            _raise_claim_error(user=user, payment_request_id=payment_request_id)
+        amount, merchant_id = claimed
+
+        debited = _debit_credit(cursor, user=user, amount=amount, now=now)
+        if debited is None:
+            _raise_debit_error(user=user, amount=amount)
+        account_id, balance_due_after, _ = debited
+
+    new_txn = WalletTransaction.objects.create(
+        account_id=account_id,
+        type_code=WalletTransaction.TxnType.PAYMENT,
+        signed_amount=amount,
+        balance_due_after=balance_due_after,
+        payment_request_id=payment_request_id
+    )
+
+    InstallmentBill.objects.bulk_create(
+        build_installment_bills(
+            txn_id=new_txn.id,
+            account_id=account_id,
+            amount=amount,
+            installment_months=installment_months,
+            start_date=date.today()
+        )
+    )
+
+    record_receivable(merchant_id=merchant_id, amount=amount)
+
+    invalidate_credit_summary_on_commit(user.pk)
 
     return new_txn
 
+def _settle_bills(
+    *,
+    user: settings.AUTH_USER_MODEL,
+    bills: list[tuple[uuid.UUID, Decimal]],
+    now
+) -> WalletTransaction:
+    # ปิดบิลทั้งชุดด้วย ledger REPAYMENT รายการเดียว บิลแต่ละใบชี้กลับมาที่ repayment_transaction
+    # paid_at ของบิล = now ที่ผู้เรียกส่งมา
+    total = sum((amount for _, amount in bills), Decimal('0.00'))
+
+    with connection.cursor() as cursor:
+        credited = _credit_repayment(cursor, user=user, amount=total, now=now)
+    if credited is None:
+        raise BNPLServiceError("ไม่พบบัญชีเครดิต (WalletAccount) ของผู้ใช้")
+    account_id, balance_due_after, _ = credited
+
+    repayment_txn = WalletTransaction.objects.create(
+        account_id=account_id,
+        type_code=WalletTransaction.TxnType.REPAYMENT,
+        signed_amount=-total,
+        balance_due_after=balance_due_after,
+    )
+
+    InstallmentBill.objects.filter(pk__in=[bill_id for bill_id, _ in bills]).update(
+        status=InstallmentBill.Status.PAID,
+        paid_at=now,
+        repayment_transaction=repayment_txn
+    )
+
+    invalidate_credit_summary_on_commit(user.pk)
+
+    return repayment_txn
+
+
 @transaction.atomic
 def execute_bill_repayment(
     *,
@@ -121,21 +287,214 @@ def execute_bill_repayment(
     if bill.status == InstallmentBill.Status.PAID:
         raise BNPLServiceError("บิลนี้ถูกจ่ายไปแล้ว")
 
-    account = bill.account
-    amount_to_repay = bill.amount_due
+    now = timezone.now()
+    repayment_txn = _settle_bills(user=user, bills=[(bill.id, bill.amount_due)], now=now)
 
-    WalletTransaction.objects.create(
-        account=account,
-        type_code=WalletTransaction.TxnType.REPAYMENT,
-        signed_amount=-amount_to_repay,
-        balance_due_after=F('balance_due') - amount_to_repay,
+    bill.status = InstallmentBill.Status.PAID
+    bill.paid_at = now
+    bill.repayment_transaction = repayment_txn
+
+    return bill
+
+
+@transaction.atomic
+def execute_bulk_bill_repayment(
+    *,
+    user: settings.AUTH_USER_MODEL,
+    bill_ids: list[uuid.UUID] | None = None,
+    transaction_id: uuid.UUID | None = None,
+    due_before: date | None = None
+) -> tuple[WalletTransaction, list[uuid.UUID]]:
+
+    if not bill_ids and transaction_id is None and due_before is None:
+        raise BNPLServiceError("กรุณาระบุบิลที่ต้องการชำระ")
+
+    bills = InstallmentBill.objects.select_for_update(of=('self',)).filter(
+        account__user=user,
+        status__in=[InstallmentBill.Status.PENDING, InstallmentBill.Status.OVERDUE]
     )
 
-    account.balance_due = F('balance_due') - amount_to_repay
-    account.save()
+    if bill_ids:
+        bills = bills.filter(id__in=bill_ids)
+    if transaction_id is not None:
+        bills = bills.filter(transaction_id=transaction_id)
+    if due_before is not None:
+        bills = bills.filter(due_date__lt=due_before)
 
-    bill.status = InstallmentBill.Status.PAID
-    bill.paid_at = timezone.now()
-    bill.save()
+    # lock ตามลำดับ id เสมอ กัน deadlock กับ request อื่นที่จ่ายบิลชุดเดียวกัน
+    to_settle = list(bills.order_by('id').values_list('id', 'amount_due'))
+
+    if not to_settle:
+        raise BNPLServiceError("ไม่มีบิลที่ต้องชำระ")
+
+    if bill_ids and len(to_settle) != len(set(bill_ids)):
+        raise BNPLServiceError("บางบิลไม่พบ ถูกจ่ายไปแล้ว หรือคุณไม่มีสิทธิ์จ่าย")
+
+    repayment_txn = _settle_bills(user=user, bills=to_settle, now=timezone.now())
+
+    return repayment_txn, [bill_id for bill_id, _ in to_settle]
+
+
+def mark_overdue_bills(*, today: date, batch_size: int = 1000):
+    # ย้ายบิล PENDING ที่เลยกำหนดไปเป็น OVERDUE ทีละ batch (1 batch = 1 transaction สั้นๆ)
+    # ใช้ SKIP LOCKED ข้ามบิลที่ execute_bill_repayment กำลัง lock อยู่ จึงไม่มีการรอ lock หรือ deadlock
+    # yield จำนวนแถวที่อัปเดตในแต่ละ batch
+    while True:
+        with transaction.atomic():
+            batch = list(
+                InstallmentBill.objects.select_for_update(skip_locked=True).filter(
+                    status=InstallmentBill.Status.PENDING,
+                    due_date__lt=today
+                ).order_by('due_date', 'id').values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                return
 
-    return bill
\ No newline at end of file
+            updated = InstallmentBill.objects.filter(
+                pk__in=batch,
+                status=InstallmentBill.Status.PENDING
+            ).update(status=InstallmentBill.Status.OVERDUE)
+
+        yield updated
+
+
+def expire_payment_requests(*, now, batch_size: int = 1000):
+    # PENDING ที่เลย expires_at แล้ว -> EXPIRED ทีละ batch (ใช้ partial index pr_pending_expiry_idx)
+    # แถวเก่าที่ไม่มี expires_at จะหมดอายุตาม created_at + PAYMENT_REQUEST_TTL
+    # yield จำนวนแถวที่อัปเดตในแต่ละ batch
+    stale = Q(expires_at__lte=now) | Q(
+        expires_at__isnull=True,
+        created_at__lte=now - settings.PAYMENT_REQUEST_TTL
+    )
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                PaymentRequest.objects.select_for_update(skip_locked=True).filter(
+                    stale,
+                    status=PaymentRequest.Status.PENDING
+                ).order_by().values_list('id', flat=True)[:batch_size]
+            )
+            if not batch:
+                return
+
+            updated = PaymentRequest.objects.filter(
+                pk__in=batch,
+                status=PaymentRequest.Status.PENDING
+            ).update(status=PaymentRequest.Status.EXPIRED)
+
+        yield updated
+
+
+def _month_bounds(period: date) -> tuple[datetime, datetime]:
+    start = timezone.make_aware(datetime.combine(period, time.min))
+    end = timezone.make_aware(datetime.combine(period + relativedelta(months=1), time.min))
+    return start, end
+
+
+def accounts_pending_statement(period: date):
+    # บัญชีที่เปิดก่อนสิ้นเดือนและยังไม่มี Statement ของเดือนนี้ (รันซ้ำได้ จะทำเฉพาะที่เหลือ)
+    _, end = _month_bounds(period)
+    return WalletAccount.objects.filter(created_at__lt=end).exclude(
+        id__in=Statement.objects.filter(period=period).values('account_id')
+    )
+
+
+def statement_partitions(*, period: date, size: int):
+    # แบ่งบัญชีที่ยังไม่มี Statement เป็นช่วง id ละ size บัญชี อ่าน id ผ่าน server-side cursor ไม่โหลดทั้งหมด
+    first = last = None
+    count = 0
+    ids = accounts_pending_statement(period).order_by('id').values_list('id', flat=True)
+    for account_id in ids.iterator(chunk_size=size):
+        if first is None:
+            first = account_id
+        last = account_id
+        count += 1
+        if count == size:
+            yield first, last
+            first, count = None, 0
+
+    if first is not None:
+        yield first, last
+
+
+@transaction.atomic
+def generate_statement_partition(
+        *,
+        period: date,
+        first_account_id: uuid.UUID,
+        last_account_id: uuid.UUID,
+        txn_batch_size: int = 10000
+) -> StatementPartition:
+    # 1 partition = 1 transaction ถ้าล้มกลางทาง rollback ทั้ง partition แล้วรันใหม่ได้
+    started = perf_counter()
+    start, end = _month_bounds(period)
+    in_range = {'account_id__gte': first_account_id, 'account_id__lte': last_account_id}
+
+    # ยอดยกมา = balance_due_after ของรายการสุดท้ายก่อนต้นเดือน (index seek ต่อบัญชี)
+    # ถ้ารายการก่อนต้นเดือนถูก archive ไปหมดแล้ว ใช้ยอดของไฟล์ล่าสุดที่จบก่อนต้นเดือน (WalletArchive.balance)
+    last_before = WalletTransaction.objects.filter(
+        account=OuterRef('pk'), created_at__lt=start
+    ).order_by('-created_at', '-id').values('balance_due_after')[:1]
+    last_archived = WalletArchive.objects.filter(
+        account=OuterRef('pk'), last_created_at__lt=start
+    ).order_by('-last_created_at').values('balance')[:1]
+
+    accounts = accounts_pending_statement(period).filter(
+        id__gte=first_account_id, id__lte=last_account_id
+    ).annotate(opening=Coalesce(Subquery(last_before), Subquery(last_archived))).values_list('id', 'opening')
+
+    statements = {}
+    for account_id, opening in accounts:
+        opening = opening if opening is not None else Decimal('0.00')
+        statements[account_id] = Statement(
+            account_id=account_id,
+            period=period,
+            opening_balance=opening,
+            closing_balance=opening,
+        )
+
+    # รายการทั้งเดือนของทั้ง partition ใน scan เดียว เรียงตาม txn_account_created_idx
+    # แถวแรกของแต่ละบัญชีคือรายการล่าสุดของเดือน = ยอดยกไป
+    totals_field = {
+        WalletTransaction.TxnType.PAYMENT: 'payment_total',
+        WalletTransaction.TxnType.REPAYMENT: 'repayment_total',
+        WalletTransaction.TxnType.FEE: 'fee_total',
+    }
+    txn_count = 0
+    rows = WalletTransaction.objects.filter(
+        **in_range, created_at__gte=start, created_at__lt=end
+    ).order_by('account_id', '-created_at', '-id').values_list(
+        'account_id', 'type_code', 'signed_amount', 'balance_due_after'
+    )
+    for account_id, type_code, signed_amount, balance_due_after in rows.iterator(chunk_size=txn_batch_size):
+        statement = statements.get(account_id)
+        if statement is None:
+            continue
+        if statement.transaction_count == 0:
+            statement.closing_balance = balance_due_after
+        statement.transaction_count += 1
+        field = totals_field.get(type_code)
+        if field is not None:
+            setattr(statement, field, getattr(statement, field) + signed_amount)
+        txn_count += 1
+
+    bills_due = InstallmentBill.objects.filter(
+        **in_range, due_date__gte=period, due_date__lt=period + relativedelta(months=1)
+    ).order_by().values('account_id').annotate(total=Sum('amount_due'), count=Count('id'))
+    for row in bills_due:
+        statement = statements.get(row['account_id'])
+        if statement is not None:
+            statement.bills_due_total = row['total']
+            statement.bills_due_count = row['count']
+
+    Statement.objects.bulk_create(statements.values(), batch_size=txn_batch_size, ignore_conflicts=True)
+
+    return StatementPartition.objects.create(
+        period=period,
+        first_account_id=first_account_id,
+        last_account_id=last_account_id,
+        statement_count=len(statements),
+        transaction_count=txn_count,
+        elapsed_seconds=perf_counter() - started,
+    )
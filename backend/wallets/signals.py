@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_credit_summary_on_commit
+from .models import WalletAccount
+
+
+@receiver(post_save, sender=WalletAccount)
+def refresh_credit_summary_cache(sender, instance, **kwargs):
+    # ครอบคลุม admin และทุกที่ที่ save() WalletAccount ตรงๆ ส่วน services ที่ใช้ UPDATE จะเรียกเอง
+    invalidate_credit_summary_on_commit(instance.user_id)
@@ -1,3 +1,1734 @@
-from django.test import TestCase
+import io
+import json
+import subprocess
+import sys
+import tempfile
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, connection, transaction
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from JaiKorn.db import ReplicaMiddleware, ReplicaRouter, record_replica_lag
+from JaiKorn.renderers import FastJSONParser, FastJSONRenderer
+from JaiKorn.testing import QueryBudgetMixin
+from merchants.models import Merchant, MerchantStatus, MerchantUser, ReceivableEntry
+from .cache import fill_credit_summary, get_credit_summary, warn_if_disabled
+from . import archive as wallet_archive
+from .archive import archive_wallet_history, read_archive, restore_archive_checkpoints
+from .ledger import reconcile_ledger
+from .models import (
+    WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill, Statement, LedgerCheckpoint, WalletArchive,
+    IdempotencyKey
+)
+from .partitions import convert_to_partitioned, detach_partitions, ensure_partitions, is_partitioned, partitions_of
+from .fastpath import (
+    HOME_BILL_COLUMNS, TRANSACTION_HISTORY_COLUMNS, home_bill_rows, my_transaction_rows, transaction_history_rows
+)
+from .serializers import CreditDataSerializer, HomeBillSerializer, TransactionHistorySerializer, WalletTransactionSerializer
+from .views import (
+    UnpaidBillListView, CreditSummaryView, HomeBillListView, TransactionHistoryView, MyTransactionHistoryView,
+    AsyncUnpaidBillListView, AsyncCreditSummaryView, AsyncHomeBillListView, AsyncTransactionHistoryView,
+    AsyncMyTransactionHistoryView
+)
+from .services import (
+    BNPLServiceError, execute_bnpl_transaction, execute_bill_repayment, execute_bulk_bill_repayment,
+    mark_overdue_bills, expire_payment_requests, generate_statement_partition, statement_partitions
+)
+
+HOT_MODELS = [WalletAccount, PaymentRequest, WalletTransaction, InstallmentBill]
+HOT_TABLES = [model._meta.db_table for model in HOT_MODELS]
+PARTIAL_INDEXES = {
+    index.name
+    for model in HOT_MODELS
+    for index in model._meta.indexes
+    if index.condition is not None
+}
+
+
+def _consume(response):
+    response.content_bytes = b''.join(response.streaming_content)
+    return response
+
+
+def _walk(node: dict):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _walk(child)
+
+
+def _unindexed_scan(node: dict) -> str | None:
+    if node.get('Relation Name') not in HOT_TABLES and node['Node Type'] != 'Bitmap Index Scan':
+        return None
+
+    if node['Node Type'] == 'Seq Scan':
+        return f"Seq Scan on {node['Relation Name']}"
+
+    if node['Node Type'] in ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan'):
+        if 'Index Cond' not in node and node['Index Name'] not in PARTIAL_INDEXES:
+            return f"Full scan of index {node['Index Name']}"
+
+    return None
+
+
+@skipUnless(connection.vendor == 'postgresql', 'query plan tests ต้องใช้ PostgreSQL')
+class HotQueryPlanTests(TestCase):
+    # รัน EXPLAIN กับทุก query ของ endpoint/service ที่ใช้บ่อย แล้ว fail ถ้า table หลักถูก Seq Scan
+    # หรือถูกไล่อ่านทั้ง index โดยไม่มี Index Cond (เช่น full scan ของ PK)
+    # ปิด enable_seqscan เพื่อให้ผลไม่ขึ้นกับขนาดข้อมูลที่ seed ไว้
+
+    CUSTOMERS = 20
+    PAYMENTS_PER_CUSTOMER = 15
+    MONTHS = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Plan Shop', tax_id='PLAN-0001', status=active_status)
+
+        User = get_user_model()
+        cls.users = [
+            User.objects.create_user(username=f'plan-{i}', email=f'plan-{i}@example.com', password=None)
+            for i in range(cls.CUSTOMERS)
+        ]
+        WalletAccount.objects.update(credit_limit=Decimal('99999.00'))
+        accounts = {account.user_id: account for account in WalletAccount.objects.all()}
+
+        today = timezone.localdate()
+        requests, txns, bills = [], [], []
+        for user in cls.users:
+            account = accounts[user.id]
+            for _ in range(cls.PAYMENTS_PER_CUSTOMER):
+                req = PaymentRequest(
+                    merchant=cls.merchant, amount=Decimal('90.00'),
+                    status=PaymentRequest.Status.PAID, customer=user, paid_at=timezone.now()
+                )
+                txn = WalletTransaction(
+                    account=account, type_code=WalletTransaction.TxnType.PAYMENT,
+                    signed_amount=Decimal('90.00'), balance_due_after=Decimal('0.00'), payment_request=req
+                )
+                requests.append(req)
+                txns.append(txn)
+                bills.extend(
+                    InstallmentBill(
+                        transaction=txn, account=account, amount_due=Decimal('30.00'),
+                        due_date=today + timedelta(days=30 * (i + 1)),
+                        status=InstallmentBill.Status.PAID if i == 0 else InstallmentBill.Status.PENDING
+                    )
+                    for i in range(cls.MONTHS)
+                )
+
+        PaymentRequest.objects.bulk_create(requests)
+        WalletTransaction.objects.bulk_create(txns)
+        InstallmentBill.objects.bulk_create(bills)
+
+        with connection.cursor() as cursor:
+            for table in HOT_TABLES:
+                cursor.execute(f'ANALYZE {table}')
+
+    def setUp(self):
+        self.user = self.users[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # me/summary ต้องไปถึง DB จริงถึงจะมี query ให้ EXPLAIN
+        caches[settings.CREDIT_SUMMARY_CACHE].clear()
+
+    def assertIndexedPlan(self, func, uses: tuple[str, ...] = ()):
+        with CaptureQueriesContext(connection) as ctx:
+            func()
+
+        explained = 0
+        used_indexes = set()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for query in ctx.captured_queries:
+                sql = query['sql']
+                if sql.startswith('DECLARE '):
+                    # server-side cursor ของ iterator() ถูก log เป็น DECLARE ... CURSOR ... FOR SELECT
+                    sql = sql.split(' FOR ', 1)[1]
+                if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+                    continue
+                if not any(table in sql for table in HOT_TABLES):
+                    continue
+
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                explained += 1
+                for node in _walk(plan[0]['Plan']):
+                    self.assertIsNone(_unindexed_scan(node), f'{sql}\n\n{json.dumps(plan, indent=2)}')
+                    if 'Index Name' in node:
+                        used_indexes.add(node['Index Name'])
+            cursor.execute('RESET enable_seqscan')
+
+        self.assertGreater(explained, 0)
+        for index_name in uses:
+            self.assertIn(index_name, used_indexes)
+
+    def get(self, name):
+        response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+
+    def test_unpaid_bills(self):
+        self.assertIndexedPlan(
+            lambda: self.get('wallets:customer-unpaid-bills'),
+            uses=('bill_account_unpaid_idx',)
+        )
+
+    def test_home_bills(self):
+        self.assertIndexedPlan(
+            lambda: self.get('wallets:home-list-bills'),
+            uses=('bill_account_due_idx',)
+        )
+
+    def test_transaction_history(self):
+        self.assertIndexedPlan(
+            lambda: self.get('wallets:list-transactions'),
+            uses=('txn_account_created_idx',)
+        )
+
+    def test_transaction_history_deep_page(self):
+        first_page = self.client.get(reverse('wallets:list-transactions'), {'page_size': 2})
+        cursor = first_page['X-Next-Cursor']
+
+        self.assertIndexedPlan(
+            lambda: self.client.get(reverse('wallets:list-transactions'), {'cursor': cursor}),
+            uses=('txn_account_created_idx',)
+        )
+
+    def test_my_transaction_history(self):
+        self.assertIndexedPlan(
+            lambda: self.get('wallets:my-transaction-history'),
+            uses=('txn_account_created_idx',)
+        )
+
+    def test_export_transactions(self):
+        today = timezone.localdate()
+        self.assertIndexedPlan(
+            lambda: _consume(self.client.get(
+                reverse('wallets:wallet-export'), {'date_from': today - timedelta(days=30), 'date_to': today}
+            )),
+            uses=('txn_account_created_idx',)
+        )
+
+    def test_export_bills(self):
+        today = timezone.localdate()
+        self.assertIndexedPlan(
+            lambda: _consume(self.client.get(
+                reverse('wallets:wallet-export'),
+                {'kind': 'bills', 'output': 'ndjson', 'date_from': today, 'date_to': today + timedelta(days=45)}
+            )),
+            uses=('bill_account_due_idx',)
+        )
+
+    def test_statement_partition(self):
+        period = timezone.localdate().replace(day=1)
+        first, last = next(statement_partitions(period=period, size=5))
+        self.assertIndexedPlan(
+            lambda: generate_statement_partition(period=period, first_account_id=first, last_account_id=last),
+            uses=('txn_account_created_idx', 'bill_account_due_idx')
+        )
+
+    def test_reconcile_ledger(self):
+        self.assertIndexedPlan(
+            lambda: list(reconcile_ledger(batch_size=5)),
+            uses=('txn_account_created_idx',)
+        )
+
+    def test_credit_summary(self):
+        self.assertIndexedPlan(lambda: self.get('wallets:customer-credit-summary'))
+
+    def test_checkout(self):
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal('60.00'))
+        self.assertIndexedPlan(lambda: execute_bnpl_transaction(
+            user=self.user, payment_request_id=req.id, installment_months=3
+        ))
+
+    def test_bill_repayment(self):
+        bill = InstallmentBill.objects.filter(
+            account__user=self.user, status=InstallmentBill.Status.PENDING
+        ).first()
+        self.assertIndexedPlan(lambda: execute_bill_repayment(user=self.user, bill_id=bill.id))
+
+    def test_bulk_bill_repayment(self):
+        txn = WalletTransaction.objects.filter(account__user=self.user).first()
+        self.assertIndexedPlan(lambda: execute_bulk_bill_repayment(user=self.user, transaction_id=txn.id))
+
+    def test_overdue_sweeper(self):
+        today = timezone.localdate() + timedelta(days=45)
+        self.assertIndexedPlan(
+            lambda: list(mark_overdue_bills(today=today, batch_size=100)),
+            uses=('bill_pending_due_idx',)
+        )
+
+    def test_expiry_pass(self):
+        self.assertIndexedPlan(
+            lambda: list(expire_payment_requests(now=timezone.now(), batch_size=100)),
+            uses=('pr_pending_expiry_idx',)
+        )
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='pager', email='pager@example.com', password=None)
+        account = WalletAccount.objects.get(user=cls.user)
+        WalletTransaction.objects.bulk_create(
+            WalletTransaction(
+                account=account, type_code=WalletTransaction.TxnType.REPAYMENT,
+                signed_amount=Decimal('-1.00'), balance_due_after=Decimal('0.00')
+            )
+            for _ in range(7)
+        )
+        # created_at ซ้ำกันทุกแถว เพื่อให้ id เป็นตัวตัดสิน
+        WalletTransaction.objects.update(created_at=timezone.now())
+
+    def test_walks_every_row_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        seen, params = [], {'page_size': 3}
+        while True:
+            response = client.get(reverse('wallets:my-transaction-history'), params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(row['id'] for row in response.data)
+            if 'X-Next-Cursor' not in response:
+                break
+            params = {'page_size': 3, 'cursor': response['X-Next-Cursor']}
+
+        expected = WalletTransaction.objects.filter(account__user=self.user).order_by('-created_at', '-id')
+        self.assertEqual(seen, [str(pk) for pk in expected.values_list('id', flat=True)])
+
+    def test_invalid_cursor(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('wallets:my-transaction-history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncReadViewTests(TestCase):
+    # view async (ASYNC_READ_VIEWS) ต้องให้ response เหมือน view sync ทุก byte
+    # รันผ่าน async_to_sync: ถ้าแตะ ORM แบบ sync ใน event loop จะเจอ SynchronousOnlyOperation
+
+    VIEWS = {
+        'customer-unpaid-bills': (UnpaidBillListView, AsyncUnpaidBillListView),
+        'customer-credit-summary': (CreditSummaryView, AsyncCreditSummaryView),
+        'home-list-bills': (HomeBillListView, AsyncHomeBillListView),
+        'list-transactions': (TransactionHistoryView, AsyncTransactionHistoryView),
+        'my-transaction-history': (MyTransactionHistoryView, AsyncMyTransactionHistoryView),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name='Async Shop', tax_id='ASYNC-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='async', email='async@example.com', password=None)
+        WalletAccount.objects.filter(user=cls.user).update(credit_limit=Decimal('5000.00'))
+
+        for amount in ('100.00', '30.00', '45.50'):
+            req = PaymentRequest.objects.create(merchant=merchant, amount=Decimal(amount))
+            txn = execute_bnpl_transaction(user=cls.user, payment_request_id=req.id, installment_months=3)
+        execute_bill_repayment(user=cls.user, bill_id=InstallmentBill.objects.filter(transaction=txn).first().id)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.token = str(AccessToken.for_user(self.user))
+
+    def call(self, view, name: str, params: dict | None = None, token: str | None = None):
+        caches[settings.CREDIT_SUMMARY_CACHE].clear()
+        headers = {'Authorization': f'Bearer {token or self.token}'} if token != '' else {}
+        request = self.factory.get(reverse(f'wallets:{name}'), params or {}, headers=headers)
+        if view.view_is_async:
+            response = async_to_sync(view.as_view())(request)
+        else:
+            response = view.as_view()(request)
+        return response.render()
+
+    def assertSameResponse(self, name: str, params: dict | None = None, token: str | None = None):
+        sync_view, async_view = self.VIEWS[name]
+        expected = self.call(sync_view, name, params, token)
+        actual = self.call(async_view, name, params, token)
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual.content, expected.content)
+        self.assertEqual(actual.get('X-Next-Cursor'), expected.get('X-Next-Cursor'))
+        return actual
+
+    def test_views_are_async(self):
+        for _, async_view in self.VIEWS.values():
+            self.assertTrue(async_view.view_is_async)
+
+    def test_same_response_as_sync_views(self):
+        for name in self.VIEWS:
+            with self.subTest(name=name):
+                response = self.assertSameResponse(name)
+                self.assertEqual(response.status_code, 200)
+
+    def test_keyset_pages(self):
+        for name in ('list-transactions', 'my-transaction-history'):
+            params = {'page_size': 2}
+            pages = 0
+            while True:
+                response = self.assertSameResponse(name, params)
+                pages += 1
+                if 'X-Next-Cursor' not in response:
+                    break
+                params = {'page_size': 2, 'cursor': response['X-Next-Cursor']}
+            self.assertEqual(pages, 2)
+
+    def test_authentication_errors(self):
+        for token in ('', 'not-a-token'):
+            with self.subTest(token=token):
+                response = self.assertSameResponse('customer-credit-summary', token=token)
+                self.assertEqual(response.status_code, 401)
+
+
+class FastPathRenderingTests(TestCase):
+    # wallets.fastpath ต้องให้ JSON เหมือน serializer เดิมทุก byte
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name='Fast Shop', tax_id='FAST-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='fast', email='fast@example.com', password=None)
+        account = WalletAccount.objects.get(user=cls.user)
+
+        now = timezone.now()
+        today = timezone.localdate()
+        # เวลาใกล้เที่ยงคืนทั้งฝั่ง UTC และเวลาไทย เพื่อให้เจอกรณีวันที่สองแบบไม่ตรงกัน
+        created = [
+            now, now - timedelta(days=1), now - timedelta(days=40),
+            now.replace(hour=0, minute=5), now.replace(hour=17, minute=30), now.replace(hour=23, minute=55),
+        ]
+        txn_types = [
+            WalletTransaction.TxnType.PAYMENT, WalletTransaction.TxnType.REPAYMENT, WalletTransaction.TxnType.FEE,
+        ]
+
+        for i, created_at in enumerate(created * 2):
+            type_code = txn_types[i % len(txn_types)]
+            req = None
+            if type_code == WalletTransaction.TxnType.PAYMENT and i % 2 == 0:
+                req = PaymentRequest.objects.create(
+                    merchant=merchant, amount=Decimal('75.50'),
+                    status=PaymentRequest.Status.PAID, customer=cls.user, paid_at=now
+                )
+            txn = WalletTransaction.objects.create(
+                account=account, type_code=type_code, signed_amount=Decimal('75.50') * (1 if i % 2 else -1),
+                balance_due_after=Decimal('0.00'), payment_request=req
+            )
+            WalletTransaction.objects.filter(pk=txn.pk).update(created_at=created_at)
+
+            for status, offset in (
+                (InstallmentBill.Status.PAID, -60), (InstallmentBill.Status.OVERDUE, -(i + 1)),
+                (InstallmentBill.Status.PENDING, 0), (InstallmentBill.Status.PENDING, 1),
+                (InstallmentBill.Status.PENDING, 30 + i),
+            ):
+                InstallmentBill.objects.create(
+                    transaction=txn, account=account, amount_due=Decimal('25.17'),
+                    due_date=today + timedelta(days=offset), status=status
+                )
+
+    def render(self, data) -> bytes:
+        return JSONRenderer().render(data)
+
+    def test_home_bills(self):
+        queryset = InstallmentBill.objects.filter(account__user=self.user).select_related(
+            'transaction__payment_request__merchant'
+        ).order_by('due_date', 'id')
+
+        self.assertEqual(
+            self.render(home_bill_rows(queryset.values(*HOME_BILL_COLUMNS))),
+            self.render(HomeBillSerializer(queryset, many=True).data)
+        )
+
+    def test_transaction_history(self):
+        queryset = WalletTransaction.objects.filter(account__user=self.user).select_related(
+            'payment_request__merchant'
+        ).order_by('-created_at', '-id')
+
+        self.assertEqual(
+            self.render(transaction_history_rows(queryset.values(*TRANSACTION_HISTORY_COLUMNS))),
+            self.render(TransactionHistorySerializer(queryset, many=True).data)
+        )
+
+    def test_my_transactions(self):
+        queryset = WalletTransaction.objects.filter(account__user=self.user).select_related(
+            'payment_request__merchant'
+        ).order_by('-created_at', '-id')
+
+        self.assertEqual(
+            self.render(my_transaction_rows(queryset.values(*TRANSACTION_HISTORY_COLUMNS))),
+            self.render(WalletTransactionSerializer(queryset, many=True).data)
+        )
+
+    def test_views_page_like_before(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(reverse('wallets:list-transactions'), {'page_size': 5})
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('X-Next-Cursor', response)
+
+        response = client.get(reverse('wallets:home-list-bills'))
+        self.assertEqual(len(response.data), InstallmentBill.objects.filter(account__user=self.user).count())
+
+
+class WalletExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name='ร้าน "Export", สาขา 1', tax_id='EXPORT-0001', status=active_status)
+
+        User = get_user_model()
+        cls.user = User.objects.create_user(username='exporter', email='exporter@example.com', password=None)
+        cls.other = User.objects.create_user(username='other', email='other@example.com', password=None)
+        cls.staff = User.objects.create_user(username='support', email='support@example.com', password=None, is_staff=True)
+        account = WalletAccount.objects.get(user=cls.user)
+
+        cls.now = timezone.now()
+        cls.today = timezone.localdate()
+        for days_ago in range(5):
+            req = PaymentRequest.objects.create(
+                merchant=merchant, amount=Decimal('100.00'),
+                status=PaymentRequest.Status.PAID, customer=cls.user, paid_at=cls.now
+            )
+            txn = WalletTransaction.objects.create(
+                account=account, type_code=WalletTransaction.TxnType.PAYMENT, signed_amount=Decimal('100.00'),
+                balance_due_after=Decimal('100.00') * (days_ago + 1), payment_request=req
+            )
+            WalletTransaction.objects.filter(pk=txn.pk).update(created_at=cls.now - timedelta(days=days_ago))
+            InstallmentBill.objects.create(
+                transaction=txn, account=account, amount_due=Decimal('100.00'),
+                due_date=cls.today + timedelta(days=30 - days_ago)
+            )
+        WalletTransaction.objects.create(
+            account=account, type_code=WalletTransaction.TxnType.REPAYMENT,
+            signed_amount=Decimal('-100.00'), balance_due_after=Decimal('400.00')
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('wallets:wallet-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_transactions(self):
+        import csv
+        rows = list(csv.reader(io.StringIO(self.export().lstrip('\ufeff'))))
+
+        self.assertEqual(rows[0], ['id', 'created_at', 'type', 'amount', 'balance_due_after', 'merchant', 'payment_request_id'])
+        expected = WalletTransaction.objects.filter(account__user=self.user).order_by('-created_at', '-id')
+        self.assertEqual([row[0] for row in rows[1:]], [str(pk) for pk in expected.values_list('id', flat=True)])
+        self.assertIn('ร้าน "Export", สาขา 1', [row[5] for row in rows])
+        self.assertIn(['REPAYMENT', '-100.00', '', ''], [[row[2], row[3], row[5], row[6]] for row in rows])
+
+    def test_ndjson_bills(self):
+        lines = self.export(kind='bills', output='ndjson').splitlines()
+        items = [json.loads(line) for line in lines]
+
+        self.assertEqual(len(items), 5)
+        self.assertEqual([item['due_date'] for item in items], sorted(item['due_date'] for item in items))
+        self.assertEqual(items[0]['amount_due'], '100.00')
+        self.assertEqual(items[0]['status'], 'PENDING')
+        self.assertIsNone(items[0]['paid_at'])
+
+    def test_date_range(self):
+        yesterday = self.today - timedelta(days=1)
+        items = [
+            json.loads(line)
+            for line in self.export(output='ndjson', date_from=yesterday, date_to=yesterday).splitlines()
+        ]
+        self.assertTrue(items)
+        self.assertEqual({item['created_at'][:10] for item in items}, {yesterday.isoformat()})
+
+        self.assertEqual(
+            len(self.export(kind='bills', output='ndjson', date_to=self.today + timedelta(days=27)).splitlines()),
+            2
+        )
+
+    def test_other_user_needs_staff(self):
+        response = self.client.get(reverse('wallets:wallet-export'), {'user': self.other.pk})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(self.staff)
+        body = self.export(user=self.user.pk, output='ndjson')
+        self.assertEqual(len(body.splitlines()), 6)
+
+    def test_invalid_params(self):
+        response = self.client.get(
+            reverse('wallets:wallet-export'),
+            {'output': 'xlsx', 'date_from': self.today, 'date_to': self.today - timedelta(days=1)}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# cache ที่แชร์ข้าม process (แทน redis ใน test)
+SHARED_CACHES = {
+    **settings.CACHES,
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.mkdtemp(prefix='jaikorn-test-cache-'),
+    },
+}
+
+
+@override_settings(CACHES=SHARED_CACHES, CREDIT_SUMMARY_CACHE='shared')
+class CreditSummaryCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Cache Shop', tax_id='CACHE-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='cache', email='cache@example.com', password=None)
+        WalletAccount.objects.filter(user=cls.user).update(credit_limit=Decimal('1000.00'))
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summary(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('wallets:customer-credit-summary'))
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(ctx.captured_queries)
+
+    def checkout(self, amount: str) -> WalletTransaction:
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount))
+        return execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=3)
+
+    def test_fill_on_miss(self):
+        first, queries = self.summary()
+        self.assertEqual(queries, 1)
+        self.assertEqual(Decimal(first['available']), Decimal('1000.00'))
+
+        second, queries = self.summary()
+        self.assertEqual((second, queries), (first, 0))
+
+    def test_local_memory_cache_is_not_used(self):
+        with override_settings(CREDIT_SUMMARY_CACHE='default'):
+            self.summary()
+            self.assertEqual(self.summary()[1], 1)
+
+            with self.assertLogs('wallets.cache', 'WARNING') as logs:
+                warn_if_disabled()
+            self.assertIn("CREDIT_SUMMARY_CACHE='default'", logs.output[0])
+
+        with self.assertNoLogs('wallets.cache', 'WARNING'):
+            warn_if_disabled()
+
+    def test_checkout_and_repayment_refresh_after_commit(self):
+        before, _ = self.summary()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            txn = self.checkout('300.00')
+        after_checkout, queries = self.summary()
+        self.assertEqual(queries, 1)
+        self.assertEqual(Decimal(after_checkout['available']), Decimal('700.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            execute_bulk_bill_repayment(user=self.user, transaction_id=txn.id)
+        after_repayment, _ = self.summary()
+        self.assertEqual(after_repayment, before)
+
+    def test_rollback_keeps_cache(self):
+        before, _ = self.summary()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    self.checkout('300.00')
+                    raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.summary(), (before, 0))
+
+    def test_fill_from_before_commit_is_never_served(self):
+        # reader อ่าน version แล้วอ่าน DB ก่อนการเขียน commit แต่ fill หลังจากนั้น
+        data, key = get_credit_summary(self.user.pk)
+        self.assertIsNone(data)
+        stale = dict(CreditDataSerializer(WalletAccount.objects.get(user=self.user)).data)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.checkout('300.00')
+        fill_credit_summary(key, stale)
+
+        fresh, queries = self.summary()
+        self.assertEqual(queries, 1)
+        self.assertEqual(Decimal(fresh['available']), Decimal('700.00'))
+
+
+class CheckoutTests(TestCase):
+    # execute_bnpl_transaction: ข้อความ error ต้องเหมือนเดิมและไม่มีอะไรถูกบันทึกเมื่อทำรายการไม่สำเร็จ
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Checkout Shop', tax_id='CHECKOUT-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='checkout', email='checkout@example.com', password=None)
+        cls.account = WalletAccount.objects.get(user=cls.user)
+        WalletAccount.objects.filter(pk=cls.account.pk).update(
+            credit_limit=Decimal('500.00'), balance_due=Decimal('400.00')
+        )
+
+    def request(self, amount: str = '90.00', **fields) -> PaymentRequest:
+        return PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount), **fields)
+
+    def assertRejected(self, req: PaymentRequest, message: str):
+        with self.assertRaisesMessage(BNPLServiceError, message) as caught:
+            execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=3)
+        self.assertEqual(str(caught.exception), message)
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance_due, Decimal('400.00'))
+        self.assertFalse(WalletTransaction.objects.filter(payment_request=req).exists())
+        self.assertFalse(ReceivableEntry.objects.filter(merchant=self.merchant).exists())
+
+    def test_pays_request(self):
+        req = self.request()
+        txn = execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=3)
+
+        req.refresh_from_db()
+        self.account.refresh_from_db()
+        self.assertEqual((req.status, req.customer_id), (PaymentRequest.Status.PAID, self.user.pk))
+        self.assertIsNotNone(req.paid_at)
+        self.assertEqual(self.account.balance_due, Decimal('490.00'))
+        self.assertEqual(txn.balance_due_after, Decimal('490.00'))
+        self.assertEqual(
+            list(InstallmentBill.objects.filter(transaction=txn).order_by('due_date').values_list('amount_due', flat=True)),
+            [Decimal('30.00')] * 3
+        )
+
+    def test_insufficient_credit(self):
+        self.assertRejected(self.request('100.01'), 'วงเงินไม่เพียงพอ (คงเหลือ: 100.00)')
+        self.assertEqual(PaymentRequest.objects.filter(status=PaymentRequest.Status.PENDING).count(), 1)
+
+    def test_missing_request(self):
+        with self.assertRaisesMessage(BNPLServiceError, 'Payment Request นี้ไม่มีอยู่จริง'):
+            execute_bnpl_transaction(user=self.user, payment_request_id=uuid.uuid4(), installment_months=3)
+
+    def test_request_not_pending(self):
+        cases = (
+            ({'status': PaymentRequest.Status.PAID}, 'บิลนี้ถูกจ่ายไปแล้ว'),
+            ({'status': PaymentRequest.Status.EXPIRED}, 'QR นี้หมดอายุแล้ว'),
+            ({'expires_at': timezone.now() - timedelta(seconds=1)}, 'QR นี้หมดอายุแล้ว'),
+            ({'status': 'VOID'}, "ไม่สามารถทำรายการได้เนื่องจากสถานะเป็น 'VOID'"),
+        )
+        for fields, message in cases:
+            with self.subTest(fields=fields):
+                self.assertRejected(self.request(**fields), message)
+
+    def test_merchant_cannot_pay_itself(self):
+        MerchantUser.objects.create(merchant=self.merchant, user=self.user)
+        self.assertRejected(self.request(), 'ร้านค้าไม่สามารถทำรายการชำระเงินให้ตัวเองได้')
+
+    def test_undiagnosed_claim_failure(self):
+        # claim ไม่สำเร็จแต่ตรวจแล้วคำขอยังจ่ายได้ ต้องไม่บอกว่าสถานะเป็น PENDING
+        with mock.patch('wallets.services._claim_payment_request', return_value=None):
+            self.assertRejected(self.request(), 'ไม่สามารถทำรายการได้ในขณะนี้ กรุณาลองใหม่อีกครั้ง')
+
+
+class RepaymentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Repay Shop', tax_id='REPAY-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='repay', email='repay@example.com', password=None)
+        cls.other = get_user_model().objects.create_user(username='repay2', email='repay2@example.com', password=None)
+        cls.account = WalletAccount.objects.get(user=cls.user)
+        WalletAccount.objects.filter(pk=cls.account.pk).update(credit_limit=Decimal('5000.00'))
+
+    def setUp(self):
+        self.first = self.pay('100.00')
+        self.second = self.pay('60.00')
+
+    def pay(self, amount: str) -> WalletTransaction:
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount))
+        return execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=3)
+
+    def bills(self, txn: WalletTransaction):
+        return InstallmentBill.objects.filter(transaction=txn).order_by('due_date', 'id')
+
+    def balance(self) -> Decimal:
+        return WalletAccount.objects.values_list('balance_due', flat=True).get(pk=self.account.pk)
+
+    def test_single_bill(self):
+        bill = self.bills(self.first).first()
+        paid = execute_bill_repayment(user=self.user, bill_id=bill.id)
+
+        stored = InstallmentBill.objects.get(pk=bill.pk)
+        self.assertEqual(stored.status, InstallmentBill.Status.PAID)
+        self.assertEqual(stored.paid_at, paid.paid_at)
+        self.assertEqual(stored.repayment_transaction_id, paid.repayment_transaction.id)
+        self.assertEqual(paid.repayment_transaction.signed_amount, -bill.amount_due)
+        self.assertEqual(self.balance(), Decimal('160.00') - bill.amount_due)
+        self.assertEqual(paid.repayment_transaction.balance_due_after, self.balance())
+
+        with self.assertRaisesMessage(BNPLServiceError, 'บิลนี้ถูกจ่ายไปแล้ว'):
+            execute_bill_repayment(user=self.user, bill_id=bill.id)
+        with self.assertRaisesMessage(BNPLServiceError, 'ไม่พบบิลนี้ หรือคุณไม่มีสิทธิ์จ่าย'):
+            execute_bill_repayment(user=self.other, bill_id=self.bills(self.first).last().id)
+        self.assertEqual(self.balance(), Decimal('160.00') - bill.amount_due)
+
+    def test_bulk_settles_rest_of_partially_paid_transaction(self):
+        first_bill = self.bills(self.first).first()
+        execute_bill_repayment(user=self.user, bill_id=first_bill.id)
+        InstallmentBill.objects.filter(pk=self.bills(self.first).last().pk).update(status=InstallmentBill.Status.OVERDUE)
+
+        repayment, settled = execute_bulk_bill_repayment(user=self.user, transaction_id=self.first.id)
+
+        remaining = self.bills(self.first).exclude(pk=first_bill.pk)
+        self.assertEqual(set(settled), set(remaining.values_list('id', flat=True)))
+        self.assertEqual(repayment.signed_amount, -(Decimal('100.00') - first_bill.amount_due))
+        self.assertEqual(self.balance(), Decimal('60.00'))
+        self.assertEqual(repayment.balance_due_after, Decimal('60.00'))
+        self.assertEqual(
+            set(remaining.values_list('status', 'repayment_transaction_id', 'paid_at')),
+            {(InstallmentBill.Status.PAID, repayment.id, InstallmentBill.objects.get(pk=settled[0]).paid_at)}
+        )
+        # บิลของอีกรายการไม่ถูกแตะ
+        self.assertFalse(self.bills(self.second).filter(status=InstallmentBill.Status.PAID).exists())
+
+        with self.assertRaisesMessage(BNPLServiceError, 'ไม่มีบิลที่ต้องชำระ'):
+            execute_bulk_bill_repayment(user=self.user, transaction_id=self.first.id)
+        self.assertEqual(self.balance(), Decimal('60.00'))
+        self.assertEqual(
+            WalletTransaction.objects.filter(account=self.account, type_code=WalletTransaction.TxnType.REPAYMENT).count(),
+            2
+        )
+
+    def test_bulk_by_ids_rejects_paid_or_foreign_bills(self):
+        paid = self.bills(self.first).first()
+        execute_bill_repayment(user=self.user, bill_id=paid.id)
+        open_bill = self.bills(self.second).first()
+
+        with self.assertRaisesMessage(BNPLServiceError, 'บางบิลไม่พบ ถูกจ่ายไปแล้ว หรือคุณไม่มีสิทธิ์จ่าย'):
+            execute_bulk_bill_repayment(user=self.user, bill_ids=[paid.id, open_bill.id])
+        with self.assertRaisesMessage(BNPLServiceError, 'ไม่มีบิลที่ต้องชำระ'):
+            execute_bulk_bill_repayment(user=self.other, bill_ids=[open_bill.id])
+        with self.assertRaisesMessage(BNPLServiceError, 'กรุณาระบุบิลที่ต้องการชำระ'):
+            execute_bulk_bill_repayment(user=self.user)
+        self.assertEqual(self.balance(), Decimal('160.00') - paid.amount_due)
+
+        repayment, settled = execute_bulk_bill_repayment(user=self.user, bill_ids=[open_bill.id, open_bill.id])
+        self.assertEqual(settled, [open_bill.id])
+        self.assertEqual(self.balance(), Decimal('160.00') - paid.amount_due - open_bill.amount_due)
+
+    def test_bulk_due_before(self):
+        due_before = self.bills(self.first).first().due_date + timedelta(days=1)
+        repayment, settled = execute_bulk_bill_repayment(user=self.user, due_before=due_before)
+
+        self.assertEqual(len(settled), 2)
+        self.assertEqual(repayment.signed_amount, Decimal('-53.33'))
+        self.assertEqual(self.balance(), Decimal('106.67'))
+
+
+class OverdueSweeperTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        merchant = Merchant.objects.create(name='Overdue Shop', tax_id='OVERDUE-0001', status=active_status)
+        user = get_user_model().objects.create_user(username='overdue', email='overdue@example.com', password=None)
+        account = WalletAccount.objects.get(user=user)
+        req = PaymentRequest.objects.create(
+            merchant=merchant, amount=Decimal('70.00'), status=PaymentRequest.Status.PAID, customer=user,
+            paid_at=timezone.now()
+        )
+        txn = WalletTransaction.objects.create(
+            account=account, type_code=WalletTransaction.TxnType.PAYMENT, signed_amount=Decimal('70.00'),
+            balance_due_after=Decimal('70.00'), payment_request=req
+        )
+
+        cls.today = timezone.localdate()
+        cls.bills = {}
+        for name, days, status in (
+            ('late', -3, InstallmentBill.Status.PENDING),
+            ('yesterday', -1, InstallmentBill.Status.PENDING),
+            ('today', 0, InstallmentBill.Status.PENDING),
+            ('future', 5, InstallmentBill.Status.PENDING),
+            ('paid', -3, InstallmentBill.Status.PAID),
+            ('overdue', -10, InstallmentBill.Status.OVERDUE),
+        ):
+            cls.bills[name] = InstallmentBill.objects.create(
+                transaction=txn, account=account, amount_due=Decimal('10.00'),
+                due_date=cls.today + timedelta(days=days), status=status
+            )
+
+    def statuses(self) -> dict:
+        by_pk = dict(InstallmentBill.objects.values_list('pk', 'status'))
+        return {name: by_pk[bill.pk] for name, bill in self.bills.items()}
+
+    def test_marks_only_pending_bills_past_due(self):
+        self.assertEqual(list(mark_overdue_bills(today=self.today, batch_size=1)), [1, 1])
+        self.assertEqual(self.statuses(), {
+            'late': InstallmentBill.Status.OVERDUE,
+            'yesterday': InstallmentBill.Status.OVERDUE,
+            'today': InstallmentBill.Status.PENDING,
+            'future': InstallmentBill.Status.PENDING,
+            'paid': InstallmentBill.Status.PAID,
+            'overdue': InstallmentBill.Status.OVERDUE,
+        })
+
+        self.assertEqual(list(mark_overdue_bills(today=self.today)), [])
+
+    def test_dry_run_writes_nothing(self):
+        before = self.statuses()
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('mark_overdue_bills', '--dry-run', stdout=out)
+
+        self.assertIn('[dry-run] 2 bills would be marked OVERDUE', out.getvalue())
+        self.assertEqual(self.statuses(), before)
+        self.assertEqual([q['sql'] for q in queries if not q['sql'].lstrip().upper().startswith('SELECT')], [])
+
+        call_command('mark_overdue_bills', stdout=io.StringIO())
+        self.assertEqual(self.statuses()['late'], InstallmentBill.Status.OVERDUE)
+
+
+class IdempotencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Idempotent Shop', tax_id='IDEMPOTENT-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='idempotent', email='idempotent@example.com', password=None)
+        WalletAccount.objects.filter(user=cls.user).update(credit_limit=Decimal('5000.00'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal('90.00'))
+        self.url = reverse('wallets:customer-pay-request', args=[self.req.id])
+
+    def pay(self, key: str, months: int = 3):
+        return self.client.post(
+            self.url, {'installment_months': months}, format='json', headers={'Idempotency-Key': key}
+        )
+
+    def reserve(self, key: str, *, age: timedelta) -> IdempotencyKey:
+        record = IdempotencyKey.objects.create(
+            user=self.user, key=key, endpoint=self.url, expires_at=timezone.now() + settings.IDEMPOTENCY_KEY_TTL
+        )
+        IdempotencyKey.objects.filter(pk=record.pk).update(created_at=timezone.now() - age)
+        return record
+
+    def test_replays_stored_response(self):
+        first = self.pay('k-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        replay = self.pay('k-1')
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.data['transaction_id'], str(first.data['transaction_id']))
+        self.assertEqual(WalletTransaction.objects.filter(payment_request=self.req).count(), 1)
+
+    def test_same_key_different_body_is_rejected(self):
+        first = self.pay('k-5')
+        self.assertEqual(first.status_code, 201)
+
+        reused = self.pay('k-5', months=6)
+        self.assertEqual(reused.status_code, 422)
+        self.assertNotIn('Idempotent-Replayed', reused)
+        self.assertEqual(WalletTransaction.objects.filter(payment_request=self.req).count(), 1)
+
+        # ช่องว่างใน JSON ไม่มีผล
+        replay = self.client.post(
+            self.url, '{ "installment_months" : 3 }', content_type='application/json',
+            headers={'Idempotency-Key': 'k-5'}
+        )
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+
+    def test_in_flight_key_conflicts(self):
+        self.reserve('k-2', age=timedelta(seconds=1))
+
+        response = self.pay('k-2')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(WalletTransaction.objects.filter(payment_request=self.req).exists())
+
+    def test_stale_reservation_is_reclaimed(self):
+        # worker ที่จองคีย์ไว้ตายไปก่อนบันทึกผล: เกิน IDEMPOTENCY_IN_FLIGHT_TIMEOUT แล้ว retry ทำรายการได้
+        stale = self.reserve('k-3', age=settings.IDEMPOTENCY_IN_FLIGHT_TIMEOUT + timedelta(seconds=1))
+
+        response = self.pay('k-3')
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(IdempotencyKey.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(
+            IdempotencyKey.objects.get(user=self.user, key='k-3').status_code, 201
+        )
+
+    def test_server_error_releases_key(self):
+        with mock.patch('wallets.views.execute_bnpl_transaction', side_effect=RuntimeError('boom')), \
+                self.assertLogs('wallets.views', 'ERROR'):
+            response = self.pay('k-4')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.filter(user=self.user, key='k-4').exists())
+
+        retry = self.pay('k-4')
+        self.assertEqual(retry.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', retry)
+
+    def test_over_long_key(self):
+        response = self.pay('k' * (IdempotencyKey._meta.get_field('key').max_length + 1))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertFalse(WalletTransaction.objects.filter(payment_request=self.req).exists())
+
+
+class StatementTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.active = User.objects.create_user(username='stmt-active', email='stmt-active@example.com', password=None)
+        cls.idle = User.objects.create_user(username='stmt-idle', email='stmt-idle@example.com', password=None)
+        account = WalletAccount.objects.get(user=cls.active)
+
+        cls.period = date(2025, 3, 1)
+        at = lambda day: timezone.make_aware(datetime(2025, 3, 1) + timedelta(days=day))
+        WalletAccount.objects.update(created_at=at(-90))
+
+        for type_code, amount, balance, day in (
+            (WalletTransaction.TxnType.PAYMENT, '100.00', '100.00', -10),
+            (WalletTransaction.TxnType.PAYMENT, '50.00', '150.00', 3),
+            (WalletTransaction.TxnType.REPAYMENT, '-30.00', '120.00', 10),
+            (WalletTransaction.TxnType.FEE, '5.00', '125.00', 20),
+            (WalletTransaction.TxnType.PAYMENT, '10.00', '135.00', 35),
+        ):
+            txn = WalletTransaction.objects.create(
+                account=account, type_code=type_code, signed_amount=Decimal(amount),
+                balance_due_after=Decimal(balance)
+            )
+            WalletTransaction.objects.filter(pk=txn.pk).update(created_at=at(day))
+
+        for due in (date(2025, 3, 15), date(2025, 3, 31), date(2025, 4, 15)):
+            InstallmentBill.objects.create(transaction=txn, account=account, amount_due=Decimal('40.00'), due_date=due)
+
+    def generate(self):
+        return [
+            generate_statement_partition(period=self.period, first_account_id=first, last_account_id=last)
+            for first, last in statement_partitions(period=self.period, size=1)
+        ]
+
+    def test_generate(self):
+        partitions = self.generate()
+        self.assertEqual(sum(p.statement_count for p in partitions), 2)
+
+        active = Statement.objects.get(account__user=self.active, period=self.period)
+        self.assertEqual(active.opening_balance, Decimal('100.00'))
+        self.assertEqual(active.payment_total, Decimal('50.00'))
+        self.assertEqual(active.repayment_total, Decimal('-30.00'))
+        self.assertEqual(active.fee_total, Decimal('5.00'))
+        self.assertEqual(active.transaction_count, 3)
+        self.assertEqual(active.bills_due_total, Decimal('80.00'))
+        self.assertEqual(active.bills_due_count, 2)
+        self.assertEqual(active.closing_balance, Decimal('125.00'))
+
+        idle = Statement.objects.get(account__user=self.idle, period=self.period)
+        self.assertEqual((idle.opening_balance, idle.closing_balance, idle.transaction_count), (0, 0, 0))
+
+    def test_resumable(self):
+        first, last = next(statement_partitions(period=self.period, size=1))
+        generate_statement_partition(period=self.period, first_account_id=first, last_account_id=last)
+
+        remaining = list(statement_partitions(period=self.period, size=1))
+        self.assertEqual(len(remaining), 1)
+        self.assertNotEqual(remaining[0][0], first)
+
+        self.generate()
+        self.assertEqual(list(statement_partitions(period=self.period, size=1)), [])
+        self.assertEqual(Statement.objects.filter(period=self.period).count(), 2)
+
+    def test_opening_balance_from_archive(self):
+        # รายการก่อนต้นเดือนถูก archive ไปแล้ว ใบแจ้งยอดที่สร้างย้อนหลังยังยกยอดมาถูก
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storages = {
+            **settings.STORAGES,
+            settings.WALLET_ARCHIVE_STORAGE: {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': directory.name},
+            },
+        }
+        WalletAccount.objects.filter(user=self.active).update(balance_due=Decimal('135.00'))
+        with override_settings(STORAGES=storages):
+            self.assertEqual([p for _, _, problems in reconcile_ledger() for p in problems], [])
+            archives = [
+                archive
+                for _, batch in archive_wallet_history(before=timezone.make_aware(datetime(2025, 3, 1)))
+                for archive in batch
+            ]
+        self.assertEqual([(a.transaction_count, a.balance) for a in archives], [(1, Decimal('100.00'))])
+
+        self.generate()
+        active = Statement.objects.get(account__user=self.active, period=self.period)
+        self.assertEqual((active.opening_balance, active.closing_balance), (Decimal('100.00'), Decimal('125.00')))
+
+
+class LedgerReconciliationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Ledger Shop', tax_id='LEDGER-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='ledger', email='ledger@example.com', password=None)
+        cls.account = WalletAccount.objects.get(user=cls.user)
+        WalletAccount.objects.filter(pk=cls.account.pk).update(credit_limit=Decimal('5000.00'))
+
+    def pay(self, amount: str) -> WalletTransaction:
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount))
+        return execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=2)
+
+    def reconcile(self, **kwargs):
+        totals = [0, 0]
+        problems = []
+        for accounts, transactions, batch_problems in reconcile_ledger(batch_size=2, **kwargs):
+            totals[0] += accounts
+            totals[1] += transactions
+            problems.extend(batch_problems)
+        return totals, problems
+
+    def test_clean_ledger_is_incremental(self):
+        self.pay('100.00')
+        txn = self.pay('50.00')
+        bill = InstallmentBill.objects.filter(transaction=txn).first()
+        execute_bill_repayment(user=self.user, bill_id=bill.id)
+
+        (_, scanned), problems = self.reconcile()
+        self.assertEqual(problems, [])
+        self.assertEqual(scanned, 3)
+
+        checkpoint = LedgerCheckpoint.objects.get(account=self.account)
+        self.assertEqual(checkpoint.balance, Decimal('125.00'))
+
+        (_, scanned), problems = self.reconcile()
+        self.assertEqual((scanned, problems), (0, []))
+
+        self.pay('10.00')
+        (_, scanned), problems = self.reconcile()
+        self.assertEqual((scanned, problems), (1, []))
+
+    def test_detects_and_repairs_drift(self):
+        self.pay('100.00')
+        self.reconcile()
+        second = self.pay('40.00')
+        third = self.pay('60.00')
+
+        WalletTransaction.objects.filter(pk=second.pk).update(balance_due_after=Decimal('999.00'))
+        WalletAccount.objects.filter(pk=self.account.pk).update(balance_due=Decimal('190.00'))
+
+        _, problems = self.reconcile()
+        self.assertEqual(len(problems), 1)
+        report = problems[0]
+        self.assertEqual(report['mismatches'], [(second.id, Decimal('999.00'), Decimal('140.00'))])
+        self.assertEqual((report['balance_due'], report['expected_balance']), (Decimal('190.00'), Decimal('200.00')))
+
+        # ไม่ repair: checkpoint ไม่ขยับ รอบหน้ายังเจอเหมือนเดิม
+        _, problems = self.reconcile()
+        self.assertEqual(len(problems), 1)
+
+        _, problems = self.reconcile(repair=True)
+        self.assertTrue(problems[0]['repaired'])
+
+        second.refresh_from_db()
+        self.account.refresh_from_db()
+        self.assertEqual(second.balance_due_after, Decimal('140.00'))
+        self.assertEqual(self.account.balance_due, Decimal('200.00'))
+        self.assertEqual(LedgerCheckpoint.objects.get(account=self.account).last_transaction_id, third.id)
+
+        _, problems = self.reconcile()
+        self.assertEqual(problems, [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'restore_archive_checkpoints ใช้ DISTINCT ON ต้องใช้ PostgreSQL')
+class WalletArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Archive Shop', tax_id='ARCHIVE-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='archive', email='archive@example.com', password=None)
+        cls.account = WalletAccount.objects.get(user=cls.user)
+        WalletAccount.objects.filter(pk=cls.account.pk).update(credit_limit=Decimal('5000.00'))
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        storages = {
+            **settings.STORAGES,
+            settings.WALLET_ARCHIVE_STORAGE: {
+                'BACKEND': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': directory.name},
+            },
+        }
+        override = override_settings(STORAGES=storages)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        now = timezone.now()
+        self.before = now - timedelta(days=365)
+
+        # รายการแรกจ่ายครบแล้ว, รายการที่สองยังค้าง จึง archive ได้แค่ก่อนรายการที่สอง
+        self.settled = self.pay('100.00')
+        self.repayments = [
+            execute_bill_repayment(user=self.user, bill_id=bill.id).repayment_transaction
+            for bill in InstallmentBill.objects.filter(transaction=self.settled).order_by('due_date')
+        ]
+        self.open = self.pay('60.00')
+        self.recent = self.pay('10.00')
+
+        for days, txn in zip((400, 399, 398, 380), (self.settled, *self.repayments, self.open)):
+            WalletTransaction.objects.filter(pk=txn.pk).update(created_at=now - timedelta(days=days))
+
+    def pay(self, amount: str) -> WalletTransaction:
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount))
+        return execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=2)
+
+    def reconcile(self):
+        return [problem for _, _, problems in reconcile_ledger() for problem in problems]
+
+    def archive(self):
+        return [archive for _, archives in archive_wallet_history(before=self.before) for archive in archives]
+
+    def history(self, name: str = 'list-transactions') -> list[dict]:
+        rows, params = [], {'page_size': 2}
+        while True:
+            response = self.client.get(reverse(f'wallets:{name}'), params)
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.data)
+            if 'X-Next-Cursor' not in response:
+                return rows
+            params = {'page_size': 2, 'cursor': response['X-Next-Cursor']}
+
+    def test_requires_reconciled_ledger(self):
+        self.assertEqual(self.archive(), [])
+        self.assertEqual(WalletTransaction.objects.filter(account=self.account).count(), 5)
+
+    def test_archives_settled_history_and_reads_through(self):
+        self.assertEqual(self.reconcile(), [])
+        expected = self.history()
+        self.assertEqual(len(expected), 5)
+
+        archives = self.archive()
+        self.assertEqual(len(archives), 1)
+        archive = archives[0]
+        self.assertEqual((archive.transaction_count, archive.bill_count), (3, 2))
+
+        archived_ids = [self.repayments[1].id, self.repayments[0].id, self.settled.id]
+        transactions, bills = read_archive(archive)
+        self.assertEqual([row['id'] for row in transactions], archived_ids)
+        self.assertEqual({row['status'] for row in bills}, {InstallmentBill.Status.PAID})
+
+        self.assertFalse(WalletTransaction.objects.filter(pk__in=archived_ids).exists())
+        self.assertFalse(InstallmentBill.objects.filter(transaction=self.settled).exists())
+        self.assertEqual(InstallmentBill.objects.filter(transaction=self.open).count(), 2)
+
+        # ประวัติหน้าเดิมทุกหน้า อ่านต่อจาก archive เมื่อ cursor เลยรายการใน DB
+        self.assertEqual(self.history(), expected)
+
+        self.assertEqual(self.archive(), [])
+        self.assertEqual(self.reconcile(), [])
+
+        LedgerCheckpoint.objects.all().delete()
+        self.assertEqual(restore_archive_checkpoints(), 1)
+        self.assertEqual(self.reconcile(), [])
+
+    def export(self, **params) -> list[dict]:
+        response = self.client.get(reverse('wallets:wallet-export'), {'output': 'ndjson', **params})
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+
+    def test_my_transactions_and_export_read_through(self):
+        self.reconcile()
+        bill_dates = InstallmentBill.objects.filter(account=self.account).values_list('due_date', flat=True)
+        # ช่วงวันที่ที่ครอบทั้งรายการใน archive และใน DB
+        ranges = [
+            {},
+            {'date_from': timezone.localdate() - timedelta(days=399), 'date_to': timezone.localdate() - timedelta(days=380)},
+            {'kind': 'bills', 'date_from': min(bill_dates) + timedelta(days=1)},
+        ]
+        expected_history = self.history('my-transaction-history')
+        expected_exports = [self.export(**params) for params in ranges]
+        expected_bills = self.export(kind='bills')
+        self.assertEqual(len(expected_history), 5)
+        self.assertEqual(len(expected_exports[1]), 3)
+        self.assertEqual(len(expected_bills), 6)
+
+        self.assertEqual(self.archive()[0].transaction_count, 3)
+        self.assertEqual(self.history('my-transaction-history'), expected_history)
+        self.assertEqual([self.export(**params) for params in ranges], expected_exports)
+        self.assertEqual(self.export(kind='bills'), expected_bills)
+        self.assertEqual(
+            {item['merchant'] for item in expected_bills if item['transaction_id'] == str(self.settled.id)},
+            {self.merchant.name}
+        )
+
+    def test_history_pages_decode_archive_once(self):
+        self.reconcile()
+        self.archive()
+        wallet_archive._archived_transactions.cache_clear()
+
+        # page_size 2: 2 หน้าจาก archive ต่อ view แต่แปลงไฟล์ครั้งเดียว
+        with mock.patch.object(wallet_archive, '_decode', wraps=wallet_archive._decode) as decode:
+            self.assertEqual(len(self.history()), 5)
+            self.assertEqual(len(self.history('my-transaction-history')), 5)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_history_of_fully_archived_account(self):
+        bills = InstallmentBill.objects.filter(account=self.account).exclude(status=InstallmentBill.Status.PAID)
+        for bill in bills:
+            execute_bill_repayment(user=self.user, bill_id=bill.id)
+        ordered = WalletTransaction.objects.filter(account=self.account).order_by('created_at', 'id')
+        for minutes, pk in enumerate(ordered.values_list('id', flat=True)):
+            WalletTransaction.objects.filter(pk=pk).update(created_at=self.before - timedelta(days=1, minutes=-minutes))
+        self.reconcile()
+        expected = self.history()
+
+        # checkpoint (รายการล่าสุด) ยังอยู่ใน DB ที่เหลือไป archive ทั้งหมด
+        self.assertEqual(self.archive()[0].transaction_count, len(expected) - 1)
+        self.assertEqual(WalletArchive.objects.filter(account=self.account).count(), 1)
+        self.assertEqual(self.history(), expected)
+
+        WalletTransaction.objects.filter(account=self.account).delete()
+        self.assertEqual(self.history(), expected[1:])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning ต้องใช้ PostgreSQL')
+class PartitioningTests(TestCase):
+    # DDL ของ PostgreSQL อยู่ใน transaction จึงแปลงตารางใน test ได้ แล้ว rollback กลับเป็นตารางปกติเมื่อจบ test
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Partition Shop', tax_id='PART-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='partition', email='partition@example.com', password=None)
+        cls.account = WalletAccount.objects.get(user=cls.user)
+        WalletAccount.objects.filter(pk=cls.account.pk).update(credit_limit=Decimal('5000.00'))
+
+    def pay(self, amount: str) -> WalletTransaction:
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount))
+        return execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=3)
+
+    def partition(self):
+        # ข้อมูลเดิมย้อนไป 3 เดือน เดือนนี้จึงได้ partition ของตัวเอง
+        self.old = [self.pay('90.00'), self.pay('30.00')]
+        WalletTransaction.objects.update(created_at=timezone.now() - timedelta(days=100))
+        # FK แบบ deferred ที่ค้างอยู่ใน transaction ของ test ทำให้ ALTER TABLE ไม่ได้
+        connection.check_constraints()
+
+        for model in (WalletTransaction, InstallmentBill):
+            convert_to_partitioned(model)
+            ensure_partitions(model)
+
+    def located_in(self, model, pk) -> str:
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT tableoid::regclass::text FROM {model._meta.db_table} WHERE id = %s', [pk])
+            return cursor.fetchone()[0]
+
+    def test_orm_works_on_partitioned_tables(self):
+        self.partition()
+        this_month = timezone.localdate().replace(day=1)
+        txn_table = WalletTransaction._meta.db_table
+        current = f'{txn_table}_p{this_month:%Y%m}'
+
+        self.assertTrue(is_partitioned(WalletTransaction))
+        self.assertTrue(is_partitioned(InstallmentBill))
+        self.assertIn(current, partitions_of(WalletTransaction))
+
+        txn = self.pay('60.00')
+        self.assertEqual(self.located_in(WalletTransaction, txn.pk), current)
+        self.assertRegex(self.located_in(WalletTransaction, self.old[0].pk), rf'^{txn_table}_until_\d{{6}}$')
+
+        bill = InstallmentBill.objects.filter(transaction=self.old[0]).order_by('due_date').first()
+        paid = execute_bill_repayment(user=self.user, bill_id=bill.id)
+        bill.refresh_from_db()
+        self.assertEqual(bill.status, InstallmentBill.Status.PAID)
+        self.assertEqual(self.located_in(WalletTransaction, paid.repayment_transaction_id), current)
+        self.assertEqual(WalletTransaction.objects.filter(account=self.account).count(), 4)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('wallets:my-transaction-history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+
+        # ประวัติช่วงเดือนนี้ต้อง prune เหลือ partition เดียว
+        recent = WalletTransaction.objects.filter(
+            account=self.account,
+            created_at__gte=timezone.make_aware(datetime.combine(this_month, datetime.min.time())),
+            created_at__lt=timezone.make_aware(datetime.combine(this_month + relativedelta(months=1), datetime.min.time()))
+        ).values_list('id', flat=True)
+        sql, params = recent.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+        scanned = {node['Relation Name'] for node in _walk(plan[0]['Plan']) if 'Relation Name' in node}
+        self.assertEqual(scanned, {current})
+
+    def test_legacy_partition_ends_this_month(self):
+        self.partition()
+        next_month = timezone.localdate().replace(day=1) + relativedelta(months=1)
+        bill_table = InstallmentBill._meta.db_table
+
+        legacy = {name: upper for name, upper in partitions_of(InstallmentBill).items() if '_until_' in name}
+        self.assertEqual(list(legacy.values()), [next_month])
+        # บิลของข้อมูลเดิมที่ครบกำหนดเดือนหน้าเป็นต้นไปถูกย้ายเข้า partition รายเดือน
+        bills = InstallmentBill.objects.filter(transaction__in=self.old).values_list('id', 'due_date')
+        self.assertEqual(len(bills), 6)
+        for pk, due_date in bills:
+            expected = list(legacy)[0] if due_date < next_month else f'{bill_table}_p{due_date:%Y%m}'
+            self.assertEqual(self.located_in(InstallmentBill, pk), expected)
+
+    def test_payment_request_stays_unique(self):
+        self.partition()
+        table = WalletTransaction._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT indexdef FROM pg_indexes WHERE tablename = %s', [table])
+            definitions = [definition for definition, in cursor.fetchall()]
+        self.assertIn('USING btree (payment_request_id, created_at)', '\n'.join(
+            definition for definition in definitions if definition.startswith('CREATE UNIQUE INDEX')
+        ))
+
+        original = WalletTransaction.objects.get(pk=self.old[0].pk)
+        duplicate = self.pay('10.00')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            WalletTransaction.objects.filter(pk=duplicate.pk).update(
+                payment_request=original.payment_request_id, created_at=original.created_at
+            )
+
+    def test_rows_in_default_partition_are_moved(self):
+        self.partition()
+        txn = self.old[0]
+        far = timezone.localdate().replace(day=1) + timedelta(days=31 * 20)
+        bill = InstallmentBill.objects.create(
+            transaction=txn, account=self.account, amount_due=Decimal('1.00'), due_date=far
+        )
+        bill_table = InstallmentBill._meta.db_table
+        self.assertEqual(self.located_in(InstallmentBill, bill.pk), f'{bill_table}_default')
+
+        created = ensure_partitions(InstallmentBill, months_ahead=24)
+        self.assertIn(f'{bill_table}_p{far:%Y%m}', created)
+        self.assertEqual(self.located_in(InstallmentBill, bill.pk), f'{bill_table}_p{far:%Y%m}')
+        self.assertEqual(ensure_partitions(InstallmentBill, months_ahead=24), [])
+
+    def test_detach_skips_partitions_with_open_bills(self):
+        self.partition()
+        later = timezone.localdate() + timedelta(days=31 * 30)
+        legacy = next(name for name in partitions_of(WalletTransaction) if '_until_' in name)
+
+        detached = dict(detach_partitions(WalletTransaction, older_than_months=1, today=later))
+        self.assertFalse(detached[legacy])
+        self.assertTrue(WalletTransaction.objects.filter(pk=self.old[0].pk).exists())
+
+        InstallmentBill.objects.update(status=InstallmentBill.Status.PAID)
+        detached = dict(detach_partitions(WalletTransaction, older_than_months=1, today=later))
+        self.assertEqual(detached, {legacy: True})
+        self.assertFalse(WalletTransaction.objects.filter(pk=self.old[0].pk).exists())
+        self.assertNotIn(legacy, partitions_of(WalletTransaction))
+
+
+@override_settings(
+    CACHES=SHARED_CACHES,
+    DATABASE_REPLICAS=['replica_0'],
+    DB_REPLICA_LAG_CHECK_SECONDS=3600,
+    DB_REPLICA_STICKY_SECONDS=60,
+    DB_REPLICA_PIN_CACHE='shared',
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    # ตัดสินใจของ router เท่านั้น (ไม่มี replica จริงใน test) lag ถูกบันทึกไว้ล่วงหน้าจึงไม่ต้องต่อ replica
+
+    def setUp(self):
+        caches['shared'].clear()
+        record_replica_lag('replica_0', 0.2)
+        self.factory = RequestFactory()
+        self.user = get_user_model()(id=uuid.uuid4())
+
+    def route(self, method: str, user=None) -> str:
+        routes = []
+
+        def view(request):
+            routes.append(ReplicaRouter().db_for_read(WalletAccount))
+            # DRF ตั้ง request.user หลัง authenticate ใน view
+            if user is not None:
+                request.user = user
+                routes.append(ReplicaRouter().db_for_read(WalletAccount))
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/api/wallets/me/summary/')
+        ReplicaMiddleware(view)(request)
+        request_finished.send(sender=self.__class__)
+        return routes[-1]
+
+    def test_safe_reads_use_replica(self):
+        self.assertEqual(self.route('get'), 'replica_0')
+        self.assertEqual(self.route('get', self.user), 'replica_0')
+        self.assertEqual(self.route('post', self.user), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        self.route('post', self.user)
+        self.assertEqual(self.route('get', self.user), 'default')
+        self.assertEqual(self.route('get', get_user_model()(id=uuid.uuid4())), 'replica_0')
+
+        caches['shared'].clear()
+        self.assertEqual(self.route('get', self.user), 'replica_0')
+
+    def test_pin_is_seen_by_another_process(self):
+        # worker อื่นอ่าน pin จาก cache เดียวกันด้วย process ของตัวเอง
+        self.route('post', self.user)
+        shared = settings.CACHES['shared']
+        script = (
+            'import sys\n'
+            'from django.conf import settings\n'
+            f'settings.configure(CACHES={{"default": {{"BACKEND": {shared["BACKEND"]!r}, "LOCATION": {shared["LOCATION"]!r}}}}})\n'
+            'from django.core.cache import cache\n'
+            f'sys.exit(0 if cache.get({"db:primary-pin:" + str(self.user.pk)!r}) else 1)\n'
+        )
+        self.assertEqual(subprocess.run([sys.executable, '-c', script]).returncode, 0)
+
+    def test_local_memory_pin_cache_is_rejected(self):
+        with override_settings(DB_REPLICA_PIN_CACHE='default'):
+            with self.assertRaises(ImproperlyConfigured):
+                ReplicaMiddleware(lambda request: HttpResponse())
+
+    def test_lagging_replica_is_skipped(self):
+        record_replica_lag('replica_0', 30.0)
+        self.assertEqual(self.route('get'), 'default')
+        record_replica_lag('replica_0', None)
+        self.assertEqual(self.route('get'), 'default')
+
+    def test_outside_request_uses_primary(self):
+        self.route('get')
+        self.assertEqual(ReplicaRouter().db_for_read(WalletAccount), 'default')
+        self.assertEqual(ReplicaRouter().db_for_write(WalletAccount), 'default')
+
+    def test_lazy_user_is_not_evaluated(self):
+        def load_user():
+            raise AssertionError('router ต้องไม่โหลด user เอง')
+
+        def view(request):
+            request.user = SimpleLazyObject(load_user)
+            return HttpResponse(ReplicaRouter().db_for_read(WalletAccount))
+
+        response = ReplicaMiddleware(view)(self.factory.get('/'))
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(response.content, b'replica_0')
+
+
+# เปิดด้วย DB_PREPARED_STATEMENTS=True
+@skipUnless(settings.DB_PREPARED_STATEMENTS, 'ต้องเปิด DB_PREPARED_STATEMENTS')
+class PreparedStatementTests(TestCase):
+    def setUp(self):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        self.merchant = Merchant.objects.create(name='Prepared Shop', tax_id='PREP-0001', status=active_status)
+        self.user = get_user_model().objects.create_user(username='prepared', email='prepared@example.com', password=None)
+        WalletAccount.objects.filter(user=self.user).update(credit_limit=Decimal('5000.00'))
+
+        # prepare ตั้งแต่ครั้งแรก (ค่าจริงมาจาก DB_PREPARE_THRESHOLD)
+        raw = connection.connection
+        self.addCleanup(setattr, raw, 'prepare_threshold', raw.prepare_threshold)
+        raw.prepare_threshold = 0
+        self.existing = set(self.prepared_statements())
+
+    def prepared_statements(self) -> list[str]:
+        with connection.cursor() as cursor:
+            # savepoint ของ TestCase มีชื่อใหม่ทุกครั้ง ไม่นับ
+            cursor.execute(
+                "SELECT statement FROM pg_prepared_statements "
+                "WHERE statement NOT LIKE '%%pg_prepared_statements%%' AND statement NOT LIKE '%%SAVEPOINT%%'"
+            )
+            return [row[0] for row in cursor.fetchall() if row[0] not in getattr(self, 'existing', ())]
+
+    def pay(self, amount: str) -> WalletTransaction:
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal(amount))
+        return execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=2)
+
+    def test_checkout_and_repayment_are_prepared(self):
+        txn = self.pay('100.00')
+        bill = InstallmentBill.objects.filter(transaction=txn).order_by('due_date').first()
+        execute_bill_repayment(user=self.user, bill_id=bill.id)
+
+        statements = self.prepared_statements()
+        self.assertTrue(any(PaymentRequest._meta.db_table in s and 'RETURNING' in s for s in statements))
+        self.assertTrue(any('balance_due - $1' in s for s in statements))
+        self.assertTrue(any(s.startswith(f'INSERT INTO "{WalletTransaction._meta.db_table}"') for s in statements))
+
+        account = WalletAccount.objects.get(user=self.user)
+        self.assertEqual(account.balance_due, Decimal('50.00'))
+        repayment = WalletTransaction.objects.get(account=account, type_code=WalletTransaction.TxnType.REPAYMENT)
+        self.assertEqual(repayment.balance_due_after, Decimal('50.00'))
+
+    def test_statements_are_reused(self):
+        self.pay('10.00')
+        first = self.prepared_statements()
+        self.pay('20.00')
+        self.pay('30.00')
+        self.assertEqual(self.prepared_statements(), first)
+
+    def test_rollback_leaves_nothing(self):
+        req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal('9000.00'))
+        with self.assertRaises(BNPLServiceError):
+            execute_bnpl_transaction(user=self.user, payment_request_id=req.id, installment_months=2)
+        req.refresh_from_db()
+        self.assertEqual(req.status, PaymentRequest.Status.PENDING)
+        self.assertFalse(WalletTransaction.objects.exists())
+
+
+class FastJSONTests(TestCase):
+    # JaiKorn.renderers ต้องให้ผลเหมือน JSONRenderer / JSONParser ของ DRF
+
+    payload = {
+        'id': uuid.UUID('6f1c1d3e-8a51-4a36-9c4e-3f5a2b1c0d9e'),
+        'amount': '1250.50',
+        'available': Decimal('749.50'),
+        'utc': datetime(2025, 1, 31, 17, 0, 0, 123456, tzinfo=dt_timezone.utc),
+        'local': timezone.localtime(datetime(2025, 1, 31, 17, 0, tzinfo=dt_timezone.utc)),
+        'naive': datetime(2025, 1, 31, 17, 0),
+        'due_date': date(2025, 2, 28),
+        'ttl': timedelta(minutes=15),
+        'title': 'บิลจากร้าน \u2028 "ค้า" \n\t',
+        'label': gettext_lazy('Paid'),
+        'bills': ({'n': 1, 'ok': True, 'none': None, 'ratio': 0.25},),
+        1: 'int key',
+    }
+
+    def test_render_matches_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+
+    def test_render_indent_matches_drf(self):
+        media_type = 'application/json; indent=2'
+        self.assertEqual(
+            FastJSONRenderer().render(self.payload, media_type),
+            JSONRenderer().render(self.payload, media_type)
+        )
+
+    def test_render_big_int_falls_back(self):
+        data = {'big': 2 ** 70}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parse_matches_drf(self):
+        body = '{"installment_months": 3, "amount": "10.00", "ids": ["a", "ข"], "big": 18446744073709551616}'.encode()
+        self.assertEqual(
+            FastJSONParser().parse(io.BytesIO(body)),
+            JSONParser().parse(io.BytesIO(body))
+        )
+
+    def test_parse_error(self):
+        for body in (b'{"amount": ', b'{"amount": NaN}'):
+            with self.assertRaises(ParseError):
+                FastJSONParser().parse(io.BytesIO(body))
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    # (ไม่นับ query ของ authentication เพราะใช้ force_authenticate)
+
+    urlconf = 'wallets.urls'
+    BUDGETS = {
+        'customer-pay-request': 8,
+        'customer-unpaid-bills': 1,
+        'customer-pay-bills-bulk': 6,
+        'customer-pay-bill': 6,
+        'wallet-generic-spend': 5,
+        'customer-credit-summary': 1,
+        'home-list-bills': 1,
+        'list-transactions': 1,
+        'my-transaction-history': 1,
+        # รายการใน DB + รายการ WalletArchive ของบัญชี (ต่อท้ายจาก archive)
+        'wallet-export': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        active_status, _ = MerchantStatus.objects.get_or_create(code='ACTIVE', defaults={'name': 'Active'})
+        cls.merchant = Merchant.objects.create(name='Budget Shop', tax_id='BUDGET-0001', status=active_status)
+        cls.user = get_user_model().objects.create_user(username='budget', email='budget@example.com', password=None)
+        WalletAccount.objects.filter(user=cls.user).update(credit_limit=Decimal('99999999.00'))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        caches[settings.CREDIT_SUMMARY_CACHE].clear()
+
+    def seed(self, rows: int) -> WalletTransaction:
+        account = WalletAccount.objects.get(user=self.user)
+        today = timezone.localdate()
+
+        requests = PaymentRequest.objects.bulk_create(
+            PaymentRequest(
+                merchant=self.merchant, amount=Decimal('10.00'),
+                status=PaymentRequest.Status.PAID, customer=self.user, paid_at=timezone.now()
+            )
+            for _ in range(rows)
+        )
+        txns = WalletTransaction.objects.bulk_create(
+            WalletTransaction(
+                account=account, type_code=WalletTransaction.TxnType.PAYMENT,
+                signed_amount=Decimal('10.00'), balance_due_after=Decimal('0.00'), payment_request=req
+            )
+            for req in requests
+        )
+        # บิลทั้งหมดผูกกับรายการแรก เพื่อให้ bulk repay ด้วย transaction_id ปิดได้ทีเดียว N ใบ
+        InstallmentBill.objects.bulk_create(
+            InstallmentBill(
+                transaction=txns[0], account=account, amount_due=Decimal('10.00'),
+                due_date=today + timedelta(days=i + 1)
+            )
+            for i in range(rows)
+        )
+        WalletAccount.objects.filter(pk=account.pk).update(balance_due=Decimal('10.00') * rows)
+        return txns[0]
+
+    def call(self, name: str, first_txn: WalletTransaction):
+        if name == 'customer-pay-request':
+            req = PaymentRequest.objects.create(merchant=self.merchant, amount=Decimal('120.00'))
+            return lambda: self.client.post(
+                reverse(f'wallets:{name}', args=[req.id]), {'installment_months': 12}, format='json'
+            )
+        if name == 'customer-pay-bill':
+            bill = InstallmentBill.objects.filter(transaction=first_txn).first()
+            return lambda: self.client.post(reverse(f'wallets:{name}', args=[bill.id]))
+        if name == 'customer-pay-bills-bulk':
+            return lambda: self.client.post(
+                reverse(f'wallets:{name}'), {'transaction_id': str(first_txn.id)}, format='json'
+            )
+        if name == 'wallet-generic-spend':
+            return lambda: self.client.post(reverse(f'wallets:{name}'), {'amount': '5.00'}, format='json')
+        if name == 'wallet-export':
+            # query เกิดตอนอ่าน stream
+            return lambda: _consume(self.client.get(reverse(f'wallets:{name}')))
+        return lambda: self.client.get(reverse(f'wallets:{name}'))
+
+    def before_request(self):
+        caches[settings.CREDIT_SUMMARY_CACHE].clear()
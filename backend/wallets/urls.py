@@ -1,8 +1,11 @@
 from django.urls import path
+from JaiKorn.async_views import read_view
 from .views import (
-    CustomerPayView, UnpaidBillListView, RepayBillAPIView,
+    CustomerPayView, UnpaidBillListView, RepayBillAPIView, BulkRepayBillAPIView,
     CreditSummaryView, HomeBillListView, TransactionHistoryView,
-    MyTransactionHistoryView, GenericSpendView
+    MyTransactionHistoryView, GenericSpendView, WalletExportView,
+    AsyncUnpaidBillListView, AsyncCreditSummaryView, AsyncHomeBillListView,
+    AsyncTransactionHistoryView, AsyncMyTransactionHistoryView
 )
 app_name = 'wallets'
 
@@ -16,10 +19,16 @@ urlpatterns = [
 
     path(
         'bills/',
-        UnpaidBillListView.as_view(),
+        read_view(UnpaidBillListView, AsyncUnpaidBillListView),
         name='customer-unpaid-bills'
     ),
 
+    path(
+        'bills/pay/',
+        BulkRepayBillAPIView.as_view(),
+        name='customer-pay-bills-bulk'
+    ),
+
     path(
         'bills/<uuid:pk>/pay/',
         RepayBillAPIView.as_view(),
@@ -34,26 +43,32 @@ urlpatterns = [
 
     path(
         'me/summary/',
-        CreditSummaryView.as_view(),
+        read_view(CreditSummaryView, AsyncCreditSummaryView),
         name='customer-credit-summary'
     ),
 
     path(
         'home/bills/',
-        HomeBillListView.as_view(),
+        read_view(HomeBillListView, AsyncHomeBillListView),
         name='home-list-bills'
     ),
 
     path(
         'me/alltransactions/',
-        TransactionHistoryView.as_view(),
+        read_view(TransactionHistoryView, AsyncTransactionHistoryView),
         name='list-transactions'
     ),
 
     path(
         'me/transactions/',
-        MyTransactionHistoryView.as_view(),
+        read_view(MyTransactionHistoryView, AsyncMyTransactionHistoryView),
         name='my-transaction-history'
     ),
 
+    path(
+        'me/export/',
+        WalletExportView.as_view(),
+        name='wallet-export'
+    ),
+
 ]
\ No newline at end of file
@@ -4,10 +4,21 @@ from rest_framework.exceptions import ValidationError
 from rest_framework import status, generics, permissions
 from rest_framework.permissions import IsAuthenticated
 from django.db import transaction
-from .serializers import CustomerPaySerializer, InstallmentBillSerializer, CreditDataSerializer, HomeBillSerializer, TransactionHistorySerializer, WalletTransactionSerializer, GenericSpendSerializer
-from .services import execute_bnpl_transaction, BNPLServiceError, execute_bill_repayment
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from .serializers import CustomerPaySerializer, InstallmentBillSerializer, CreditDataSerializer, HomeBillSerializer, TransactionHistorySerializer, WalletTransactionSerializer, GenericSpendSerializer, BulkRepaySerializer, WalletExportQuerySerializer
+from .services import execute_bnpl_transaction, BNPLServiceError, execute_bill_repayment, execute_bulk_bill_repayment
+from .idempotency import idempotent
+from .pagination import KeysetPagination
+from .cache import get_credit_summary, fill_credit_summary, aget_credit_summary, afill_credit_summary
+from .archive import archived_history_rows, has_archive_subquery
+from .exports import CONTENT_TYPES, export_stream
+from .fastpath import (
+    HOME_BILL_COLUMNS, TRANSACTION_HISTORY_COLUMNS, home_bill_rows, my_transaction_rows, transaction_history_rows
+)
 from .models import PaymentRequest, InstallmentBill, WalletAccount, WalletTransaction
 from django.db.models import Q
+from JaiKorn.async_views import AsyncAPIView
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +27,7 @@ class CustomerPayView(generics.GenericAPIView):
     serializer_class = CustomerPaySerializer
     queryset = PaymentRequest.objects.all()
 
+    @idempotent
     def post(self, request, pk, *args, **kwargs):
 
         payment_request = self.get_object()
@@ -66,6 +78,7 @@ class RepayBillAPIView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     queryset = InstallmentBill.objects.all()
 
+    @idempotent
     def post(self, request, pk, *args, **kwargs):
         try:
             paid_bill = execute_bill_repayment(
@@ -89,6 +102,43 @@ class RepayBillAPIView(generics.GenericAPIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BulkRepayBillAPIView(generics.GenericAPIView):
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = BulkRepaySerializer
+
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            repayment_txn, paid_bill_ids = execute_bulk_bill_repayment(
+                user=request.user,
+                **serializer.validated_data
+            )
+            return Response(
+                {
+                    "message": f"ชำระบิล {len(paid_bill_ids)} รายการสำเร็จแล้ว",
+                    "transaction_id": repayment_txn.id,
+                    "total_paid": -repayment_txn.signed_amount,
+                    "paid_bill_ids": paid_bill_ids,
+                },
+                status=status.HTTP_200_OK
+            )
+
+        except BNPLServiceError as e:
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"Unexpected error in BulkRepayBillAPIView: {e}", exc_info=True)
+            return Response(
+                {"error": "ระบบขัดข้อง กรุณาลองใหม่อีกครั้ง"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
 class CreditSummaryView(generics.RetrieveAPIView):
 
     queryset = WalletAccount.objects.all()
@@ -98,6 +148,13 @@ class CreditSummaryView(generics.RetrieveAPIView):
     def get_object(self):
         return self.get_queryset().get(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        data, key = get_credit_summary(request.user.pk)
+        if data is None:
+            data = self.get_serializer(self.get_object()).data
+            fill_credit_summary(key, dict(data))
+        return Response(data)
+
 class HomeBillListView(generics.ListAPIView):
 
     serializer_class = HomeBillSerializer
@@ -111,10 +168,16 @@ class HomeBillListView(generics.ListAPIView):
             'transaction__payment_request__merchant'
         ).order_by('due_date')
 
+    def list(self, request, *args, **kwargs):
+        # ไม่ผ่าน HomeBillSerializer (output เหมือนกัน ดู wallets.fastpath)
+        rows = self.filter_queryset(self.get_queryset()).values(*HOME_BILL_COLUMNS)
+        return Response(home_bill_rows(rows))
+
 class TransactionHistoryView(generics.ListAPIView):
 
     serializer_class = TransactionHistorySerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
 
@@ -124,10 +187,22 @@ class TransactionHistoryView(generics.ListAPIView):
             'payment_request__merchant'
         ).order_by('-created_at')
 
+    def list(self, request, *args, **kwargs):
+        # ไม่ผ่าน TransactionHistorySerializer (output เหมือนกัน ดู wallets.fastpath)
+        rows = self.filter_queryset(self.get_queryset()).values(
+            *TRANSACTION_HISTORY_COLUMNS, archived=has_archive_subquery(user_id=request.user.pk)
+        )
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(transaction_history_rows(page))
+
+    def read_archive(self, *, before, limit):
+        return archived_history_rows(user_id=self.request.user.pk, before=before, limit=limit)
+
 class MyTransactionHistoryView(generics.ListAPIView):
 
     serializer_class = WalletTransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
 
@@ -139,26 +214,54 @@ class MyTransactionHistoryView(generics.ListAPIView):
             account__user=user
         ).order_by('-created_at')
 
-class MyTransactionHistoryView(generics.ListAPIView):
+    def list(self, request, *args, **kwargs):
+        # ไม่ผ่าน WalletTransactionSerializer (output เหมือนกัน ดู wallets.fastpath) อ่านต่อจาก archive เหมือน TransactionHistoryView
+        rows = self.filter_queryset(self.get_queryset()).values(
+            *TRANSACTION_HISTORY_COLUMNS, archived=has_archive_subquery(user_id=request.user.pk)
+        )
+        page = self.paginate_queryset(rows)
+        return self.get_paginated_response(my_transaction_rows(page))
 
-    serializer_class = WalletTransactionSerializer
+    def read_archive(self, *, before, limit):
+        return archived_history_rows(user_id=self.request.user.pk, before=before, limit=limit)
+
+class WalletExportView(generics.GenericAPIView):
+
+    serializer_class = WalletExportQuerySerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
 
-        user = self.request.user
+        user_id = params.get('user', request.user.pk)
+        if user_id != request.user.pk and not request.user.is_staff:
+            return Response(
+                {"error": "ไม่มีสิทธิ์ export ประวัติของผู้ใช้อื่น"},
+                status=status.HTTP_403_FORBIDDEN
+            )
 
-        return WalletTransaction.objects.select_related(
-            'payment_request__merchant'
-        ).filter(
-            account__user=user
-        ).order_by('-created_at')
+        response = StreamingHttpResponse(
+            export_stream(
+                kind=params['kind'],
+                output=params['output'],
+                user_id=user_id,
+                date_from=params.get('date_from'),
+                date_to=params.get('date_to'),
+            ),
+            content_type=CONTENT_TYPES[params['output']]
+        )
+        filename = f"jaikorn-{params['kind']}-{timezone.localdate():%Y%m%d}.{params['output']}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
 class GenericSpendView(generics.GenericAPIView):
 
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = GenericSpendSerializer
 
+    @idempotent
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -193,3 +296,46 @@ class GenericSpendView(generics.GenericAPIView):
             return Response({'detail': 'Wallet account not found.'}, status=status.HTTP_404_NOT_FOUND)
         except ValidationError as e:
             return Response({'detail': e.detail[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# view อ่านอย่างเดียวแบบ async (ASYNC_READ_VIEWS) response เหมือน view sync ด้านบนทุก byte
+
+class AsyncUnpaidBillListView(AsyncAPIView, UnpaidBillListView):
+
+    async def get(self, request, *args, **kwargs):
+        bills = [bill async for bill in self.filter_queryset(self.get_queryset())]
+        return Response(self.get_serializer(bills, many=True).data)
+
+class AsyncCreditSummaryView(AsyncAPIView, CreditSummaryView):
+
+    async def get(self, request, *args, **kwargs):
+        data, key = await aget_credit_summary(request.user.pk)
+        if data is None:
+            account = await self.get_queryset().aget(user=request.user)
+            data = self.get_serializer(account).data
+            await afill_credit_summary(key, dict(data))
+        return Response(data)
+
+class AsyncHomeBillListView(AsyncAPIView, HomeBillListView):
+
+    async def get(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values(*HOME_BILL_COLUMNS)
+        return Response(home_bill_rows([row async for row in rows]))
+
+class AsyncTransactionHistoryView(AsyncAPIView, TransactionHistoryView):
+
+    async def get(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values(
+            *TRANSACTION_HISTORY_COLUMNS, archived=has_archive_subquery(user_id=request.user.pk)
+        )
+        page = await self.paginator.apaginate_queryset(rows, request, view=self)
+        return self.get_paginated_response(transaction_history_rows(page))
+
+class AsyncMyTransactionHistoryView(AsyncAPIView, MyTransactionHistoryView):
+
+    async def get(self, request, *args, **kwargs):
+        rows = self.filter_queryset(self.get_queryset()).values(
+            *TRANSACTION_HISTORY_COLUMNS, archived=has_archive_subquery(user_id=request.user.pk)
+        )
+        page = await self.paginator.apaginate_queryset(rows, request, view=self)
+        return self.get_paginated_response(my_transaction_rows(page))